@@ -1,27 +1,97 @@
-from googlemaps import client
+import argparse
+import os
+import sys
 
-from google_maps_services import GMapsServices
-#from path_finder import PathFinder
-from lookup import Lookup
-from keys import API_KEY, NEW_API_KEY
 
-# g_client = client.Client(key=API_KEY)
+def run_data_pipeline():
+    """
+    The offline data pipeline. Uncomment the steps to run. Needs keys.py with the Google API keys.
+    """
+    from googlemaps import client
 
-# g_maps_services = GMapsServices(client=g_client)
+    from dataset import write_dataset_manifest
+    from google_maps_services import GMapsServices
+    from itinerary_library import ItineraryLibrary
+    from park_clusters import build_park_clusters
+    from photo_variants import build_photo_variants
+    from region_shards import build_region_shards
+    from keys import API_KEY, NEW_API_KEY
 
-# g_maps_services.get_nps_raw_park_data()
-# g_maps_services.fill_missing_park_data()
-# top = g_maps_services.rank_places_by_reviews()
-# print(top)
-# g_maps_services.compute_distances_for_cities()
-# g_maps_services.generate_relative_ratings()
-# g_maps_services.rank_places_by_blended_rating()
-# g_maps_services.suggest_next_parks()
-# g_maps_services.park_ids_to_parks_within_distance()
-# g_maps_services.choose_one_state()
+    # g_client = client.Client(key=API_KEY)
 
+    # g_maps_services = GMapsServices(client=g_client)
 
-# p = PathFinder()
-# p.generate_path(starting_city="San Francisco, CA", max_distance=5000)
-# my_path = p.return_path()
-# print(my_path)
+    # g_maps_services.get_nps_raw_park_data()
+    # Or, to only redo the parks that changed since the last run, including their distances:
+    # g_maps_services.refresh_nps_park_data()
+    # g_maps_services.fill_missing_park_data()
+    # top = g_maps_services.rank_places_by_reviews()
+    # print(top)
+    # g_maps_services.compute_distances_for_cities()
+    # g_maps_services.generate_relative_ratings()
+    # g_maps_services.rank_places_by_blended_rating()
+    # g_maps_services.suggest_next_parks()
+    # g_maps_services.park_ids_to_parks_within_distance()
+    # g_maps_services.choose_one_state()
+    # g_maps_services.split_park_info()
+    # After downloading the photos (get_nps_raw_park_data(save_photos=True)):
+    # build_photo_variants()
+    # Whenever the park graph changes (compute_distances() or refresh_nps_park_data()):
+    # build_park_clusters()
+    # build_region_shards()
+    # ItineraryLibrary().build()
+    # Last, so that serving workers only swap in the new dataset once all of it is written:
+    # write_dataset_manifest()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Road trip generator tools.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    trips_parser = subparsers.add_parser(
+        "generate-trips", help="Generate road trips from a job file."
+    )
+    trips_parser.add_argument(
+        "jobs",
+        help="A JSON Lines file, with start_city, max_distance, count and seed on each line.",
+    )
+    trips_parser.add_argument(
+        "-o", "--output", help="The JSON Lines file to write. Defaults to stdout."
+    )
+    trips_parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=os.cpu_count(),
+        help="How many worker processes to use.",
+    )
+    trips_parser.add_argument(
+        "--data-dir", default="data", help="The dataset directory."
+    )
+
+    subparsers.add_parser(
+        "pipeline", help="Run the offline data pipeline steps enabled in __main__.py."
+    )
+
+    args = parser.parse_args(argv)
+    if args.command == "pipeline":
+        run_data_pipeline()
+    elif args.command == "generate-trips":
+        from batch_trips import generate_trips, read_jobs
+
+        jobs = read_jobs(file_name=args.jobs)
+        output = sys.stdout if args.output is None else open(args.output, "w")
+        try:
+            generate_trips(
+                jobs=jobs,
+                output=output,
+                processes=args.processes,
+                data_dir=args.data_dir,
+            )
+        finally:
+            if output is not sys.stdout:
+                output.close()
+
+
+if __name__ == "__main__":
+    main()
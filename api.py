@@ -1,43 +1,735 @@
 # Flask API.
-from flask import Flask, request
+import hashlib
+import json
+import math
+import os
+import re
+
+from flask import (
+    Flask,
+    Response,
+    abort,
+    g,
+    request,
+    send_from_directory,
+    stream_with_context,
+)
 from flask_cors import CORS, cross_origin
 
-from path_finder import PathFinder
+from dataset import DatasetHandle
+from itinerary_library import ItineraryLibrary
+from name_index import MAX_ENTRIES_PER_NODE
+from path_finder import DailyLimit, PathFinder
+from photo_variants import PHOTO_VARIANTS_DIR, VARIANT_EXTENSION
+from region_shards import ShardRouter
+from scoring import DEFAULT_SCORING, Scoring
+from search_cache import pareto_cache
+from singleflight import SingleFlight
 
 
 app = Flask(__name__)
 cors = CORS(app)
 app.config["CORS_HEADERS"] = "Content-Type"
+itinerary_library = ItineraryLibrary()
+shard_router = ShardRouter()
+# Optional. The name of the region shard this worker serves. A region worker loads only its shard, and serves
+# the trips that the shard covers. Other workers serve the full dataset, and name the smallest shard that
+# covers each trip in the X-Region-Shard header, for a proxy to route such trips to the region workers.
+SERVED_SHARD = os.environ.get("DATASET_SHARD")
+# Load the dataset once per worker, rather than on every request. New versions of the artifact are
+# loaded in the background, and the memoized search results for the old version are dropped.
+dataset = DatasetHandle(
+    data_dir="data" if SERVED_SHARD is None else shard_router.data_dir(SERVED_SHARD),
+    on_swap=lambda new_dataset: pareto_cache.clear(),
+)
+# Identical deterministic requests that arrive together share one search and its serialized response.
+in_flight_requests = SingleFlight()
+# Photo variants are named by a hash of their contents, so they can be cached for a year.
+PHOTO_CACHE_CONTROL = "public, max-age=31536000, immutable"
+PHOTO_NAME = re.compile(r"[0-9a-f]{20}" + re.escape(VARIANT_EXTENSION))
+# Deterministic road trips only change with the dataset and itinerary library versions, which are part of
+# their ETag, so caches may keep them for a while and then revalidate.
+ITINERARY_CACHE_CONTROL = "public, max-age=3600"
+
+
+def current_lookup():
+    """
+    Returns the Lookup of the current dataset version, and remembers the version for this request.
+    Calling it again in the same request returns the same version, even if a new one was swapped in.
+    :return: A Lookup.
+    """
+    if "dataset" not in g:
+        g.dataset = dataset.current()
+    return g.dataset.lookup
+
+
+@app.after_request
+def add_dataset_headers(response):
+    """
+    Report the dataset version used by the request.
+    """
+    if "dataset" in g:
+        response.headers["X-Dataset-Version"] = g.dataset.version
+        if SERVED_SHARD is not None:
+            response.headers["X-Dataset-Shard"] = SERVED_SHARD
+    if g.get("region_shard") is not None:
+        response.headers["X-Region-Shard"] = g.region_shard
+    return response
+
+
+def route_lookup(starting_city, max_distance, end_city):
+    """
+    Returns the Lookup to search a request in. A region worker only serves the trips its shard covers. Other
+    workers search the full dataset, and remember the smallest region shard that covers the trip, if any.
+    :param starting_city: The resolved starting city.
+    :param max_distance: The max driving distance (in kilometers), or None.
+    :param end_city: The resolved end city, or None.
+    :return: A tuple of (Lookup, error message). The error message is None if this worker serves the trip.
+    """
+    lookup = current_lookup()
+    if SERVED_SHARD is None:
+        g.region_shard = shard_router.route(
+            lookup=lookup,
+            starting_city=starting_city,
+            max_distance=max_distance,
+            end_city=end_city,
+        )
+        return lookup, None
+    if not shard_router.covers(
+        name=SERVED_SHARD,
+        lookup=lookup,
+        starting_city=starting_city,
+        max_distance=max_distance,
+        end_city=end_city,
+    ):
+        return None, f"This server only serves trips within the {SERVED_SHARD} region."
+    return lookup, None
+
+
+def resolve_cities(*city_names):
+    """
+    Resolve possibly misspelled city names from a request to the city names in the dataset.
+    :param city_names: City names. None is passed through, for optional cities.
+    :return: A tuple of (resolved city names, error message). The error message is None if every city
+                was resolved.
+    """
+    resolved_names = []
+    for city_name in city_names:
+        resolved_name = None
+        if city_name is not None:
+            resolved_name = current_lookup().resolve_city_name(city_name=city_name)
+            if resolved_name is None:
+                return None, f"Invalid city name {city_name} provided."
+        resolved_names.append(resolved_name)
+    return resolved_names, None
+
+
+def read_scoring():
+    """
+    Read the optional scoring parameters of a request. Missing parameters keep their default.
+    :return: A tuple of (Scoring, or None if the request uses the default scoring, error message). The error
+                message is None if the parameters are valid.
+    """
+    weights = {}
+    for field, default in DEFAULT_SCORING._asdict().items():
+        value = request.args.get(field)
+        if value is None:
+            weights[field] = default
+            continue
+        try:
+            weights[field] = float(value)
+        except ValueError:
+            return None, f"{field} must be a number."
+        if not math.isfinite(weights[field]):
+            return None, f"{field} must be a number."
+    scoring = Scoring(**weights)
+    return (None if scoring == DEFAULT_SCORING else scoring), None
+
+
+def read_daily_limit():
+    """
+    Read the optional daily driving cap of a request.
+    :return: A tuple of (DailyLimit, or None if the request has no daily cap, error message). The error
+                message is None if the parameters are valid.
+    """
+    max_daily_km = request.args.get("max_daily_km", type=float)
+    days = request.args.get("days", type=int)
+    if max_daily_km is None:
+        if days is not None:
+            return None, "days takes max_daily_km."
+        return None, None
+    if max_daily_km <= 0 or (days is not None and days < 1):
+        return None, "max_daily_km and days must be positive."
+    return DailyLimit(max_daily_km=max_daily_km, days=days), None
+
+
+def read_trip_limits(max_distance, max_hours, mode="random"):
+    """
+    Read the optional must-visit parks and daily driving cap of a request, and check that they can be
+    combined with its other limits. If the trip is limited to a number of days, max_distance defaults to
+    days * max_daily_km.
+    :param max_distance: The max driving distance of the request (in kilometers), or None.
+    :param max_hours: The max drive duration of the request (in hours), or None.
+    :param mode: The mode of the request, as in /api.
+    :return: A tuple of (list of must-visit park names, DailyLimit or None, max_distance, error message).
+                The error message is None if the parameters are valid.
+    """
+    must_visit = request.args.getlist("must_visit")
+    daily_limit, error_msg = read_daily_limit()
+    if error_msg is not None:
+        return None, None, None, error_msg
+    if daily_limit is not None and (mode == "pareto" or must_visit):
+        return (
+            None,
+            None,
+            None,
+            "max_daily_km is not supported with must_visit or pareto mode.",
+        )
+    if (
+        max_distance is None
+        and daily_limit is not None
+        and daily_limit.days is not None
+    ):
+        max_distance = daily_limit.days * daily_limit.max_daily_km
+    if must_visit and (
+        mode == "pareto" or max_distance is None or max_hours is not None
+    ):
+        return (
+            None,
+            None,
+            None,
+            "must_visit takes max_distance, and not max_hours or pareto mode.",
+        )
+    return must_visit, daily_limit, max_distance, None
+
+
+def resolve_parks(park_names):
+    """
+    Resolve possibly misspelled park names from a request to the parks in the dataset.
+    :param park_names: A list of park names.
+    :return: A tuple of (sorted tuple of park place_ids, error message). The error message is None if every
+                park was resolved.
+    """
+    park_ids = set()
+    for park_name in park_names:
+        park_id = current_lookup().resolve_park_name(park_name=park_name)
+        if park_id is None:
+            return None, f"Invalid park name {park_name} provided."
+        park_ids.add(park_id)
+    return tuple(sorted(park_ids)), None
+
+
+def dataset_versions():
+    """
+    Returns what a deterministic road trip depends on besides its parameters: the version of the full
+    dataset, and for a region worker, the name and version of the shard it serves. Both are read from the
+    manifests and the dataset already loaded, so nothing is routed or loaded.
+    :return: A tuple of (full dataset version, shard name or None, shard version or None).
+    """
+    lookup = current_lookup()
+    if SERVED_SHARD is None:
+        return lookup.version, None, None
+    return shard_router.version(), SERVED_SHARD, lookup.version
+
+
+def itinerary_etag(key):
+    """
+    Returns the strong ETag of a deterministic road trip.
+    :param key: The normalized request parameters, starting with the dataset and library versions.
+    :return: The ETag, unquoted.
+    """
+    return hashlib.sha1(json.dumps(key).encode()).hexdigest()
+
+
+def find_path(
+    lookup,
+    starting_city,
+    max_distance,
+    end_city,
+    mode,
+    seed,
+    scoring,
+    max_hours,
+    must_visit=(),
+    daily_limit=None,
+):
+    """
+    Generate the road trip for a request to /api.
+    :param lookup: The Lookup of the dataset version used by the request.
+    :param starting_city: The resolved starting city.
+    :param max_distance: The max driving distance (in kilometers), or None.
+    :param end_city: The resolved end city, or None.
+    :param mode: Either 'random' or 'pareto'.
+    :param seed: The random seed, or None.
+    :param scoring: A Scoring, or None for the default scoring.
+    :param max_hours: The max drive duration (in hours), or None.
+    :param must_visit: place_ids of the parks the road trip must visit, if any.
+    :param daily_limit: A DailyLimit, or None.
+    :return: The response dictionary, as described in generate_path.
+    """
+    p = PathFinder(lookup=lookup, seed=seed, scoring=scoring)
+    if must_visit:
+        try:
+            p.generate_must_visit_path(
+                starting_city=starting_city,
+                must_visit=must_visit,
+                max_distance=max_distance,
+                end_city=end_city,
+            )
+        except ValueError as e:
+            return {"result": str(e)}
+        return p.return_path()
+    if mode == "pareto":
+        p.generate_pareto_paths(
+            starting_city=starting_city, max_distance=max_distance, end_city=end_city
+        )
+        return p.return_pareto_paths()
+    if (
+        end_city is None
+        and scoring is None
+        and max_hours is None
+        and daily_limit is None
+    ):
+        # Popular (city, distance) buckets are served from the precomputed library.
+        stored_path = itinerary_library.pick(
+            city_id=p.lookup.lookup_city_id(city_name=starting_city),
+            max_distance=max_distance,
+            rng=p.random,
+            lookup=p.lookup,
+        )
+        if stored_path is not None:
+            p.path, p.distances = stored_path
+            return p.return_path()
+    p.generate_path(
+        starting_city=starting_city,
+        max_distance=max_distance,
+        end_city=end_city,
+        max_hours=max_hours,
+        daily_limit=daily_limit,
+    )
+    return p.return_path()
 
 
 @app.route("/api")
 @cross_origin()
 def generate_path():
     """
-    The request to generate a path.
+    The request to generate a path. start_city and end_city may be misspelled, they are resolved to the
+    closest city in the dataset.
+    Optional scoring parameters change how the next parks are ranked: a park's value is
+    rating_weight * rating + popularity_weight * popularity (0-1, by number of reviews) + designation_bonus
+    (for national parks), and parks are ranked by value / distance ** distance_exponent. Parks rated below
+    min_rating are skipped. The defaults (1, 4, 1, 1, none) give the standard blended_rating / distance.
+    must_visit may be given several times, with the names of parks the trip must visit (max_distance is
+    required, and max_hours and mode=pareto are not supported). Waypoint sets that can't fit in max_distance
+    are rejected up front.
+    max_daily_km caps the distance driven each day, and days optionally caps the number of days (if given
+    without max_distance, max_distance is days * max_daily_km). Nights are spent in the nearest city of a park:
+    a hop that does not fit in the rest of the day goes by way of the nearest city of the park it starts from,
+    and the search only chooses parks that fit. Each place on the path then has the 'day' it is reached on,
+    and 'overnight' (the city of the night before) if the hop stopped for the night, and the response has
+    'total_days'. Not supported with must_visit or mode=pareto.
+    Region workers (see SERVED_SHARD) only serve the trips that their shard covers. Other workers name the
+    smallest region shard that covers the trip, if any, in the X-Region-Shard header.
+    Requests with a seed, or in pareto mode, always give the same result for the same dataset version, so
+    identical concurrent requests are coalesced into one search. Their responses have an ETag, and a request
+    with a matching If-None-Match gets a 304 without any search.
     :return: A dictionary with (maximum) two fields:
         - 'result': will be 'ok' if a path was found, else an error message.
         - 'path': a list of start_city, parks, and end_city.
-            - each element will have 'name' and 'next_distance' fields.
+        - 'total_hours': the drive duration of the road trip (in hours).
+            - each element will have 'place_id', 'name' and 'next_distance' fields.
                 for the end_city, the next_distance field represents the total distance driven.
             = parks will also have:
                 - 'rating' => the avg. Google Rating.
                 - 'num_reviews' => the total # of google reviews.
                 - 'state' => the state the park is in.
                 - 'photos' => a list of remote urls to the park's photos.
+                - 'photo_variants' => a list with a dict per photo, with the 'thumb' and 'medium' urls of
+                    the variants served by /photos.
+        With mode=pareto, 'path' is replaced by 'paths': a list of trips sorted by total distance, each with
+        'total_distance', 'total_hours', 'total_rating', 'num_parks' and a 'path' as described above.
     """
     starting_city = request.args.get(
         "start_city"
     )  # A string representing the starting city.
 
-    max_distance = float(
-        request.args.get("max_distance")
+    max_distance = request.args.get(
+        "max_distance", type=float
     )  # The maximum driving distance (in kilometers).
 
-    p = PathFinder()
-    p.generate_path(starting_city=starting_city, max_distance=max_distance)
+    max_hours = request.args.get(
+        "max_hours", type=float
+    )  # The maximum drive duration (in hours). Either or both of max_distance and max_hours must be given.
+
+    end_city = request.args.get(
+        "end_city"
+    )  # Optional. A string representing the city to end in.
+
+    mode = request.args.get(
+        "mode", "random"
+    )  # Either 'random' for a single random trip, or 'pareto' for a front of trips.
+
+    seed = request.args.get(
+        "seed", type=int
+    )  # Optional. An integer seed, to make the random trip reproducible.
+
+    # Optional. Custom weights for ranking the parks.
+    scoring, error_msg = read_scoring()
+    if error_msg is not None:
+        return {"result": error_msg}, 400
+
+    # Optional. must_visit (repeatable, the names of parks the road trip must visit), max_daily_km and days.
+    must_visit, daily_limit, max_distance, error_msg = read_trip_limits(
+        max_distance=max_distance, max_hours=max_hours, mode=mode
+    )
+    if error_msg is not None:
+        return {"result": error_msg}
+
+    if starting_city is None:
+        return {"result": "Provide start_city."}
+    if max_distance is None and max_hours is None:
+        return {"result": "Provide max_distance, max_hours, days or a combination."}
+    if mode == "pareto" and (max_distance is None or max_hours is not None):
+        return {"result": "Pareto mode takes max_distance, and not max_hours."}
+
+    city_names, error_msg = resolve_cities(starting_city, end_city)
+    if error_msg is not None:
+        return {"result": error_msg}
+    starting_city, end_city = city_names
+    must_visit, error_msg = resolve_parks(must_visit)
+    if error_msg is not None:
+        return {"result": error_msg}
+
+    if mode != "pareto" and seed is None:
+        # Every unseeded request should get its own random trip.
+        lookup, error_msg = route_lookup(
+            starting_city=starting_city, max_distance=max_distance, end_city=end_city
+        )
+        if error_msg is not None:
+            return {"result": error_msg}
+        return find_path(
+            lookup=lookup,
+            starting_city=starting_city,
+            max_distance=max_distance,
+            end_city=end_city,
+            mode=mode,
+            seed=seed,
+            scoring=scoring,
+            max_hours=max_hours,
+            must_visit=must_visit,
+            daily_limit=daily_limit,
+        )
+    key = (
+        *dataset_versions(),
+        # Seeded trips may be picked from the itinerary library, so a rebuilt library changes them too.
+        itinerary_library.version(),
+        starting_city,
+        max_distance,
+        max_hours,
+        end_city,
+        mode,
+        seed,
+        scoring,
+        must_visit,
+        daily_limit,
+    )
+    etag = itinerary_etag(key)
+    # Revalidated before the trip is routed, let alone searched.
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        lookup, error_msg = route_lookup(
+            starting_city=starting_city, max_distance=max_distance, end_city=end_city
+        )
+        if error_msg is not None:
+            return {"result": error_msg}
+        body, _ = in_flight_requests.do(
+            key,
+            lambda: json.dumps(
+                find_path(
+                    lookup=lookup,
+                    starting_city=starting_city,
+                    max_distance=max_distance,
+                    end_city=end_city,
+                    mode=mode,
+                    seed=seed,
+                    scoring=scoring,
+                    max_hours=max_hours,
+                    must_visit=must_visit,
+                    daily_limit=daily_limit,
+                )
+            ),
+        )
+        response = Response(body, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = ITINERARY_CACHE_CONTROL
+    return response
+
+
+@app.route("/api/replan")
+@cross_origin()
+def replan_path():
+    """
+    Re-plan a road trip after the user rejects one of its parks. The places before the rejected park are kept
+    as they are, and only the rest of the trip is generated again, from the budget that remains.
+    Takes 'path' (the road trip's place_ids, comma separated, as in the 'place_id' fields returned by /api),
+    'index' (the position of the rejected park on the path), optionally 'exclude' (more place_ids of parks
+    to avoid, comma separated), and the max_distance, max_hours, end_city, seed, scoring, must_visit,
+    max_daily_km and days of the whole road trip, as in /api.
+    :return: A dictionary with 'result', 'path' and 'total_hours', as in /api.
+    """
+    path = request.args.get("path", "").split(",")
+    index = request.args.get("index", type=int)
+    excluded_parks = request.args.get("exclude", "").split(",")
+    max_distance = request.args.get("max_distance", type=float)
+    max_hours = request.args.get("max_hours", type=float)
+    end_city = request.args.get("end_city")
+    seed = request.args.get("seed", type=int)
+    scoring, error_msg = read_scoring()
+    if error_msg is not None:
+        return {"result": error_msg}, 400
+    must_visit, daily_limit, max_distance, error_msg = read_trip_limits(
+        max_distance=max_distance, max_hours=max_hours
+    )
+    if error_msg is not None:
+        return {"result": error_msg}
+    if max_distance is None and max_hours is None:
+        return {"result": "Provide max_distance, max_hours, days or a combination."}
+    if index is None:
+        return {"result": "Provide the index of the park to change."}
+
+    city_names, error_msg = resolve_cities(end_city)
+    if error_msg is not None:
+        return {"result": error_msg}
+    (end_city,) = city_names
+    must_visit, error_msg = resolve_parks(must_visit)
+    if error_msg is not None:
+        return {"result": error_msg}
+
+    lookup = current_lookup()
+    # Check the places first, so a path from another dataset is reported as such rather than as a bad index.
+    if not lookup.is_path(path):
+        return {"result": "Invalid path provided."}
+    p = PathFinder(lookup=lookup, seed=seed, scoring=scoring)
+    try:
+        p.replan_path(
+            path=path,
+            index=index,
+            max_distance=max_distance,
+            end_city=end_city,
+            max_hours=max_hours,
+            excluded_parks=[x for x in excluded_parks if x],
+            must_visit=must_visit,
+            daily_limit=daily_limit,
+        )
+    except KeyError:
+        return {"result": "Invalid path provided."}
+    except ValueError as e:
+        return {"result": str(e)}
     return p.return_path()
 
 
+@app.route("/api/stream")
+@cross_origin()
+def stream_path():
+    """
+    The request to generate a path, streamed as newline-delimited JSON as each hop is chosen.
+    Takes the same start_city, max_distance, max_hours, end_city, seed, scoring, must_visit, max_daily_km
+    and days parameters as /api. With must_visit, the parks up to the last must-visit park are searched
+    before the first line is sent.
+    :return: A stream of JSON lines:
+        - one line per place, with 'name', 'distance' and 'hours' (driven to reach it), and
+            'distance_remaining' and 'hours_remaining' (null if there is no such limit), and the 'day' it is
+            reached on (and 'overnight', as in /api) if the trip has a daily driving cap.
+            The first line is the start city and the last place is the end city.
+            parks also have 'rating', 'num_reviews', 'state' and 'photos', as in /api.
+        - a final line with 'result', which will be 'ok' if a path was found, else an error message.
+            If the path was found, it also has 'total_distance' and 'total_hours', and 'total_days' if the
+            trip has a daily driving cap.
+    """
+    starting_city = request.args.get("start_city")
+    max_distance = request.args.get("max_distance", type=float)
+    max_hours = request.args.get("max_hours", type=float)
+    end_city = request.args.get("end_city")
+    seed = request.args.get("seed", type=int)
+    scoring, error_msg = read_scoring()
+    if error_msg is not None:
+        return Response(
+            json.dumps({"result": error_msg}) + "\n",
+            status=400,
+            mimetype="application/x-ndjson",
+        )
+    must_visit, daily_limit, max_distance, error_msg = read_trip_limits(
+        max_distance=max_distance, max_hours=max_hours
+    )
+    if error_msg is not None:
+        return Response(
+            json.dumps({"result": error_msg}) + "\n", mimetype="application/x-ndjson"
+        )
+    if starting_city is None:
+        return Response(
+            json.dumps({"result": "Provide start_city."}) + "\n",
+            mimetype="application/x-ndjson",
+        )
+    if max_distance is None and max_hours is None:
+        return Response(
+            json.dumps(
+                {"result": "Provide max_distance, max_hours, days or a combination."}
+            )
+            + "\n",
+            mimetype="application/x-ndjson",
+        )
+
+    city_names, error_msg = resolve_cities(starting_city, end_city)
+    if error_msg is not None:
+        return Response(
+            json.dumps({"result": error_msg}) + "\n", mimetype="application/x-ndjson"
+        )
+    starting_city, end_city = city_names
+    must_visit, error_msg = resolve_parks(must_visit)
+    if error_msg is not None:
+        return Response(
+            json.dumps({"result": error_msg}) + "\n", mimetype="application/x-ndjson"
+        )
+
+    lookup, error_msg = route_lookup(
+        starting_city=starting_city, max_distance=max_distance, end_city=end_city
+    )
+    if error_msg is not None:
+        return Response(
+            json.dumps({"result": error_msg}) + "\n", mimetype="application/x-ndjson"
+        )
+    p = PathFinder(lookup=lookup, seed=seed, scoring=scoring)
+    kept_parks = ()
+    if must_visit:
+        try:
+            kept_parks = p.plan_must_visit_parks(
+                starting_city=starting_city,
+                must_visit=must_visit,
+                max_distance=max_distance,
+                end_city=end_city,
+            )
+        except ValueError as e:
+            return Response(
+                json.dumps({"result": str(e)}) + "\n", mimetype="application/x-ndjson"
+            )
+        if kept_parks is None:
+            return Response(
+                json.dumps({"result": p.error_msg}) + "\n",
+                mimetype="application/x-ndjson",
+            )
+
+    def generate():
+        total_hours = 0
+        for (
+            place_id,
+            distance,
+            distance_remaining,
+            is_city,
+            hours,
+            hours_remaining,
+        ) in p.iter_path(
+            starting_city=starting_city,
+            max_distance=max_distance,
+            end_city=end_city,
+            max_hours=max_hours,
+            kept_parks=kept_parks,
+            daily_limit=daily_limit,
+        ):
+            if is_city:
+                hop = {"name": p.lookup.lookup_city_name(place_id=place_id)}
+            else:
+                hop = p.describe_park(place_id=place_id)
+            hop["distance"] = distance
+            hop["hours"] = hours
+            # Infinity is not valid JSON, so a missing limit is reported as null.
+            hop["distance_remaining"] = (
+                None if max_distance is None else distance_remaining
+            )
+            hop["hours_remaining"] = None if max_hours is None else hours_remaining
+            if p.days:
+                hop["day"] = p.days[-1]
+                if p.overnight_stops[-1] is not None:
+                    hop["overnight"] = p.lookup.lookup_city_name(
+                        place_id=p.overnight_stops[-1]
+                    )
+            total_hours += hours
+            yield json.dumps(hop) + "\n"
+        if not p.path:
+            result = {
+                "result": "No path was possible for the provided starting city and distance."
+            }
+        else:
+            result = {
+                "result": "ok",
+                "total_distance": sum(p.distances),
+                "total_hours": total_hours,
+            }
+            if p.days:
+                result["total_days"] = p.days[-1]
+        yield json.dumps(result) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/photos/<name>")
+@cross_origin()
+def photo(name):
+    """
+    Serve a rendered photo variant, as referenced by 'photo_variants' in the road trips. The file is handed to
+    the server's file wrapper, which uses sendfile under gunicorn.
+    :param name: The variant's file name.
+    :return: The image.
+    """
+    if not PHOTO_NAME.fullmatch(name):
+        abort(404)
+    response = send_from_directory(os.path.abspath(PHOTO_VARIANTS_DIR), name)
+    response.headers["Cache-Control"] = PHOTO_CACHE_CONTROL
+    return response
+
+
+@app.route("/autocomplete")
+@cross_origin()
+def autocomplete():
+    """
+    Suggest city and park names that have a word starting with the typed text.
+    Query parameters are 'q' (the text typed so far), and optionally 'limit' (at most 20) and 'type'
+    ('city' or 'park').
+    :return: A dictionary with 'result', and 'suggestions': a list of dicts with 'name' and 'type'.
+    """
+    prefix = request.args.get("q", "")
+    limit = request.args.get("limit", "10")
+    kind = request.args.get("type")
+    if not limit.isdigit() or int(limit) < 1:
+        return {"result": "limit must be a positive integer."}
+    limit = min(int(limit), MAX_ENTRIES_PER_NODE)
+    suggestions = current_lookup().name_index.autocomplete(
+        prefix=prefix, limit=limit, kind=kind
+    )
+    return {
+        "result": "ok",
+        "suggestions": [
+            {"name": name, "type": name_kind} for name, name_kind in suggestions
+        ],
+    }
+
+
+@app.route("/metrics")
+@cross_origin()
+def metrics():
+    """
+    Report the state of this worker's dataset and shared caches.
+    :return: A dictionary with the dataset version and load time, the usage of the Pareto search cache,
+                how many /api requests were coalesced, and the region shards.
+    """
+    return {
+        "dataset": dataset.stats(),
+        "pareto_cache": pareto_cache.stats(),
+        "in_flight_requests": in_flight_requests.stats(),
+        "shards": shard_router.stats(),
+    }
+
+
 # if __name__ == "__main__":
 #     app.run(debug=True, port=8080)
@@ -0,0 +1,172 @@
+# Generate large numbers of road trips from a job file, across a pool of processes.
+# The walk arrays are put in shared memory once, and every worker attaches to them, rather than each
+# worker loading the dataset or having the arrays pickled to it.
+import json
+import sys
+import time
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from batch_walks import BatchWalker, pack_walk_arrays
+from lookup import Lookup
+
+# Jobs are split into chunks of this many trips, each with its own seed derived from the job's seed.
+# The output depends only on the job file and this constant, not on the number of processes.
+CHUNK_SIZE = 1000
+
+# Set in each worker process by _init_worker.
+_walker = None
+_shared_blocks = []
+
+
+def read_jobs(file_name):
+    """
+    Read a job file. Each line is a JSON object with:
+        - 'start_city': the name of the starting city.
+        - 'max_distance': the max driving distance (in km).
+        - 'count': how many road trips to generate.
+        - 'seed': optional, the random seed. Defaults to the line number.
+        - 'end_city': optional, the name of the city to end in.
+    :param file_name: The path to the JSON Lines job file.
+    :return: A list of job dictionaries.
+    """
+    jobs = []
+    with open(file_name) as f:
+        for line_number, line in enumerate(f):
+            if not line.strip():
+                continue
+            job = json.loads(line)
+            job.setdefault("seed", line_number)
+            job.setdefault("end_city", None)
+            jobs.append(job)
+    return jobs
+
+
+def share_arrays(arrays):
+    """
+    Copy numpy arrays into shared memory.
+    :param arrays: A dict of name to numpy array.
+    :return: A tuple of (the SharedMemory blocks, which the caller must close and unlink, and a dict of
+                name to (block name, shape, dtype) to attach to them with attach_arrays).
+    """
+    blocks = []
+    specs = {}
+    for name, array in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        specs[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, specs
+
+
+def attach_arrays(specs):
+    """
+    Attach to arrays in shared memory, without copying them.
+    :param specs: The specs returned by share_arrays.
+    :return: A tuple of (the SharedMemory blocks, which must be kept open while the arrays are used, and a
+                dict of name to numpy array).
+    """
+    blocks = []
+    arrays = {}
+    for name, (block_name, shape, dtype) in specs.items():
+        # Workers share the resource tracker of the process that created the block, which unlinks it.
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+    return blocks, arrays
+
+
+def _init_worker(specs, names):
+    global _walker, _shared_blocks
+    _shared_blocks, arrays = attach_arrays(specs)
+    _walker = BatchWalker(arrays=arrays, names=names)
+
+
+def _run_chunk(task):
+    """
+    Generate one chunk of a job's road trips in a worker.
+    :param task: A tuple of (job index, job, chunk index, number of trips).
+    :return: A list of JSON lines, one per road trip.
+    """
+    job_index, job, chunk_index, num_trips = task
+    walks = _walker.run(
+        starting_city=job["start_city"],
+        max_distance=job["max_distance"],
+        num_walks=num_trips,
+        end_city=job["end_city"],
+        # Each chunk has its own stream of random numbers, derived from the job's seed.
+        seed=[job["seed"], chunk_index],
+    )
+    lines = []
+    for trip_index, (path, distances) in enumerate(_walker.paths(walks)):
+        lines.append(
+            json.dumps(
+                {
+                    "job": job_index,
+                    "trip": chunk_index * CHUNK_SIZE + trip_index,
+                    "start_city": job["start_city"],
+                    "max_distance": job["max_distance"],
+                    "path": path,
+                    "distances": distances,
+                    "total_distance": sum(distances),
+                }
+            )
+        )
+    return lines
+
+
+def _tasks(jobs):
+    for job_index, job in enumerate(jobs):
+        for chunk_index, start in enumerate(range(0, job["count"], CHUNK_SIZE)):
+            yield job_index, job, chunk_index, min(CHUNK_SIZE, job["count"] - start)
+
+
+def generate_trips(jobs, output, processes=1, data_dir="data"):
+    """
+    Generate the road trips for every job, and write them as JSON Lines, in job order.
+    Each line has 'job', 'trip', 'start_city', 'max_distance', 'path' (place_ids, starting and ending with
+    cities, or empty if no trip was possible), 'distances' and 'total_distance'.
+    Progress and throughput are reported on stderr.
+    :param jobs: A list of jobs, as returned by read_jobs.
+    :param output: A writable text file, such as sys.stdout.
+    :param processes: How many worker processes to use.
+    :param data_dir: The dataset directory.
+    :return: The number of road trips written.
+    """
+    arrays, names = pack_walk_arrays(lookup=Lookup(data_dir=data_dir))
+    total_trips = sum(job["count"] for job in jobs)
+    written = 0
+    start = time.perf_counter()
+
+    def write(lines):
+        nonlocal written
+        for line in lines:
+            output.write(line + "\n")
+        written += len(lines)
+        elapsed = time.perf_counter() - start
+        print(
+            f"{written}/{total_trips} road trips, {written / elapsed:.0f} trips/s.",
+            file=sys.stderr,
+        )
+
+    if processes <= 1:
+        global _walker
+        _walker = BatchWalker(arrays=arrays, names=names)
+        for task in _tasks(jobs):
+            write(_run_chunk(task))
+        return written
+
+    blocks, specs = share_arrays(arrays)
+    try:
+        with Pool(
+            processes=processes, initializer=_init_worker, initargs=(specs, names)
+        ) as pool:
+            # imap returns the chunks in order, so the output does not depend on which worker ran them.
+            for lines in pool.imap(_run_chunk, _tasks(jobs)):
+                write(lines)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    return written
@@ -0,0 +1,105 @@
+# Benchmarks for the serving path. Run with: python benchmark.py
+import resource
+import subprocess
+import sys
+import time
+
+# Run in a fresh interpreter, so the measured imports are not already cached.
+IMPORT_SCRIPT = """
+import gc, resource, time
+start = time.perf_counter()
+import api
+elapsed = time.perf_counter() - start
+gc.collect()
+with open("/proc/self/status") as f:
+    rss = [line.split()[1] for line in f if line.startswith("VmRSS")][0]
+print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, rss)
+"""
+
+
+def benchmark_worker_startup():
+    """
+    Measure the time to import the serving stack (api -> path_finder -> lookup), including the dataset
+    load, and the worker's peak and resident memory afterwards. Linux only.
+    :return: A tuple of (import time in seconds, peak RSS in MB, RSS in MB).
+    """
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    # Both are reported in KB on Linux.
+    return float(output[-3]), int(output[-2]) / 1024, int(output[-1]) / 1024
+
+
+def benchmark_generate_path(path_finder, starting_city, max_distance, runs=200):
+    """
+    Measure the average time to generate a random road trip.
+    :return: The average time per road trip, in milliseconds.
+    """
+    start = time.perf_counter()
+    for _ in range(runs):
+        path_finder.generate_path(
+            starting_city=starting_city, max_distance=max_distance
+        )
+    return (time.perf_counter() - start) / runs * 1000
+
+
+def benchmark_batch_walks(walker, starting_city, max_distance, num_walks=20000):
+    """
+    Measure the throughput of the vectorized random walks.
+    :return: The number of walks per second.
+    """
+    start = time.perf_counter()
+    walker.run(
+        starting_city=starting_city, max_distance=max_distance, num_walks=num_walks
+    )
+    return num_walks / (time.perf_counter() - start)
+
+
+def main():
+    import_time, peak_rss, rss = benchmark_worker_startup()
+    print(f"Worker import time: {import_time * 1000:.1f} ms.")
+    print(f"Worker peak RSS after import: {peak_rss:.1f} MB.")
+    print(f"Worker RSS after import: {rss:.1f} MB.")
+
+    from batch_walks import BatchWalker
+    from lookup import Lookup
+    from path_finder import PathFinder
+
+    start = time.perf_counter()
+    lookup = Lookup()
+    print(f"Dataset load time: {(time.perf_counter() - start) * 1000:.1f} ms.")
+
+    path_finder = PathFinder(lookup=lookup, seed=0)
+    walker = BatchWalker(lookup=lookup)
+    for starting_city, max_distance in [
+        ("San Francisco, CA", 1000),
+        ("San Francisco, CA", 5000),
+        ("New York, NY", 2000),
+    ]:
+        latency = benchmark_generate_path(
+            path_finder=path_finder,
+            starting_city=starting_city,
+            max_distance=max_distance,
+        )
+        print(
+            f"generate_path from {starting_city}, {max_distance} km: {latency:.2f} ms "
+            f"({1000 / latency:.0f} walks/s)."
+        )
+        walks_per_second = benchmark_batch_walks(
+            walker=walker, starting_city=starting_city, max_distance=max_distance
+        )
+        print(
+            f"BatchWalker from {starting_city}, {max_distance} km: "
+            f"{walks_per_second:.0f} walks/s."
+        )
+    print(
+        f"Benchmark peak RSS: "
+        f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MB."
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# A versioned handle on the dataset, which reloads it in the background when the artifact changes.
+import hashlib
+import json
+import os
+import threading
+import time
+
+from lookup import Lookup
+
+# Written by the offline pipeline after every other file, with the hash of each file. A version is only
+# swapped in if the files it loaded match the manifest, so a worker never serves a mix of two versions.
+MANIFEST_FILE = "dataset_manifest.json"
+
+
+def _file_hash(file_name):
+    file_hash = hashlib.sha1()
+    with open(file_name, "rb") as f:
+        for block in iter(lambda: f.read(1 << 16), b""):
+            file_hash.update(block)
+    return file_hash.hexdigest()
+
+
+def write_dataset_manifest(data_dir="data"):
+    """
+    Offline. Record the hash of every file in the dataset directory in its manifest. Run this after all
+    the other files of a new version are written.
+    :param data_dir: The dataset directory.
+    :return: The manifest, a dict with 'files': a dict of file name to hash.
+    """
+    files = {}
+    for entry in sorted(os.scandir(data_dir), key=lambda x: x.name):
+        if not entry.is_file() or entry.name.endswith(".tmp"):
+            continue
+        if entry.name != MANIFEST_FILE:
+            files[entry.name] = _file_hash(entry.path)
+    manifest = {"files": files}
+    file_name = os.path.join(data_dir, MANIFEST_FILE)
+    with open(f"{file_name}.tmp", "w") as fp:
+        json.dump(manifest, fp, indent=1, sort_keys=True)
+    os.replace(f"{file_name}.tmp", file_name)
+    print(f"Saved the hashes of {len(files)} dataset files.")
+    return manifest
+
+
+class Dataset:
+    def __init__(self, lookup, load_seconds):
+        """
+        One loaded version of the dataset. It is never modified, so in-flight requests can keep using it
+        after a newer version is swapped in.
+        :param lookup: The Lookup for this version.
+        :param load_seconds: How long this version took to load.
+        """
+        self.lookup = lookup
+        self.version = lookup.version
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+
+
+class DatasetHandle:
+    def __init__(self, data_dir="data", poll_interval=30, on_swap=None):
+        """
+        Load the dataset, and watch data_dir for a new version.
+        The watch is checked when the dataset is used, rather than by a thread started here, so that it
+        keeps working in workers forked after the app is loaded.
+        :param data_dir: The directory with the dataset artifact produced by the offline pipeline.
+        :param poll_interval: The min. number of seconds between checks of the artifact for changes.
+        :param on_swap: Optional function called with the new Dataset after it is swapped in.
+        """
+        self._data_dir = data_dir
+        self._poll_interval = poll_interval
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        self._loading = False
+        self._last_check = time.monotonic()
+        self._fingerprint = self._artifact_fingerprint()
+        try:
+            self._dataset = self._load(fingerprint=self._fingerprint)
+        except ValueError as e:
+            # There is no older version to keep serving, so use this one, and load it again at the next
+            # check.
+            print(f"Loaded an inconsistent dataset: {e}")
+            self._dataset = self._load(verify=False)
+            self._fingerprint = None
+        self.reloads = 0
+
+    def _artifact_fingerprint(self):
+        """
+        A cheap summary of the artifact, which changes whenever a file is written.
+        :return: A tuple of (file name, modification time, size) for each file in data_dir.
+        """
+        return tuple(
+            sorted(
+                (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+                for entry in os.scandir(self._data_dir)
+                if entry.is_file()
+            )
+        )
+
+    def _load(self, fingerprint=None, verify=True):
+        """
+        Load the dataset, and check that every file comes from the same version of it.
+        :param fingerprint: Optional. The fingerprint of the artifact before loading. Without a manifest, the
+                            files are only consistent if the artifact did not change while they were read.
+        :param verify: Whether to check the files against the manifest. If they are not consistent, a
+                        ValueError is raised.
+        :return: A Dataset.
+        """
+        start = time.perf_counter()
+        manifest = None
+        if verify and os.path.exists(os.path.join(self._data_dir, MANIFEST_FILE)):
+            with open(os.path.join(self._data_dir, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        lookup = Lookup(data_dir=self._data_dir)
+        if manifest is not None:
+            stale_files = sorted(
+                file_name
+                for file_name, file_hash in lookup.file_hashes.items()
+                if manifest["files"].get(file_name) != file_hash
+            )
+            if stale_files:
+                raise ValueError(
+                    f"{', '.join(stale_files)} do not match {MANIFEST_FILE}."
+                )
+        elif fingerprint is not None and self._artifact_fingerprint() != fingerprint:
+            raise ValueError("The dataset changed while it was loaded.")
+        return Dataset(lookup=lookup, load_seconds=time.perf_counter() - start)
+
+    def _reload(self, fingerprint):
+        """
+        Load the new version of the dataset, then swap it in. Runs in a background thread.
+        :param fingerprint: The fingerprint of the artifact that triggered the reload.
+        """
+        try:
+            dataset = self._load(fingerprint=fingerprint)
+        except Exception as e:
+            # The artifact may still be being written. Keep the current version, and try again once the
+            # artifact changes, as it will when the rest of the files or the manifest are written.
+            print(f"Failed to reload the dataset: {e}")
+            with self._lock:
+                self._fingerprint = fingerprint
+                self._loading = False
+            return
+        with self._lock:
+            self._fingerprint = fingerprint
+            if dataset.version == self._dataset.version:
+                # Only files outside the dataset changed.
+                self._loading = False
+                return
+            # Replacing the reference is atomic. Requests that already hold the old version keep it.
+            self._dataset = dataset
+            self.reloads += 1
+        print(
+            f"Swapped in dataset version {dataset.version}, "
+            f"loaded in {dataset.load_seconds:.2f} seconds."
+        )
+        try:
+            if self._on_swap is not None:
+                self._on_swap(dataset)
+        finally:
+            with self._lock:
+                self._loading = False
+
+    def _check_for_new_version(self):
+        """
+        If the poll interval has passed, check the artifact, and start a background reload if it changed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._loading or now - self._last_check < self._poll_interval:
+                return
+            self._last_check = now
+        fingerprint = self._artifact_fingerprint()
+        with self._lock:
+            if fingerprint == self._fingerprint or self._loading:
+                return
+            self._loading = True
+        threading.Thread(target=self._reload, args=(fingerprint,), daemon=True).start()
+
+    def current(self):
+        """
+        Returns the current version of the dataset. A request should call this once, and use the returned
+        Dataset until it finishes.
+        :return: A Dataset.
+        """
+        self._check_for_new_version()
+        return self._dataset
+
+    def stats(self):
+        """
+        Describe the current version of the dataset.
+        :return: A dictionary with the version, load time, when it was loaded and the number of reloads.
+        """
+        dataset = self._dataset
+        return {
+            "version": dataset.version,
+            "load_seconds": dataset.load_seconds,
+            "loaded_at": dataset.loaded_at,
+            "reloads": self.reloads,
+        }
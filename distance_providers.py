@@ -0,0 +1,274 @@
+"""
+Providers of driving distances for GDistanceMatrix.
+Every provider answers in the response format of the Google Distance Matrix API, so the code that builds
+the distance artifacts does not depend on where the distances come from.
+Google Distance Matrix: https://developers.google.com/maps/documentation/distance-matrix/overview
+"""
+import csv
+import heapq
+import json
+import math
+
+import numpy as np
+from googlemaps import distance_matrix
+
+from park_graph import AVERAGE_SPEED_KMH, EARTH_RADIUS_KM
+
+
+class DistanceProvider:
+    # Whether requests cost money, and so need to be confirmed by the user first.
+    paid = False
+    # The max number of origins and destinations per request, or None for no limit.
+    block_length = None
+
+    def distance_matrix(self, origin_list, destination_list):
+        """
+        Compute the driving distances from each origin to each destination.
+        :param origin_list: A list of place_ids.
+        :param destination_list: A list of place_ids.
+        :return: A dict in the Distance Matrix API format: 'rows' has one row per origin, each with
+                    'elements', one per destination. Reachable elements have distance.value (in metres) and
+                    duration.value (in seconds).
+        """
+        raise NotImplementedError
+
+
+class GoogleDistanceProvider(DistanceProvider):
+    paid = True
+    # Distance Matrix restricts max request size to 100 elements.
+    block_length = 10
+
+    def __init__(self, client):
+        # Pass in a Google Maps Services Client.
+        self._client = client
+
+    # Returns the list of origins/destinations as a string.
+    def _create_places_string(self, place_list):
+        query_list = [f"place_id:{place_id}" for place_id in place_list]
+        return "|".join(query_list)
+
+    def distance_matrix(self, origin_list, destination_list):
+        origin_str = self._create_places_string(origin_list)
+        destination_str = self._create_places_string(destination_list)
+        return distance_matrix.distance_matrix(
+            client=self._client, origins=origin_str, destinations=destination_str
+        )
+
+
+def load_place_coordinates(data_dir="data"):
+    """
+    Read the coordinates of every park and city place_id, to place them on a road graph.
+    :param data_dir: The dataset directory.
+    :return: A dict of place_id to (latitude, longitude).
+    """
+    with open(f"{data_dir}/park_id_to_park_info.json") as f:
+        park_id_to_park_info = json.load(f)
+    with open(f"{data_dir}/cities_to_place_id.json") as f2:
+        cities_to_place_id = json.load(f2)
+    coordinates = {
+        park_id: (info["latitude"], info["longitude"])
+        for park_id, info in park_id_to_park_info.items()
+    }
+    with open(f"{data_dir}/us_cities.csv", newline="", encoding="utf-8-sig") as f3:
+        for row in csv.DictReader(f3):
+            city_name = f"{row['city']}, {row['state_id']}"
+            if city_name in cities_to_place_id:
+                coordinates[cities_to_place_id[city_name]] = (
+                    float(row["lat"]),
+                    float(row["lng"]),
+                )
+    return coordinates
+
+
+def _haversine_m(lat, lng, lats, lngs):
+    """
+    Returns the great-circle distances from one point to an array of points.
+    :return: A numpy array of distances, in metres.
+    """
+    lat, lng = np.radians(lat), np.radians(lng)
+    lats, lngs = np.radians(lats), np.radians(lngs)
+    a = (
+        np.sin((lats - lat) / 2) ** 2
+        + np.cos(lat) * np.cos(lats) * np.sin((lngs - lng) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(a))
+
+
+def make_synthetic_road_graph(
+    coordinates, file_name, extra_nodes=2000, neighbors=5, detour=1.3, seed=0
+):
+    """
+    Write a synthetic road graph, for testing without a real road network or the Google API.
+    Nodes are the given places plus random points in their bounding box, and each node has a road to its
+    nearest nodes, with a length of the straight-line distance times a detour factor.
+    :param coordinates: A dict of place_id to (latitude, longitude), such as from load_place_coordinates.
+    :param file_name: The .npz file to write.
+    :param extra_nodes: How many random nodes to add.
+    :param neighbors: How many of its nearest nodes each node has a road to.
+    :param detour: How much longer a road is than the straight line.
+    :param seed: The random seed.
+    :return: None
+    """
+    rng = np.random.default_rng(seed)
+    place_lats = np.array([x[0] for x in coordinates.values()])
+    place_lngs = np.array([x[1] for x in coordinates.values()])
+    lats = np.concatenate(
+        [place_lats, rng.uniform(place_lats.min(), place_lats.max(), extra_nodes)]
+    )
+    lngs = np.concatenate(
+        [place_lngs, rng.uniform(place_lngs.min(), place_lngs.max(), extra_nodes)]
+    )
+    edges = set()
+    for node in range(len(lats)):
+        distances = _haversine_m(lats[node], lngs[node], lats, lngs)
+        for other in np.argsort(distances)[1 : neighbors + 1]:
+            # Roads go both ways.
+            edges.add((node, int(other)))
+            edges.add((int(other), node))
+    edges = np.array(sorted(edges))
+    lengths = np.array(
+        [
+            _haversine_m(lats[u], lngs[u], lats[v : v + 1], lngs[v : v + 1])[0]
+            for u, v in edges
+        ]
+    )
+    indptr = np.searchsorted(edges[:, 0], np.arange(len(lats) + 1))
+    np.savez(
+        file_name,
+        lat=lats,
+        lng=lngs,
+        indptr=indptr,
+        indices=edges[:, 1],
+        lengths=lengths * detour,
+    )
+
+
+class LocalRoadNetworkProvider(DistanceProvider):
+    def __init__(
+        self, graph_file, place_coordinates, average_speed_kmh=AVERAGE_SPEED_KMH
+    ):
+        """
+        Compute shortest driving distances on a road graph, such as an OSM extract preprocessed into CSR arrays.
+        :param graph_file: A .npz file with the node coordinates 'lat' and 'lng', and the directed roads as CSR
+                            arrays 'indptr', 'indices' and 'lengths' (in metres).
+        :param place_coordinates: A dict of place_id to (latitude, longitude). Each place is snapped to its
+                                    nearest node.
+        :param average_speed_kmh: The road graph has no speeds, so durations are estimated at this speed.
+        """
+        graph = np.load(graph_file)
+        self._lats = graph["lat"]
+        self._lngs = graph["lng"]
+        # Plain lists are much faster than numpy arrays to index one element at a time.
+        self._indptr = graph["indptr"].tolist()
+        self._indices = graph["indices"].tolist()
+        self._lengths = graph["lengths"].tolist()
+        # The reverse graph, for the backward half of the bidirectional search.
+        order = np.argsort(graph["indices"], kind="stable")
+        sources = np.repeat(np.arange(len(self._lats)), np.diff(graph["indptr"]))
+        self._reverse_indptr = np.searchsorted(
+            graph["indices"][order], np.arange(len(self._lats) + 1)
+        ).tolist()
+        self._reverse_indices = sources[order].tolist()
+        self._reverse_lengths = graph["lengths"][order].tolist()
+        self._place_coordinates = place_coordinates
+        self._place_nodes = {}
+        self._metres_per_second = average_speed_kmh / 3.6
+
+    def _node(self, place_id):
+        """
+        Returns the road graph node nearest to a place.
+        """
+        if place_id not in self._place_nodes:
+            lat, lng = self._place_coordinates[place_id]
+            distances = _haversine_m(lat, lng, self._lats, self._lngs)
+            self._place_nodes[place_id] = int(np.argmin(distances))
+        return self._place_nodes[place_id]
+
+    def _dijkstra(self, source, targets):
+        """
+        One-to-many Dijkstra, which stops once every target is settled. One search serves a whole row.
+        :param source: The source node.
+        :param targets: A set of target nodes.
+        :return: A dict of reachable target node to distance (in metres).
+        """
+        indptr, indices, lengths = self._indptr, self._indices, self._lengths
+        distances = {source: 0.0}
+        settled = set()
+        remaining = set(targets)
+        heap = [(0.0, source)]
+        while heap and remaining:
+            distance, node = heapq.heappop(heap)
+            if node in settled:
+                continue
+            settled.add(node)
+            remaining.discard(node)
+            for i in range(indptr[node], indptr[node + 1]):
+                next_distance = distance + lengths[i]
+                if next_distance < distances.get(indices[i], math.inf):
+                    distances[indices[i]] = next_distance
+                    heapq.heappush(heap, (next_distance, indices[i]))
+        return {target: distances[target] for target in targets if target in settled}
+
+    def _bidirectional_dijkstra(self, source, target):
+        """
+        Point-to-point shortest distance, searching forward from the source and backward from the target.
+        :return: The distance (in metres), or None if the target can't be reached.
+        """
+        if source == target:
+            return 0.0
+        graphs = [
+            (self._indptr, self._indices, self._lengths),
+            (self._reverse_indptr, self._reverse_indices, self._reverse_lengths),
+        ]
+        distances = [{source: 0.0}, {target: 0.0}]
+        settled = [set(), set()]
+        heaps = [[(0.0, source)], [(0.0, target)]]
+        best = math.inf
+        while heaps[0] and heaps[1]:
+            # Stop once no shorter path can go through the unsettled nodes.
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+            # Expand the side with the smaller frontier.
+            side = 0 if len(heaps[0]) <= len(heaps[1]) else 1
+            distance, node = heapq.heappop(heaps[side])
+            if node in settled[side]:
+                continue
+            settled[side].add(node)
+            indptr, indices, lengths = graphs[side]
+            for i in range(indptr[node], indptr[node + 1]):
+                next_node = indices[i]
+                next_distance = distance + lengths[i]
+                if next_distance < distances[side].get(next_node, math.inf):
+                    distances[side][next_node] = next_distance
+                    heapq.heappush(heaps[side], (next_distance, next_node))
+                if next_node in distances[1 - side]:
+                    best = min(best, next_distance + distances[1 - side][next_node])
+        return None if best == math.inf else best
+
+    def distance_matrix(self, origin_list, destination_list):
+        dest_nodes = [self._node(place_id) for place_id in destination_list]
+        rows = []
+        for origin_id in origin_list:
+            origin_node = self._node(origin_id)
+            if len(dest_nodes) == 1:
+                distance = self._bidirectional_dijkstra(origin_node, dest_nodes[0])
+                row_distances = {} if distance is None else {dest_nodes[0]: distance}
+            else:
+                row_distances = self._dijkstra(origin_node, set(dest_nodes))
+            elements = []
+            for dest_node in dest_nodes:
+                if dest_node in row_distances:
+                    distance = row_distances[dest_node]
+                    elements.append(
+                        {
+                            "status": "OK",
+                            "distance": {"value": round(distance)},
+                            "duration": {
+                                "value": round(distance / self._metres_per_second)
+                            },
+                        }
+                    )
+                else:
+                    elements.append({"status": "ZERO_RESULTS"})
+            rows.append({"elements": elements})
+        return {"status": "OK", "rows": rows}
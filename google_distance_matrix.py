@@ -1,59 +1,111 @@
-from googlemaps import distance_matrix
 import json
+import os
 import numpy as np
 
+from distance_providers import GoogleDistanceProvider
+from park_graph import ParkGraph, build_park_graph, haversine_candidates
+
 TEXT_QUERY = "textquery"
 
 """
-A class that makes requests to the Google Distance Matrix API.
+A class that builds the distance data, by making requests to a distance provider. By default, this is the
+Google Distance Matrix API.
 Documentation: https://developers.google.com/maps/documentation/distance-matrix/overview
 Source Code: https://github.com/googlemaps/google-maps-services-python/blob/master/googlemaps/distance_matrix.py
 """
 
 
 class GDistanceMatrix:
-    def __init__(self, client):
-        # Pass in a Google Maps Services Client.
-        self._client = client
-
-    # Returns the list of origins/destinations as a string.
-    def _create_places_string(self, place_list):
-        query_list = [f"place_id:{place_id}" for place_id in place_list]
-        return "|".join(query_list)
+    def __init__(self, client=None, provider=None):
+        """
+        :param client: A Google Maps Services Client. Used when no provider is given.
+        :param provider: Optional. A DistanceProvider from distance_providers.py, such as a
+                            LocalRoadNetworkProvider to compute the distances offline.
+        """
+        if provider is None:
+            provider = GoogleDistanceProvider(client=client)
+        self._provider = provider
 
-    # Makes request to Google Distance Matrix API.
+    # Makes request to the distance provider.
     def _distance_matrix_request(self, origin_list, destination_list):
-        origin_str = self._create_places_string(origin_list)
-        destination_str = self._create_places_string(destination_list)
-        return distance_matrix.distance_matrix(
-            client=self._client, origins=origin_str, destinations=destination_str
+        return self._provider.distance_matrix(
+            origin_list=origin_list, destination_list=destination_list
         )
 
-    # Save a distance dict to json.
-    def _save_distance_dict(self, distance_dict, file_name):
+    # Paid providers need the user to confirm first.
+    def _confirm_cost(self):
+        if not self._provider.paid:
+            return
+        input_val = input(
+            "Are you sure you want to call this method (expensive GCP cost)? Enter Y to continue."
+        )
+        if input_val not in {"Y", "y"}:
+            raise ValueError("Terminating as user did not confirm by entering 'Y'.")
+
+    # The durations are saved next to the distances, e.g. park_durations.json for park_distances.json.
+    def _durations_file_name(self, file_name):
+        return file_name.replace("distances", "durations")
+
+    # Save a distance dict, and its duration dict, to json.
+    def _save_distance_dict(self, distance_dict, file_name, duration_dict=None):
         with open(file_name, "w") as fp:
             json.dump(distance_dict, fp)
+        if duration_dict is not None:
+            with open(self._durations_file_name(file_name), "w") as fp:
+                json.dump(duration_dict, fp)
         print("Saved distances to json file.")
 
+    # Read the durations saved next to a distance file, or an empty dict if there are none.
+    def _load_duration_dict(self, file_name):
+        try:
+            with open(self._durations_file_name(file_name)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    # Returns the distance (in km) of a Distance Matrix element, or N/A if there is no route, or the origin
+    # and destination are the same place. Different places can be 0 km apart, such as two places that snap
+    # to the same road node.
+    def _element_distance(self, dest, same_place=False):
+        if same_place or "distance" not in dest:
+            return "N/A"
+        return dest["distance"]["value"] / 1000
+
+    # Returns the duration (in hours) of a Distance Matrix element, or N/A if there is no route.
+    # It comes in the same response as the distance, so it costs nothing extra to keep.
+    def _element_duration(self, dest, same_place=False):
+        if (
+            self._element_distance(dest, same_place=same_place) == "N/A"
+            or "duration" not in dest
+        ):
+            return "N/A"
+        return dest["duration"]["value"] / 3600
+
     def _block_distance_matrix_request(
-        self, file_name, origin_ids, dest_ids, distance_dict=None
+        self, file_name, origin_ids, dest_ids, distance_dict=None, duration_dict=None
     ):
         if distance_dict is None:
             distance_dict = {}
+        if duration_dict is None:
+            duration_dict = {}
         y_length = len(origin_ids)
         x_length = len(dest_ids)
         # Create requests in blocks of 10 x 10. Distance Matrix restricts max request size to 100 elements.
-        block_length = 10
+        # Providers without a limit get whole rows, which they compute with one search per origin.
+        block_length = self._provider.block_length or 10
+        row_length = self._provider.block_length or x_length
         y = 0
         while y < y_length:
             # As a precaution, save after each row.
             if y > 0:
-                self._save_distance_dict(distance_dict, file_name=file_name)
+                self._save_distance_dict(
+                    distance_dict, file_name=file_name, duration_dict=duration_dict
+                )
             end_y = min(y_length, y + block_length)
             x = 0
             while x < x_length:
                 print(f"Retrieving block with row {y}, column {x}.")
-                end_x = min(x_length, x + block_length)
+                end_x = min(x_length, x + row_length)
                 rows = origin_ids[y:end_y]
                 cols = dest_ids[x:end_x]
 
@@ -64,7 +116,9 @@ class GDistanceMatrix:
                     )
                 except Exception as e:
                     # In case the API breaks for whatever reason, we want to save what we have so far.
-                    self._save_distance_dict(distance_dict, file_name=file_name)
+                    self._save_distance_dict(
+                        distance_dict, file_name=file_name, duration_dict=duration_dict
+                    )
                     print(f"Failed at: y = {y} and x = {x}.")
                     print(f"Next time, we can rerun starting from this block.")
                     raise Exception("Google Distance Matrix API failed.")
@@ -76,27 +130,191 @@ class GDistanceMatrix:
                     elements = row["elements"]
                     for col_index, dest in enumerate(elements):
                         col_place_id = cols[col_index]
-                        val = "N/A"
                         # Check if it is possible to go from origin to destination.
-                        if "distance" in dest:
-                            distance_in_metres = dest["distance"]["value"]
-                            if distance_in_metres == 0:
-                                # Same start and end point. Set to N/A.
-                                val = "N/A"
-                            else:
-                                distance_in_kilometers = distance_in_metres / 1000
-                                val = distance_in_kilometers
+                        same_place = row_place_id == col_place_id
+                        val = self._element_distance(dest, same_place=same_place)
                         if row_place_id in distance_dict:
                             distance_dict[row_place_id][col_place_id] = val
                         else:
                             distance_dict[row_place_id] = {col_place_id: val}
+                        duration_dict.setdefault(row_place_id, {})[
+                            col_place_id
+                        ] = self._element_duration(dest, same_place=same_place)
                 x = end_x
             y = end_y
 
-        self._save_distance_dict(distance_dict, file_name=file_name)
+        self._save_distance_dict(
+            distance_dict, file_name=file_name, duration_dict=duration_dict
+        )
         print("Finished retrieving Distance Matrix Data.")
 
-    def compute_cities_to_parks_distance(self):
+    def _sparse_distance_matrix_request(
+        self, file_name, candidates, distance_dict, duration_dict=None
+    ):
+        """
+        Request the distances from each origin to its own list of candidate destinations.
+        :param file_name: The json file to save the distances to, as we go.
+        :param candidates: A dict of origin place_id to a list of destination place_ids.
+        :param distance_dict: Distances already retrieved. Only the missing destinations of each origin are
+                                requested.
+        :param duration_dict: Optional. Durations already retrieved, filled in alongside the distances.
+        :return: None. Fills in distance_dict and duration_dict.
+        """
+        if duration_dict is None:
+            duration_dict = {}
+        # One origin and up to 25 destinations per request, within the 100 element limit.
+        # Providers without a limit get the whole row at once.
+        block_length = 25 if self._provider.block_length else None
+        for origin_index, (origin_id, dest_ids) in enumerate(candidates.items()):
+            row = distance_dict.get(origin_id, {})
+            dest_ids = [x for x in dest_ids if x not in row]
+            if origin_id in distance_dict and not dest_ids:
+                continue
+            if origin_index % 50 == 0:
+                # As a precaution, save regularly.
+                self._save_distance_dict(
+                    distance_dict, file_name=file_name, duration_dict=duration_dict
+                )
+            print(
+                f"Retrieving candidates for origin {origin_index + 1}/{len(candidates)}."
+            )
+            duration_row = duration_dict.setdefault(origin_id, {})
+            row_length = block_length or max(len(dest_ids), 1)
+            for x in range(0, len(dest_ids), row_length):
+                cols = dest_ids[x : x + row_length]
+                try:
+                    block_distance_matrix = self._distance_matrix_request(
+                        origin_list=[origin_id], destination_list=cols
+                    )
+                except Exception as e:
+                    # In case the API breaks for whatever reason, we want to save what we have so far.
+                    self._save_distance_dict(
+                        distance_dict, file_name=file_name, duration_dict=duration_dict
+                    )
+                    print(f"Failed at origin {origin_id}.")
+                    print(f"Next time, we can rerun with read_existing_data=True.")
+                    raise Exception("Google Distance Matrix API failed.")
+                elements = block_distance_matrix["rows"][0]["elements"]
+                for col_index, dest in enumerate(elements):
+                    same_place = origin_id == cols[col_index]
+                    row[cols[col_index]] = self._element_distance(
+                        dest, same_place=same_place
+                    )
+                    duration_row[cols[col_index]] = self._element_duration(
+                        dest, same_place=same_place
+                    )
+            distance_dict[origin_id] = row
+        self._save_distance_dict(
+            distance_dict, file_name=file_name, duration_dict=duration_dict
+        )
+
+    def _read_park_graph_rows(self):
+        """
+        Read the distances (and durations) kept in data/park_graph.json, as distance rows.
+        :return: A tuple of (distance dict, duration dict), as in _sparse_distance_matrix_request.
+        """
+        with open("data/park_graph.json") as f:
+            graph_data = json.load(f)
+        graph = ParkGraph(graph_data)
+        distance_dict = {
+            park_id: dict(graph.neighbors(park_id)) for park_id in graph.park_ids
+        }
+        duration_dict = {}
+        if "durations" in graph_data:
+            duration_dict = {
+                park_id: {x: graph.duration(park_id, x) for x in row}
+                for park_id, row in distance_dict.items()
+            }
+        return distance_dict, duration_dict
+
+    def build_park_graph(
+        self, k=40, num_candidates=80, read_existing_data=False, place_ids=None
+    ):
+        """
+        Build the sparse k-nearest-neighbor graph of driving distances between parks, in data/park_graph.json.
+        Each park only requests the distances to its num_candidates closest parks in a straight line, and keeps
+        the k closest by driving distance, so the cost grows with N * num_candidates rather than N * N.
+        IMPORTANT!!!
+        Google Distance Matrix API costs $4 usd 1000 elements; (origin, dest) pairs.
+            600 places x 80 candidates = 48,000 elements = $192 USD.
+        DO NOT CALL THIS METHOD UNLESS YOU ARE 100% SURE ON HOW GCP BILLING WORKS!
+        :param k: The max number of neighbors to keep for each park.
+        :param num_candidates: How many straight-line candidates to request driving distances for.
+        :param read_existing_data: Whether to continue from the distances in data/park_candidate_distances.json,
+                                    or from the edges of data/park_graph.json if there is no such file.
+                                    Only the missing (park, candidate) distances are requested.
+        :param place_ids: Optional. Only add these parks to the existing graph, such as the parks added by
+                            refresh_nps_park_data. Their distances to and from their candidates among the parks
+                            already in the graph are requested, and the other parks keep their distances.
+                            Needs read_existing_data.
+        """
+        if place_ids is not None and not read_existing_data:
+            raise ValueError("Adding parks to the graph needs read_existing_data=True.")
+        self._confirm_cost()
+
+        # Every park in the NPS data is a candidate. data/park_id_to_park_info.json is filtered to the parks
+        # already in the graph, so new parks would never be added.
+        with open("data/park_data.json") as f:
+            park_data = json.load(f)
+        coordinates = {
+            info["place_id"]: (float(info["latitude"]), float(info["longitude"]))
+            for info in park_data.values()
+            if info.get("place_id")
+        }
+
+        distance_dict = {}
+        duration_dict = {}
+        file_name = "data/park_candidate_distances.json"
+        if read_existing_data:
+            if os.path.exists(file_name):
+                with open(file_name) as f:
+                    distance_dict = json.load(f)
+                duration_dict = self._load_duration_dict(file_name)
+            else:
+                # The graph only keeps the k closest parks of each park, but those are the ones that matter.
+                distance_dict, duration_dict = self._read_park_graph_rows()
+        # Parks that are no longer in the NPS data are dropped from the graph, and the distances to and from
+        # the added parks are requested again.
+        added_ids = set(place_ids or ()) & set(coordinates)
+        distance_dict = {
+            park_id: {x: v for x, v in row.items() if x not in added_ids}
+            for park_id, row in distance_dict.items()
+            if park_id in coordinates and park_id not in added_ids
+        }
+
+        if place_ids is None:
+            candidates = haversine_candidates(
+                coordinates=coordinates, num_candidates=num_candidates
+            )
+        else:
+            candidates = haversine_candidates(
+                coordinates={
+                    park_id: location
+                    for park_id, location in coordinates.items()
+                    if park_id in distance_dict or park_id in added_ids
+                },
+                num_candidates=num_candidates,
+            )
+            # The parks already in the graph only need the distances to the added parks among their candidates.
+            candidates = {
+                park_id: [x for x in dest_ids if park_id in added_ids or x in added_ids]
+                for park_id, dest_ids in candidates.items()
+            }
+        self._sparse_distance_matrix_request(
+            file_name=file_name,
+            candidates=candidates,
+            distance_dict=distance_dict,
+            duration_dict=duration_dict,
+        )
+
+        graph = build_park_graph(
+            distance_rows=distance_dict, k=k, duration_rows=duration_dict
+        )
+        with open("data/park_graph.json", "w") as fp:
+            json.dump(graph, fp)
+        print("Saved park graph to json file.")
+
+    def compute_cities_to_parks_distance(self, read_existing_data=False):
         """
         IMPORTANT!!!
         Google Distance Matrix API costs $4 usd 1000 elements; (origin, dest) pairs.
@@ -105,22 +323,38 @@ class GDistanceMatrix:
             200 places x 200 places = 40,000 elements = $160 USD. (new api key)
             70 cities x 200 places = 14,000 elements = $56 USD (old api key).
         DO NOT CALL THIS METHOD UNLESS YOU ARE 100% SURE ON HOW GCP BILLING WORKS!
+        :param read_existing_data: Whether to keep the distances in data/city_place_ids_to_parks_distances.json,
+                                    and only request the parks that are missing from it.
         """
-        input_val = input(
-            "Are you sure you want to call this method (expensive GCP cost)? Enter Y to continue."
-        )
-        if input_val not in {"Y", "y"}:
-            raise ValueError("Terminating as user did not confirm by entering 'Y'.")
+        self._confirm_cost()
 
-        with open("data/park_distances.json") as f:
-            park_distances = json.load(f)
+        with open("data/park_graph.json") as f:
+            park_graph = json.load(f)
         with open("data/cities_to_place_id.json") as f2:
             cities_to_place_id = json.load(f2)
         cities = list(cities_to_place_id.values())
-        parks = list(park_distances.keys())
+        parks = park_graph["park_ids"]
         file_name = "data/city_place_ids_to_parks_distances.json"
+        distance_dict = {}
+        duration_dict = {}
+        if read_existing_data:
+            with open(file_name) as f:
+                distance_dict = json.load(f)
+            duration_dict = self._load_duration_dict(file_name)
+            parks = [
+                park_id
+                for park_id in parks
+                if any(park_id not in distance_dict.get(x, {}) for x in cities)
+            ]
+            if not parks:
+                print("No missing city to park distances.")
+                return
         self._block_distance_matrix_request(
-            file_name=file_name, origin_ids=cities, dest_ids=parks
+            file_name=file_name,
+            origin_ids=cities,
+            dest_ids=parks,
+            distance_dict=distance_dict,
+            duration_dict=duration_dict,
         )
 
     def build_distance_matrix(self, read_existing_data=False, places=None):
@@ -133,11 +367,7 @@ class GDistanceMatrix:
             70 cities x 200 places = 14,000 elements = $56 USD (old api key).
         DO NOT CALL THIS METHOD UNLESS YOU ARE 100% SURE ON HOW GCP BILLING WORKS!
         """
-        input_val = input(
-            "Are you sure you want to call this method (expensive GCP cost)? Enter Y to continue."
-        )
-        if input_val not in {"Y", "y"}:
-            raise ValueError("Terminating as user did not confirm by entering 'Y'.")
+        self._confirm_cost()
 
         with open("data/park_data.json") as f:
             park_data = json.load(f)
@@ -153,15 +383,18 @@ class GDistanceMatrix:
         place_ids = [park_data[park]["place_id"] for park in parks]
 
         distance_dict = {}
+        duration_dict = {}
         file_name = "data/park_distances.json"
         # In case we want to build on existing data, read from json.
         if read_existing_data:
             with open(file_name) as f:
                 distance_dict = json.load(f)
+            duration_dict = self._load_duration_dict(file_name)
 
         self._block_distance_matrix_request(
             file_name=file_name,
             origin_ids=place_ids,
             dest_ids=place_ids,
             distance_dict=distance_dict,
+            duration_dict=duration_dict,
         )
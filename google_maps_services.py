@@ -1,21 +1,35 @@
+import hashlib
 import json
 import os
 from keys import NPS_API_KEY
 import requests
-import pandas as pd
 from google_places import GPlaces
 from google_distance_matrix import GDistanceMatrix
+from park_graph import ParkGraph
+from park_store import write_park_store
+from places_resolver import PlacesResolver
+from scoring import MIN_SCORED_DISTANCE
 
 """
 A wrapper class than contains access to all the services in the Google Maps API.
 """
 
 
+def park_content_hash(info):
+    """
+    Returns a hash of a park's NPS data, to tell whether it changed between two NPS downloads.
+    :param info: The park's info dict, as in data/nps_raw_park_data.json.
+    :return: A hex digest.
+    """
+    return hashlib.sha1(json.dumps(info, sort_keys=True).encode()).hexdigest()
+
+
 class GMapsServices:
     def __init__(self, client):
         # Services.
         self.g_places = GPlaces(client=client)
         self.g_distance_matrix = GDistanceMatrix(client=client)
+        self.places_resolver = PlacesResolver(g_places=self.g_places)
 
     def _get_photo_urls(self, photos):
         """
@@ -100,18 +114,21 @@ class GMapsServices:
         Reading in the cities from the csv file, map each city to a Google place_id.
         :return: A dictionary of city name to place_id.
         """
+        # pandas is slow to import, so only import it in the offline pipeline.
+        import pandas as pd
+
         cities_to_place_id = {}
         df = pd.read_csv("data/us_cities.csv")
         df.reset_index(inplace=True)
         cities = list(df["city"])
         states = list(df["state_id"])
-        for index, city in enumerate(cities):
-            query = f"{city}, {states[index]}"
-            print(f"Searching Google for {query}")
-            gplaces_response = self.g_places.search_for_places(query=query)
-            place = gplaces_response["candidates"][0]
-            place_id = place["place_id"]
-            cities_to_place_id[query] = place_id
+        queries = [f"{city}, {states[index]}" for index, city in enumerate(cities)]
+        responses = self.places_resolver.resolve(queries=queries)
+        for query, gplaces_response in zip(queries, responses):
+            if not gplaces_response or not gplaces_response["candidates"]:
+                print(f"Could not find Google Place for {query}.")
+                continue
+            cities_to_place_id[query] = gplaces_response["candidates"][0]["place_id"]
         file_name = "data/cities_to_place_id.json"
         with open(file_name, "w") as fp:
             json.dump(cities_to_place_id, fp)
@@ -122,33 +139,29 @@ class GMapsServices:
         Given a dictionary of park information, get the Google place_id, reviews and number of reviews
         for each park.
         :param park_info: A dict containing the park name as key, and other info inside a value dict.
-        :return: A new dictionary containing the additional Google fields.
+        :return: A new dictionary containing the additional Google fields. Parks that could not be found,
+                    or have no rating, are left out.
         """
-        num_parks = len(park_info.keys())
-        index = 1
         keys = list(park_info.keys())
-        for key in keys:
-            park = park_info[key]
-            # location_str = f"point:{park['latitude']},{park['longitude']}"
-            query = f"{key}, {park['state']}"
-            print(f"Searching park {index}/{num_parks}: {key}")
-            gplaces_response = self.g_places.search_for_places(query=query)
-            try:
-                place = gplaces_response["candidates"][0]
-            except Exception as e:
-                print(f"Could not find Google Place for {key}. Removing. \n")
+        # location_str = f"point:{park['latitude']},{park['longitude']}"
+        queries = [f"{key}, {park_info[key]['state']}" for key in keys]
+        responses = self.places_resolver.resolve(queries=queries)
+        detailed_park_info = {}
+        for key, gplaces_response in zip(keys, responses):
+            if not gplaces_response or not gplaces_response["candidates"]:
+                print(f"Could not find Google Place for {key}. Removing.")
                 continue
-
-            park["place_id"] = place["place_id"]
+            place = gplaces_response["candidates"][0]
             if "rating" not in place:
-                print(f"No rating for place {key}. Removing. \n")
-                park_info.pop(key)
-            else:
-                park["rating"] = place["rating"]
-                park["num_ratings"] = place["user_ratings_total"]
-                print(f"Mapped to {place['name']} \n")
-            index += 1
-        return park_info
+                print(f"No rating for place {key}. Removing.")
+                continue
+            park = dict(park_info[key])
+            park["place_id"] = place["place_id"]
+            park["rating"] = place["rating"]
+            park["num_ratings"] = place["user_ratings_total"]
+            detailed_park_info[key] = park
+        print(f"Mapped {len(detailed_park_info)} of {len(keys)} parks.")
+        return detailed_park_info
 
     def get_nearest_city_to_place(
         self, place_id, city_place_ids_to_parks_distances, place_ids_to_city
@@ -194,6 +207,100 @@ class GMapsServices:
             json.dump(park_info, fp)
         return park_info
 
+    def _drop_stale_distances(self, place_ids):
+        """
+        Remove the distances (and durations) to and from the given places, so the distance steps request
+        them again.
+        :param place_ids: A set of place_ids.
+        :return: None
+        """
+        file_names = [
+            "data/park_candidate_distances.json",
+            "data/park_candidate_durations.json",
+            "data/city_place_ids_to_parks_distances.json",
+            "data/city_place_ids_to_parks_durations.json",
+        ]
+        for file_name in file_names:
+            if not os.path.exists(file_name):
+                continue
+            with open(file_name) as f:
+                distance_dict = json.load(f)
+            distance_dict = {
+                origin_id: {k: v for k, v in row.items() if k not in place_ids}
+                for origin_id, row in distance_dict.items()
+                if origin_id not in place_ids
+            }
+            with open(file_name, "w") as fp:
+                json.dump(distance_dict, fp)
+
+    def refresh_nps_park_data(self, save_photos=False):
+        """
+        Update the park data from the NPS API, only redoing the expensive steps for parks that changed.
+        Each park in the new NPS data is compared to data/nps_raw_park_data.json by a hash of its contents.
+        Added and changed parks have their photos downloaded and are looked up on Google Places again.
+        Unchanged parks keep their data in data/park_data.json. The distances of added, changed and
+        removed parks are dropped, and the distances of the added and changed parks are requested again, so
+        they get edges in the park graph and distances from the cities.
+        Afterwards, run fill_missing_park_data (and the distance steps with read_existing_data=True again, if it
+        adds parks), and the local steps after them.
+        :param save_photos: Whether or not to download the photos of added and changed parks.
+        :return: A dictionary with the names of the 'added', 'changed', 'removed' and 'unchanged' parks.
+        """
+        with open("data/nps_raw_park_data.json") as f:
+            old_raw_park_data = json.load(f)
+        with open("data/park_data.json") as f2:
+            park_data = json.load(f2)
+        new_raw_park_data = self._get_usa_national_parks_request()
+
+        old_hashes = {
+            name: park_content_hash(info) for name, info in old_raw_park_data.items()
+        }
+        diff = {"added": [], "changed": [], "removed": [], "unchanged": []}
+        for name, info in new_raw_park_data.items():
+            if name not in old_hashes:
+                diff["added"].append(name)
+            elif park_content_hash(info) != old_hashes[name]:
+                diff["changed"].append(name)
+            else:
+                diff["unchanged"].append(name)
+        diff["removed"] = [x for x in old_raw_park_data if x not in new_raw_park_data]
+        print(
+            f"NPS parks: {len(diff['added'])} added, {len(diff['changed'])} changed, "
+            f"{len(diff['removed'])} removed, {len(diff['unchanged'])} unchanged."
+        )
+
+        # The old place_ids of changed and removed parks no longer belong to a park in the dataset.
+        stale_place_ids = {
+            park_data[name]["place_id"]
+            for name in diff["changed"] + diff["removed"]
+            if name in park_data
+        }
+        for name in diff["changed"] + diff["removed"]:
+            park_data.pop(name, None)
+
+        updated_parks = {
+            name: new_raw_park_data[name] for name in diff["added"] + diff["changed"]
+        }
+        if save_photos:
+            self._download_photos(park_info=updated_parks)
+        detailed_park_info = self._get_google_data_for_parks(park_info=updated_parks)
+        stale_place_ids.update(x["place_id"] for x in detailed_park_info.values())
+        park_data.update(detailed_park_info)
+        self._drop_stale_distances(place_ids=stale_place_ids)
+
+        with open("data/park_data.json", "w") as fp:
+            json.dump(park_data, fp)
+        with open("data/nps_raw_park_data.json", "w") as fp:
+            json.dump(new_raw_park_data, fp)
+
+        # Only the distances to and from the updated parks are requested.
+        self.g_distance_matrix.build_park_graph(
+            read_existing_data=True,
+            place_ids={x["place_id"] for x in detailed_park_info.values()},
+        )
+        self.compute_distances_for_cities(read_existing_data=True)
+        return diff
+
     def get_all_national_parks(self, save_photos=False):
         """
         Get all park data from the NPS API, and get the Google place_ids, reviews, and number of reviews
@@ -263,10 +370,10 @@ class GMapsServices:
         with open(file_name, "w") as fp:
             json.dump(park_data_with_google, fp)
 
-    def rank_places_by_reviews(self, limit=200):
+    def rank_places_by_reviews(self, limit=None):
         """
         Given a limit, retrieve the top {limit} places in the park_data.json file by number of reviews.
-        :param limit: The top number of rows.
+        :param limit: The top number of rows. If None, rank all the places.
         :return: A list of the park_ids of the top {limit} places.
         """
         with open("data/park_id_to_park_info.json") as f:
@@ -333,9 +440,9 @@ class GMapsServices:
             city_to_park_distances = json.load(f2)
         with open("data/place_ids_to_park_name.json") as f3:
             place_ids_to_parks = json.load(f3)
-        with open("data/park_distances.json") as f4:
-            park_distances = json.load(f4)
-        park_ids = list(park_distances.keys())
+        with open("data/park_graph.json") as f4:
+            park_graph = json.load(f4)
+        park_ids = park_graph["park_ids"]
 
         park_id_to_nearest_city = {}
         for park_id in park_ids:
@@ -353,29 +460,35 @@ class GMapsServices:
         with open(file_name, "w") as fp:
             json.dump(park_id_to_nearest_city, fp)
 
-    def compute_distances_for_cities(self, get_city_place_ids=False):
+    def compute_distances_for_cities(
+        self, get_city_place_ids=False, read_existing_data=False
+    ):
         """
         Computes the distance from each city to each park.
         :param get_city_place_ids: whether to call Google Places API to get the place_ids for each city.
+        :param read_existing_data: whether to only request the distances that are missing.
         :return:
         """
         if get_city_place_ids:
             self._get_google_data_for_cities()
-        self.g_distance_matrix.compute_cities_to_parks_distance()
+        self.g_distance_matrix.compute_cities_to_parks_distance(
+            read_existing_data=read_existing_data
+        )
 
-    def compute_distances(self):
+    def compute_distances(self, read_existing_data=False):
         """
         Make request to the Google Distance Matrix API to compute distances between the places.
+        Builds the sparse k-nearest-neighbor park graph, so every park can be included.
+        :param read_existing_data: whether to only request the distances that are missing.
         :return: None
         """
-        top_places = self.rank_places_by_reviews()
-        self.g_distance_matrix.build_distance_matrix(places=top_places)
+        self.g_distance_matrix.build_park_graph(read_existing_data=read_existing_data)
 
     def clean_park_data(self):
         with open("data/park_data.json") as f:
             park_data = json.load(f)
-        with open("data/park_distances.json") as f2:
-            park_distances = json.load(f2)
+        with open("data/park_graph.json") as f2:
+            park_ids_with_distances = set(json.load(f2)["park_ids"])
         # Change park data to use the place_id as key.
         cleaned_park_data = {}
         for key in park_data.keys():
@@ -385,7 +498,7 @@ class GMapsServices:
             cleaned_park_data[place_id] = cleaned_info
         cleaned_park_data_keys = list(cleaned_park_data.keys())
         for key in cleaned_park_data_keys:
-            if key not in park_distances:
+            if key not in park_ids_with_distances:
                 cleaned_park_data.pop(key)
         file_name = "data/park_id_to_park_info.json"
         with open(file_name, "w") as fp:
@@ -398,6 +511,8 @@ class GMapsServices:
         We normalize the number of reviews on a scale from 0-1. Then take that score, and multiply
         by a max bonus score.
         We add this bonus score to the base rating to generate a new score for each park.
+        The normalized popularity and whether the park is a national park are stored too (see scoring.py).
+        :param max_bonus_score: The bonus for the most reviewed park.
         :return: None
         """
         with open("data/park_id_to_park_info.json") as f:
@@ -408,18 +523,17 @@ class GMapsServices:
             park_id_to_review_rank[park_id] = index
         total_parks = len(num_review_list)
         for park_id in park_id_to_park_info.keys():
-            bonus = max_bonus_score * (
-                1 - (park_id_to_review_rank[park_id] / total_parks)
+            info = park_id_to_park_info[park_id]
+            # Keep the inputs of the blended rating, so requests can weigh them differently.
+            info["popularity"] = 1 - (park_id_to_review_rank[park_id] / total_parks)
+            info["national_park"] = (
+                info["designation"] == "National Park"
+                or info["name"] == "Sequoia & Kings Canyon National Parks"
             )
-            if (
-                park_id_to_park_info[park_id]["designation"] == "National Park"
-                or park_id_to_park_info[park_id]["name"]
-                == "Sequoia & Kings Canyon National Parks"
-            ):
+            bonus = max_bonus_score * info["popularity"]
+            if info["national_park"]:
                 bonus += 1
-            park_id_to_park_info[park_id]["blended_rating"] = (
-                park_id_to_park_info[park_id]["rating"] + bonus
-            )
+            info["blended_rating"] = info["rating"] + bonus
         file_name = "data/park_id_to_park_info.json"
         with open(file_name, "w") as fp:
             json.dump(park_id_to_park_info, fp)
@@ -428,18 +542,21 @@ class GMapsServices:
         """
         For each park, we generate a sorted list of most optimal next parks.
         The metric we use is blended_rating / distance.
+        Only a park's neighbors in the park graph are suggested, since only their distances are known.
         :return:
         """
         with open("data/park_id_to_park_info.json") as f:
             park_id_to_park_info = json.load(f)
-        with open("data/park_distances.json") as f2:
-            park_distances = json.load(f2)
+        with open("data/park_graph.json") as f2:
+            park_graph = ParkGraph(json.load(f2))
         park_id_to_suggestions = {}
-        for park_id, distances in park_distances.items():
+        for park_id in park_graph.park_ids:
             suggestions = []
-            for dest_id, dist in distances.items():
-                if dist != "N/A" and dist <= 1000:  # Filter out long paths.
-                    metric = park_id_to_park_info[dest_id]["blended_rating"] / dist
+            for dest_id, dist in park_graph.neighbors(park_id):
+                if dist <= 1000:  # Filter out long paths.
+                    metric = park_id_to_park_info[dest_id]["blended_rating"] / max(
+                        dist, MIN_SCORED_DISTANCE
+                    )
                     suggestions.append((dest_id, metric))
             sorted_suggestions = sorted(suggestions, key=lambda x: x[1], reverse=True)
             suggestion_ids = [x[0] for x in sorted_suggestions]
@@ -472,7 +589,9 @@ class GMapsServices:
             suggestions = []
             for dest_id, dist in distances.items():
                 if dist != "N/A" and dist <= 1500:  # Filter out long paths.
-                    metric = park_id_to_park_info[dest_id]["blended_rating"] / dist
+                    metric = park_id_to_park_info[dest_id]["blended_rating"] / max(
+                        dist, MIN_SCORED_DISTANCE
+                    )
                     suggestions.append((dest_id, metric))
             sorted_suggestions = sorted(suggestions, key=lambda x: x[1], reverse=True)
             suggestion_ids = [x[0] for x in sorted_suggestions]
@@ -498,14 +617,15 @@ class GMapsServices:
         :return: None
         """
         park_id_to_unvisitable_parks = {}
-        with open("data/park_distances.json") as f:
-            park_distances = json.load(f)
+        with open("data/park_graph.json") as f:
+            park_graph = ParkGraph(json.load(f))
         with open("data/park_id_to_park_info.json") as f2:
             park_id_to_park_info = json.load(f2)
-        for park_id, distances in park_distances.items():
+        for park_id in park_graph.park_ids:
             unvisitable_parks = []
-            for dest, distance in distances.items():
-                if distance != "N/A" and distance <= radius:
+            # The graph keeps each park's closest parks, so it has every park within the radius.
+            for dest, distance in park_graph.neighbors(park_id):
+                if distance <= radius:
                     unvisitable_parks.append(dest)
             print(f"Current Park is: {park_id_to_park_info[park_id]['name']}")
             for p in unvisitable_parks:
@@ -515,6 +635,17 @@ class GMapsServices:
         with open(file_name, "w") as fp:
             json.dump(park_id_to_unvisitable_parks, fp)
 
+    def split_park_info(self):
+        """
+        Split data/park_id_to_park_info.json into the hot table used by the search (park_hot.json) and
+        the cold store of display attributes (park_cold.jsonl) that the server loads.
+        Run this after the park info is final.
+        :return: None
+        """
+        with open("data/park_id_to_park_info.json") as f:
+            park_id_to_park_info = json.load(f)
+        write_park_store(park_info=park_id_to_park_info)
+
     def choose_one_state(self):
         """
         Because some parks can be listed in multiple states, we assign one principal state to each park.
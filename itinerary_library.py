@@ -0,0 +1,166 @@
+# A library of precomputed road trips for popular (start city, distance) buckets, stored in SQLite.
+import json
+import os
+import random
+import sqlite3
+import threading
+
+from path_finder import PathFinder
+
+STANDARD_DISTANCES = (500, 1000, 2000, 5000)
+
+
+class ItineraryLibrary:
+    def __init__(self, file_name="data/itinerary_library.sqlite"):
+        self._file_name = file_name
+        # SQLite connections can't be shared between threads, so each thread opens its own.
+        self._local = threading.local()
+
+    def version(self):
+        """
+        Identifies the library file. It changes whenever the library is rebuilt, so responses that may come
+        from the library can include it in their cache keys.
+        :return: A string, or None if the library has not been built.
+        """
+        try:
+            stat = os.stat(self._file_name)
+        except FileNotFoundError:
+            return None
+        return f"{stat.st_ino}-{stat.st_mtime_ns}"
+
+    def _connection(self):
+        """
+        Returns this thread's read-only connection to the library. The library is rebuilt by replacing the
+        file, so the connection is opened again when the file changes.
+        :return: A sqlite3 connection, or None if the library has not been built.
+        """
+        file_id = self.version()
+        if file_id is None:
+            return None
+        connection = getattr(self._local, "connection", None)
+        if connection is None or self._local.file_id != file_id:
+            if connection is not None:
+                connection.close()
+            connection = sqlite3.connect(f"file:{self._file_name}?mode=ro", uri=True)
+            self._local.connection, self._local.file_id = connection, file_id
+        return connection
+
+    def _score_path(self, path_finder, path):
+        """
+        Score a road trip by the summed blended_rating of its parks.
+        :param path_finder: A PathFinder, used for its lookups.
+        :param path: A list of place_ids, starting and ending with cities.
+        :return: The score of the road trip.
+        """
+        return sum(
+            path_finder.lookup.lookup_park_blended_rating(place_id=park)
+            for park in path[1:-1]
+        )
+
+    def build(self, num_cities=20, distances=STANDARD_DISTANCES, samples=5000):
+        """
+        Offline job. Generate many road trips for each of the top cities and standard distances,
+        deduplicate and score them, and store them in the library.
+        :param num_cities: How many of the top cities (by population) to generate road trips for.
+        :param distances: The max distances (in km) to generate road trips for.
+        :param samples: How many times to run the random walk for each (city, distance) bucket.
+        :return: None
+        """
+        # numpy is only needed offline, so it is not imported by the API.
+        from batch_walks import BatchWalker
+
+        path_finder = PathFinder()
+        walker = BatchWalker(lookup=path_finder.lookup)
+        cities = path_finder.lookup.all_city_names()[:num_cities]
+        # Build into a temporary file, so the serving library is never half written.
+        temp_file_name = f"{self._file_name}.tmp"
+        if os.path.exists(temp_file_name):
+            os.remove(temp_file_name)
+        connection = sqlite3.connect(temp_file_name)
+        connection.execute(
+            "CREATE TABLE itineraries (city_id TEXT, max_distance REAL, path TEXT, "
+            "distances TEXT, score REAL, cumulative_score REAL)"
+        )
+        connection.execute(
+            "CREATE TABLE buckets (city_id TEXT, max_distance REAL, num_paths INTEGER, "
+            "total_score REAL, PRIMARY KEY (city_id, max_distance))"
+        )
+
+        for city_index, city in enumerate(cities):
+            city_id = path_finder.lookup.lookup_city_id(city_name=city)
+            for max_distance in distances:
+                unique_paths = {}
+                walks = walker.run(
+                    starting_city=city, max_distance=max_distance, num_walks=samples
+                )
+                for path, path_distances in walker.paths(walks):
+                    if path:
+                        unique_paths[tuple(path)] = path_distances
+                cumulative_score = 0
+                rows = []
+                for path, path_distances in unique_paths.items():
+                    score = self._score_path(path_finder=path_finder, path=path)
+                    cumulative_score += score
+                    rows.append(
+                        (
+                            city_id,
+                            max_distance,
+                            json.dumps(path),
+                            json.dumps(path_distances),
+                            score,
+                            cumulative_score,
+                        )
+                    )
+                connection.executemany(
+                    "INSERT INTO itineraries VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+                connection.execute(
+                    "INSERT INTO buckets VALUES (?, ?, ?, ?)",
+                    (city_id, max_distance, len(rows), cumulative_score),
+                )
+                print(
+                    f"City {city_index + 1}/{len(cities)}: {city}, {max_distance} km. "
+                    f"Stored {len(rows)} unique road trips."
+                )
+        # The weighted pick is a range query on the cumulative score within a bucket.
+        connection.execute(
+            "CREATE INDEX itineraries_by_bucket ON itineraries "
+            "(city_id, max_distance, cumulative_score)"
+        )
+        connection.commit()
+        connection.close()
+        os.replace(temp_file_name, self._file_name)
+        print(f"Saved itinerary library to {self._file_name}.")
+
+    def pick(self, city_id, max_distance, rng=random, lookup=None):
+        """
+        Pick a stored road trip for the bucket, with probability proportional to its score.
+        :param city_id: The place_id of the starting city.
+        :param max_distance: The max driving distance for the road trip.
+        :param rng: The random generator to pick with, such as a PathFinder's seeded generator.
+        :param lookup: Optional. The Lookup the road trip will be described with. Road trips with places
+                        that are not in its dataset (as after a dataset reload) are not returned.
+        :return: A tuple of (path, distances), or None if the bucket is not in the library.
+        """
+        connection = self._connection()
+        if connection is None:
+            return None
+        bucket = connection.execute(
+            "SELECT total_score FROM buckets WHERE city_id = ? AND max_distance = ?",
+            (city_id, max_distance),
+        ).fetchone()
+        if bucket is None:
+            return None
+        target = rng.random() * bucket[0]
+        row = connection.execute(
+            "SELECT path, distances FROM itineraries "
+            "WHERE city_id = ? AND max_distance = ? AND cumulative_score > ? "
+            "ORDER BY cumulative_score LIMIT 1",
+            (city_id, max_distance, target),
+        ).fetchone()
+        if row is None:
+            return None
+        path = json.loads(row[0])
+        if lookup is not None and not lookup.is_path(path):
+            return None
+        return path, json.loads(row[1])
@@ -1,30 +1,149 @@
 # This class is a class that provides useful functions to look up information, while searching.
+import csv
+import hashlib
 import json
-import pandas as pd
+import os
+
+from name_index import NameIndex
+from park_clusters import CLUSTERS_FILE, ParkClusters
+from park_graph import ParkGraph, estimate_duration
+from park_store import ColdParkStore, read_park_records
+from scoring import SuggestionRanker
+
+
+def _read_city_geocoordinates(contents):
+    """
+    Read the cities csv into a dictionary. This is on the serving path, so it uses the csv module
+    rather than pandas, which is slow to import.
+    :param contents: The contents of the cities csv, with city, state_id, lat and lng columns.
+    :return: A dictionary of (city, state_id) to (latitude, longitude).
+    """
+    city_geocoordinates = {}
+    lines = contents.decode("utf-8-sig").splitlines()
+    for row in csv.DictReader(lines):
+        city_geocoordinates[(row["city"], row["state_id"])] = (
+            float(row["lat"]),
+            float(row["lng"]),
+        )
+    return city_geocoordinates
 
 
 class Lookup:
-    def __init__(self):
+    def __init__(self, data_dir="data"):
+        """
+        :param data_dir: The directory with the dataset artifact produced by the offline pipeline.
+        """
+        self._data_dir = data_dir
+        # A hash of the contents of every file read, which identifies this version of the dataset.
+        self._content_hash = hashlib.sha1()
+        # The hash of each file read, to check that they all come from the same version of the dataset.
+        self.file_hashes = {}
         # Initialize all the lookup dictionaries.
-        self._cities = pd.read_csv("data/us_cities.csv")
-        with open("data/place_ids_to_city.json") as f:
-            self._place_ids_to_city = json.load(f)
-        with open("data/cities_to_place_id.json") as f2:
-            self._cities_to_place_id = json.load(f2)
-        with open("data/park_id_to_park_info.json") as f3:
-            self._park_id_to_park_info = json.load(f3)
-        with open("data/park_id_to_nearest_city.json") as f4:
-            self._park_id_to_nearest_city = json.load(f4)
-        with open("data/city_place_ids_to_parks_distances.json") as f5:
-            self._city_to_park_distances = json.load(f5)
-        with open("data/park_distances.json") as f6:
-            self._park_distances = json.load(f6)
-        with open("data/park_id_to_unvisitable_parks.json") as f7:
-            self._park_id_to_unvisitable_parks = json.load(f7)
-        with open("data/park_id_suggestions.json") as f8:
-            self._park_id_to_suggestions = json.load(f8)
-        with open("data/city_place_ids_to_park_suggestions.json") as f9:
-            self._city_to_suggestions = json.load(f9)
+        self._city_geocoordinates = _read_city_geocoordinates(
+            self._read_file("us_cities.csv")
+        )
+        self._place_ids_to_city = self._load_json("place_ids_to_city.json")
+        self._cities_to_place_id = self._load_json("cities_to_place_id.json")
+        # Park attributes are split into hot records used while searching, and a cold store that is only
+        # read to describe the parks in the final road trip.
+        self._parks = read_park_records(self._load_json("park_hot.json"))
+        self._cold_parks = ColdParkStore(os.path.join(data_dir, "park_cold.jsonl"))
+        # Hash the memory-mapped contents, rather than the file, which may have been replaced since.
+        self._hash_file("park_cold.jsonl", blocks=self._cold_parks.blocks())
+        self._park_id_to_nearest_city = self._load_json("park_id_to_nearest_city.json")
+        # The distance column of the above, built on first use.
+        self._nearest_city_distances = None
+        self._city_to_park_distances = self._load_json(
+            "city_place_ids_to_parks_distances.json"
+        )
+        # Drive durations, if the dataset has them. Missing durations are estimated from the distances.
+        self._city_to_park_durations = {}
+        if os.path.exists(
+            os.path.join(data_dir, "city_place_ids_to_parks_durations.json")
+        ):
+            self._city_to_park_durations = self._load_json(
+                "city_place_ids_to_parks_durations.json"
+            )
+        self._city_duration_rows = {}
+        # The rendered variants of the downloaded photos, if build_photo_variants has been run.
+        self._photo_manifest = {}
+        if os.path.exists(os.path.join(data_dir, "photo_manifest.json")):
+            self._photo_manifest = self._load_json("photo_manifest.json")
+        self._nearest_city_durations = None
+        self._park_graph = ParkGraph(self._load_json("park_graph.json"))
+        # Shortest graph distances from each park, computed on first use.
+        self._park_reach = {}
+        self._park_id_to_unvisitable_parks = self._load_json(
+            "park_id_to_unvisitable_parks.json"
+        )
+        self._park_id_to_suggestions = self._load_json("park_id_suggestions.json")
+        self._city_to_suggestions = self._load_json(
+            "city_place_ids_to_park_suggestions.json"
+        )
+        # Regional clusters of parks, if build_park_clusters has been run.
+        self._park_clusters = None
+        if os.path.exists(os.path.join(data_dir, CLUSTERS_FILE)):
+            self._park_clusters = ParkClusters(self._load_json(CLUSTERS_FILE))
+        # Ranks suggestions for requests with custom scoring. Built on first use, since it needs numpy.
+        self._suggestion_ranker = None
+        place_ids_to_park_name = self._load_json("place_ids_to_park_name.json")
+        self.version = self._content_hash.hexdigest()[:12]
+        # Index the city names (largest first) and the names of the parks in the dataset (best first),
+        # for autocomplete and resolving misspelled names.
+        parks_by_rating = sorted(
+            (x for x in place_ids_to_park_name if x in self._parks),
+            key=lambda x: self._parks[x].blended_rating,
+            reverse=True,
+        )
+        self.name_index = NameIndex(
+            [(city, "city") for city in self._cities_to_place_id]
+            + [(place_ids_to_park_name[x], "park") for x in parks_by_rating]
+        )
+        self._park_name_to_id = {}
+        for park_id in parks_by_rating:
+            self._park_name_to_id.setdefault(place_ids_to_park_name[park_id], park_id)
+
+    def _read_file(self, file_name):
+        """
+        Read a file from the dataset directory, and add its contents to the dataset version hash.
+        :param file_name: The name of the file in the dataset directory.
+        :return: The contents, as bytes.
+        """
+        with open(os.path.join(self._data_dir, file_name), "rb") as f:
+            contents = f.read()
+        self._content_hash.update(file_name.encode())
+        self._content_hash.update(contents)
+        self.file_hashes[file_name] = hashlib.sha1(contents).hexdigest()
+        return contents
+
+    def _load_json(self, file_name):
+        """
+        Read a json file from the dataset directory, and add its contents to the dataset version hash.
+        :param file_name: The name of the file in the dataset directory.
+        :return: The parsed json.
+        """
+        return json.loads(self._read_file(file_name))
+
+    def _hash_file(self, file_name, blocks=None):
+        """
+        Add the contents of a file in the dataset directory to the dataset version hash, reading it in
+        blocks so it is not held in memory.
+        :param file_name: The name of the file in the dataset directory.
+        :param blocks: Optional. The file's contents as an iterable of bytes blocks, if it is already open.
+        :return: None
+        """
+        if blocks is None:
+            with open(os.path.join(self._data_dir, file_name), "rb") as f:
+                self._hash_file(
+                    file_name=file_name, blocks=iter(lambda: f.read(1 << 16), b"")
+                )
+            return
+        self._content_hash.update(file_name.encode())
+        file_hash = hashlib.sha1()
+        for block in blocks:
+            self._content_hash.update(block)
+            file_hash.update(block)
+        self.file_hashes[file_name] = file_hash.hexdigest()
 
     ##########################################
     # Simple lookups
@@ -48,13 +167,57 @@ class Lookup:
         except LookupError as le:
             raise LookupError(f"Invalid city name {city_name} provided.")
 
+    def is_city(self, place_id):
+        """
+        Returns whether the place_id is a city in this dataset.
+        :param place_id: A place_id.
+        :return: True if it is a city.
+        """
+        return place_id in self._place_ids_to_city
+
+    def all_city_names(self):
+        """
+        Returns the names of all the cities, in the order of data/us_cities.csv (largest first).
+        :return: A list of city names.
+        """
+        return list(self._cities_to_place_id.keys())
+
+    def resolve_city_name(self, city_name):
+        """
+        Returns the city name in the dataset that best matches a possibly misspelled city name.
+        :param city_name: The city name, such as "San Fransisco, CA" or "san francisco".
+        :return: The matching city name, or None if no city matches closely enough.
+        """
+        if city_name in self._cities_to_place_id:
+            return city_name
+        return self.name_index.resolve(name=city_name, kind="city")
+
+    def resolve_park_name(self, park_name):
+        """
+        Returns the place_id of the park that best matches a possibly misspelled park name.
+        :param park_name: The park name, such as "Yosemite" or "zion national park".
+        :return: The park's place_id, or None if no park matches closely enough.
+        """
+        if park_name not in self._park_name_to_id:
+            park_name = self.name_index.resolve(name=park_name, kind="park")
+        return self._park_name_to_id.get(park_name)
+
+    def lookup_park_details(self, place_id):
+        """
+        Returns the park's display attributes, read from the cold store.
+        :param place_id: park's place_id
+        :return: A dictionary with the park's name, description, num_ratings, photos, local_photos,
+                    designation, latitude and longitude.
+        """
+        return self._cold_parks.get(self._parks[place_id])
+
     def lookup_park_name(self, place_id):
         """
         Returns the park name of the place_id.
         :param place_id: the place_id of the park.
         :return: the park name.
         """
-        return self._park_id_to_park_info[place_id]["name"]
+        return self.lookup_park_details(place_id=place_id)["name"]
 
     def lookup_city_geocoordinates(self, city_name):
         """
@@ -64,10 +227,43 @@ class Lookup:
         """
         city_info = city_name.split(",")
         city, state = city_info[0], (city_info[1]).strip()
-        row = (
-            self._cities[(self._cities.city == city) & (self._cities.state_id == state)]
-        ).iloc[0]
-        return row["lat"], row["lng"]
+        return self._city_geocoordinates[(city, state)]
+
+    def lookup_park_index(self, place_id):
+        """
+        Returns the park's integer index, which is stable for a given dataset.
+        :param place_id: park's place_id
+        :return: the index of the park.
+        """
+        return self._parks[place_id].index
+
+    def is_park(self, place_id):
+        """
+        Returns whether the place_id is a park in this dataset.
+        :param place_id: A place_id.
+        :return: True if it is a park.
+        """
+        return place_id in self._parks
+
+    def is_path(self, path):
+        """
+        Returns whether a road trip's places are all in this dataset.
+        :param path: A list of place_ids, starting and ending with cities, with parks in between.
+        :return: True if the first and last places are cities, and the others are parks.
+        """
+        return (
+            len(path) >= 2
+            and self.is_city(path[0])
+            and self.is_city(path[-1])
+            and all(self.is_park(x) for x in path[1:-1])
+        )
+
+    def all_park_ids(self):
+        """
+        Returns the place_ids of all the parks, in order of their index.
+        :return: A list of place_ids.
+        """
+        return sorted(self._parks, key=lambda x: self._parks[x].index)
 
     def lookup_park_geocoordinates(self, place_id):
         """
@@ -75,10 +271,8 @@ class Lookup:
         :param place_id: Park's place_id.
         :return: (latitude, longitude) tuple.
         """
-        return (
-            self._park_id_to_park_info[place_id]["latitude"],
-            self._park_id_to_park_info[place_id]["longitude"],
-        )
+        details = self.lookup_park_details(place_id=place_id)
+        return details["latitude"], details["longitude"]
 
     def lookup_park_state(self, place_id):
         """
@@ -86,7 +280,7 @@ class Lookup:
         :param place_id: park's place_id
         :return: the two letter state code.
         """
-        return self._park_id_to_park_info[place_id]["state"]
+        return self._parks[place_id].state
 
     def lookup_park_rating(self, place_id):
         """
@@ -94,7 +288,23 @@ class Lookup:
         :param place_id: park's place_id
         :return: average google rating (out of 5)
         """
-        return self._park_id_to_park_info[place_id]["rating"]
+        return self._parks[place_id].rating
+
+    def lookup_park_blended_rating(self, place_id):
+        """
+        Returns the park's blended rating, which mixes the average rating with a popularity bonus.
+        :param place_id: park's place_id
+        :return: blended rating
+        """
+        return self._parks[place_id].blended_rating
+
+    def lookup_park_record(self, place_id):
+        """
+        Returns the park's hot attributes, such as its rating, popularity and whether it is a national park.
+        :param place_id: park's place_id
+        :return: The park's ParkRecord.
+        """
+        return self._parks[place_id]
 
     def lookup_park_num_ratings(self, place_id):
         """
@@ -102,7 +312,7 @@ class Lookup:
         :param place_id: park's place_id
         :return: number of google ratings
         """
-        return self._park_id_to_park_info[place_id]["num_ratings"]
+        return self.lookup_park_details(place_id=place_id)["num_ratings"]
 
     def lookup_park_photos(self, place_id):
         """
@@ -110,7 +320,21 @@ class Lookup:
         :param place_id: park's place_id
         :return: a list of urls.
         """
-        return self._park_id_to_park_info[place_id]["photos"]
+        return self.lookup_park_details(place_id=place_id)["photos"]
+
+    def lookup_park_photo_variants(self, place_id):
+        """
+        Returns the rendered variants of the park's downloaded photos.
+        :param place_id: park's place_id
+        :return: A list with a dict per photo, of variant name (such as 'thumb' or 'medium') to the variant's
+                    file name. Photos without variants are left out.
+        """
+        variants = []
+        for file_name in self.lookup_park_details(place_id=place_id)["local_photos"]:
+            entry = self._photo_manifest.get(file_name)
+            if entry is not None:
+                variants.append({k: v for k, v in entry.items() if k != "source"})
+        return variants
 
     ##########################################
     # Distance-based lookups
@@ -123,6 +347,18 @@ class Lookup:
         """
         return self._park_id_to_nearest_city[place_id]["distance_to_city"]
 
+    def distances_to_nearest_city(self):
+        """
+        Returns the driving distance from every park to its nearest city, as one row.
+        :return: A dict of park place_id to distance (in km). Values could also be 'N/A'.
+        """
+        if self._nearest_city_distances is None:
+            self._nearest_city_distances = {
+                x: v["distance_to_city"]
+                for x, v in self._park_id_to_nearest_city.items()
+            }
+        return self._nearest_city_distances
+
     def nearest_city_name(self, place_id):
         """
         Returns the name of the nearest city to a park.
@@ -140,14 +376,100 @@ class Lookup:
         """
         return self._city_to_park_distances[city_id][park_id]
 
+    def distance_from_park_to_city(self, park_id, city_id):
+        """
+        Returns the driving distance from a given park to a given city.
+        Driving distances are treated as symmetric, so this reads the city-to-park matrix in reverse.
+        :param park_id: place_id of the park.
+        :param city_id: place_id of the city.
+        :return: The distance. Could also be 'N/A'.
+        """
+        return self._city_to_park_distances[city_id][park_id]
+
+    def distances_to_city(self, city_id):
+        """
+        Returns the driving distance from every park to the given city, as one precomputed row.
+        :param city_id: place_id of the city.
+        :return: A dict of park place_id to distance (in km). Values could also be 'N/A'.
+        """
+        return self._city_to_park_distances[city_id]
+
+    def durations_to_city(self, city_id):
+        """
+        Returns the drive duration from every park to the given city, as one row.
+        :param city_id: place_id of the city.
+        :return: A dict of park place_id to duration (in hours). Values could also be 'N/A'.
+        """
+        row = self._city_duration_rows.get(city_id)
+        if row is None:
+            stored_row = self._city_to_park_durations.get(city_id, {})
+            row = {}
+            for park_id, distance in self._city_to_park_distances[city_id].items():
+                duration = stored_row.get(park_id, "N/A")
+                row[park_id] = (
+                    estimate_duration(distance) if duration == "N/A" else duration
+                )
+            self._city_duration_rows[city_id] = row
+        return row
+
+    def duration_from_city_to_park(self, city_id, park_id):
+        """
+        Returns the drive duration from a given city to a given park.
+        :param city_id: place_id of the city.
+        :param park_id: place_id of the park.
+        :return: The duration (in hours). Could also be 'N/A'.
+        """
+        return self.durations_to_city(city_id=city_id)[park_id]
+
+    def duration_to_nearest_city(self, place_id):
+        """
+        Returns the drive duration of a park to the nearest city.
+        :param place_id: the place_id of the park
+        :return: The duration (in hours). Could also be 'N/A'.
+        """
+        if self._nearest_city_durations is None:
+            # This is checked for every candidate park of a time-budgeted trip, so read it all up front.
+            nearest_city_durations = {}
+            for park_id, info in self._park_id_to_nearest_city.items():
+                duration = "N/A"
+                if info["nearest_city"] != "N/A":
+                    city_id = self.lookup_city_id(city_name=info["nearest_city"])
+                    duration = self.duration_from_city_to_park(
+                        city_id=city_id, park_id=park_id
+                    )
+                nearest_city_durations[park_id] = duration
+            self._nearest_city_durations = nearest_city_durations
+        return self._nearest_city_durations[place_id]
+
+    def duration_from_park_to_park(self, origin_id, dest_id):
+        """
+        Returns the drive duration from a given park to a given park.
+        :param origin_id: place_id of the origin park.
+        :param dest_id: place_id of the destination park.
+        :return: The duration (in hours). 'N/A' if the destination is not one of the origin's neighbors.
+        """
+        return self._park_graph.duration(origin_id=origin_id, dest_id=dest_id)
+
     def distance_from_park_to_park(self, origin_id, dest_id):
         """
         Returns the driving distance from a given park to a given park.
         :param origin_id: place_id of the origin park.
         :param dest_id: place_id of the destination park.
-        :return: The distance.
+        :return: The distance. 'N/A' if the destination is not one of the origin's neighbors in the park graph.
+        """
+        return self._park_graph.distance(origin_id=origin_id, dest_id=dest_id)
+
+    def distances_within_graph(self, park_id):
         """
-        return self._park_distances[origin_id][dest_id]
+        Returns the shortest driving distance from a park to every park it can reach by driving between parks.
+        :param park_id: place_id of the park.
+        :return: A dict of park place_id to distance (in km). Parks that can't be reached are left out.
+        """
+        reach = self._park_reach.get(park_id)
+        if reach is None:
+            reach = self._park_graph.shortest_distances(place_id=park_id)
+            self._park_reach[park_id] = reach
+        return reach
 
     def parks_too_close_to_park_id(self, park_id):
         """
@@ -172,3 +494,23 @@ class Lookup:
         :return: list of place_ids of parks sorted by blended_rating/distance.
         """
         return self._city_to_suggestions[city_id]
+
+    def park_clusters(self):
+        """
+        Returns the regional clusters of the parks.
+        :return: A ParkClusters, or None if the dataset has no clusters.
+        """
+        return self._park_clusters
+
+    def suggestion_ranker(self):
+        """
+        Returns the ranker used instead of the precomputed suggestions, for requests with custom scoring.
+        :return: A SuggestionRanker.
+        """
+        if self._suggestion_ranker is None:
+            self._suggestion_ranker = SuggestionRanker(
+                park_graph=self._park_graph,
+                parks=self._parks,
+                city_to_park_distances=self._city_to_park_distances,
+            )
+        return self._suggestion_ranker
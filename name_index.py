@@ -0,0 +1,130 @@
+# An index over city and park names, for autocomplete and for resolving misspelled names.
+import re
+from collections import Counter
+
+# How many entries to keep at each trie node. Autocomplete never returns more than this.
+MAX_ENTRIES_PER_NODE = 20
+
+
+def _normalize(name):
+    """
+    Normalize a name for matching: lowercase, with punctuation removed and whitespace collapsed.
+    :param name: The name.
+    :return: The normalized name.
+    """
+    return " ".join(re.sub(r"[^\w\s]", " ", name.lower()).split())
+
+
+def _trigrams(normalized_name):
+    """
+    Returns the set of character trigrams of a normalized name, padded so that the start and end of
+    the name also count.
+    :param normalized_name: A name returned by _normalize.
+    :return: A set of 3 character strings.
+    """
+    padded = f"  {normalized_name} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class NameIndex:
+    def __init__(self, entries):
+        """
+        Build the index. This is done once, when the dataset is loaded.
+        :param entries: A list of (name, kind) tuples, such as ("San Francisco, CA", "city"), in order of
+                        importance. More important names are suggested first.
+        """
+        self._names = []
+        self._kinds = []
+        self._trigrams = []
+        # A trie over every name (key None), and one per kind, so names of a kind are not crowded out of
+        # the truncated entries by names of other kinds.
+        self._tries = {None: {}}
+        self._postings = {}  # trigram -> list of entry indexes.
+        for name, kind in entries:
+            self._add(name=name, kind=kind)
+        for trie in self._tries.values():
+            self._finish_trie(trie)
+
+    def _add(self, name, kind):
+        entry = len(self._names)
+        normalized_name = _normalize(name)
+        self._names.append(name)
+        self._kinds.append(kind)
+        # Every word start is a prefix, so "york" finds "New York, NY". Matches at the start of the
+        # name sort before matches on a later word.
+        words = normalized_name.split(" ")
+        for trie in (self._tries[None], self._tries.setdefault(kind, {})):
+            for word_index in range(len(words)):
+                node = trie
+                for char in " ".join(words[word_index:]):
+                    node = node.setdefault(char, {})
+                    node.setdefault("", []).append((word_index > 0, entry))
+        trigrams = _trigrams(normalized_name)
+        self._trigrams.append(trigrams)
+        for trigram in trigrams:
+            self._postings.setdefault(trigram, []).append(entry)
+
+    def _finish_trie(self, node):
+        """
+        Sort and truncate the entries stored at each trie node, and remove duplicates.
+        """
+        for char, child in node.items():
+            if char == "":
+                continue
+            entries = []
+            seen = set()
+            for _, entry in sorted(child[""]):
+                if entry not in seen:
+                    seen.add(entry)
+                    entries.append(entry)
+                    if len(entries) >= MAX_ENTRIES_PER_NODE:
+                        break
+            child[""] = entries
+            self._finish_trie(child)
+
+    def autocomplete(self, prefix, limit=10, kind=None):
+        """
+        Returns the names that have a word starting with the given prefix.
+        :param prefix: The text typed so far.
+        :param limit: The max number of names to return.
+        :param kind: Optional. Only return names of this kind, such as "city" or "park".
+        :return: A list of (name, kind) tuples, in order of importance.
+        """
+        node = self._tries.get(kind)
+        if node is None:
+            return []
+        for char in _normalize(prefix):
+            node = node.get(char)
+            if node is None:
+                return []
+        return [(self._names[x], self._kinds[x]) for x in node.get("", [])[:limit]]
+
+    def resolve(self, name, kind=None, min_similarity=0.5):
+        """
+        Find the name that best matches a possibly misspelled name, by trigram similarity.
+        :param name: The name to resolve.
+        :param kind: Optional. Only resolve to names of this kind.
+        :param min_similarity: The min Dice similarity (0 to 1) of the trigrams to accept a match.
+        :return: The best matching name, or None if nothing is similar enough.
+        """
+        trigrams = _trigrams(_normalize(name))
+        shared = Counter()
+        for trigram in trigrams:
+            for entry in self._postings.get(trigram, []):
+                shared[entry] += 1
+        best_entry = None
+        best_similarity = min_similarity
+        for entry, count in shared.items():
+            if kind is not None and self._kinds[entry] != kind:
+                continue
+            similarity = 2 * count / (len(trigrams) + len(self._trigrams[entry]))
+            # Ties go to the more important name, which was added first.
+            if similarity > best_similarity or (
+                similarity == best_similarity
+                and (best_entry is None or entry < best_entry)
+            ):
+                best_entry = entry
+                best_similarity = similarity
+        if best_entry is None:
+            return None
+        return self._names[best_entry]
@@ -0,0 +1,207 @@
+# Regional clusters of parks, so a long road trip can be planned over the regions first, and then over
+# the parks of each region in turn.
+import json
+import math
+import os
+from itertools import islice
+
+from park_graph import ParkGraph
+
+CLUSTERS_FILE = "park_clusters.json"
+# No two parks in a cluster are further apart than this (in km).
+CLUSTER_DIAMETER = 400
+# Parks with no route between them through the park graph are kept in separate clusters.
+NO_ROUTE_DISTANCE = 1e9
+
+
+def build_park_clusters(data_dir="data", diameter=CLUSTER_DIAMETER):
+    """
+    Offline. Cluster the parks by complete-linkage agglomerative clustering on their driving distances, so
+    no two parks in a cluster are more than diameter apart. Also record the shortest driving distance from
+    each cluster to each other cluster, which bounds the distance of any hop between them.
+    Run this after the park graph is built, whenever it changes.
+    :param data_dir: The dataset directory. The clusters are saved to park_clusters.json in it.
+    :param diameter: The max driving distance (in km) between two parks of a cluster.
+    :return: A dict with the 'diameter', 'clusters' (park place_id to cluster index) and 'bounds' (for each
+                cluster, the shortest distance from its parks to the parks of each cluster, or None if they
+                can't be reached).
+    """
+    import numpy as np
+    from sklearn.cluster import AgglomerativeClustering
+
+    from lookup import Lookup
+
+    lookup = Lookup(data_dir=data_dir)
+    with open(os.path.join(data_dir, "park_graph.json")) as f:
+        graph = ParkGraph(json.load(f))
+    park_ids = lookup.all_park_ids()
+    shortest = np.full((len(park_ids), len(park_ids)), math.inf)
+    for i, park_id in enumerate(park_ids):
+        reach = graph.shortest_distances(place_id=park_id)
+        for j, other_id in enumerate(park_ids):
+            shortest[i, j] = reach.get(other_id, math.inf)
+    # The graph keeps each park's nearest parks, so it is not symmetric. Two parks are as far apart as
+    # the longer of the two directions.
+    distances = np.maximum(shortest, shortest.T)
+    distances[np.isinf(distances)] = NO_ROUTE_DISTANCE
+    labels = AgglomerativeClustering(
+        n_clusters=None,
+        metric="precomputed",
+        linkage="complete",
+        distance_threshold=diameter,
+    ).fit_predict(distances)
+
+    num_clusters = int(labels.max()) + 1
+    bounds = np.full((num_clusters, num_clusters), math.inf)
+    for i in range(len(park_ids)):
+        for j in range(len(park_ids)):
+            a, b = labels[i], labels[j]
+            bounds[a, b] = min(bounds[a, b], shortest[i, j])
+    clusters = {
+        "diameter": diameter,
+        "clusters": {park_id: int(x) for park_id, x in zip(park_ids, labels)},
+        "bounds": [
+            [None if math.isinf(x) else round(float(x), 3) for x in row]
+            for row in bounds
+        ],
+    }
+    with open(os.path.join(data_dir, CLUSTERS_FILE), "w") as fp:
+        json.dump(clusters, fp)
+    print(f"Saved {num_clusters} park clusters.")
+    return clusters
+
+
+def subset_clusters(clusters_data, park_ids):
+    """
+    Restrict the clusters to some of the parks, such as those of a region shard. The bounds are kept as
+    they are, since the shortest distances between fewer parks can only be longer.
+    :param clusters_data: The dict returned by build_park_clusters.
+    :param park_ids: The place_ids of the parks to keep.
+    :return: A dict in the same format.
+    """
+    return {
+        "diameter": clusters_data["diameter"],
+        "clusters": {
+            x: v for x, v in clusters_data["clusters"].items() if x in park_ids
+        },
+        "bounds": clusters_data["bounds"],
+    }
+
+
+class ParkClusters:
+    def __init__(self, clusters_data):
+        """
+        :param clusters_data: The dict returned by build_park_clusters, as read from park_clusters.json.
+        """
+        self._clusters = clusters_data["clusters"]
+        self._bounds = [
+            [math.inf if x is None else x for x in row]
+            for row in clusters_data["bounds"]
+        ]
+        self._parks = [set() for _ in self._bounds]
+        for park_id, cluster in self._clusters.items():
+            self._parks[cluster].add(park_id)
+        # Clusters with no parks, as in a region shard, are never planned.
+        self._planned_clusters = [x for x, parks in enumerate(self._parks) if parks]
+        # The clusters nearest each cluster first, so a plan step stops at the first that fit, like the
+        # park suggestions.
+        self._nearest = [
+            sorted(self._planned_clusters, key=row.__getitem__) for row in self._bounds
+        ]
+        # Memo of the parks of each group of clusters searched together.
+        self._parks_of_groups = {}
+        # Memo of the bounds of the dataset's rows, such as a city's distances.
+        self._row_bounds = {}
+
+    def cluster(self, park_id):
+        """
+        Returns the index of a park's cluster.
+        :param park_id: The park's place_id.
+        :return: The cluster index, or None if the park is not clustered.
+        """
+        return self._clusters.get(park_id)
+
+    def parks(self, cluster):
+        """
+        Returns the parks of a cluster.
+        :param cluster: The cluster index.
+        :return: A set of place_ids.
+        """
+        return self._parks[cluster]
+
+    def parks_of(self, clusters):
+        """
+        Returns the parks of a group of clusters.
+        :param clusters: A tuple of cluster indexes.
+        :return: A frozenset of place_ids.
+        """
+        parks = self._parks_of_groups.get(clusters)
+        if parks is None:
+            parks = frozenset().union(*(self._parks[x] for x in clusters))
+            self._parks_of_groups[clusters] = parks
+        return parks
+
+    def bounds_from(self, cluster):
+        """
+        Returns the shortest distance from the parks of a cluster to the parks of each cluster.
+        :param cluster: The cluster index.
+        :return: A list with a distance (in km) per cluster, infinite if it can't be reached.
+        """
+        return self._bounds[cluster]
+
+    def bounds(self, distances, key=None):
+        """
+        Returns the shortest of the given distances to (or from) the parks of each cluster.
+        :param distances: A dict of park place_id to distance (in km). Values could also be 'N/A'.
+        :param key: Optional. A name for the distances, if they never change, so their bounds are memoized.
+        :return: A list with a distance per cluster, infinite if none of its parks has one.
+        """
+        if key in self._row_bounds:
+            return self._row_bounds[key]
+        bounds = [math.inf] * len(self._bounds)
+        for park_id, cluster in self._clusters.items():
+            distance = distances.get(park_id, "N/A")
+            if distance != "N/A" and distance < bounds[cluster]:
+                bounds[cluster] = distance
+        if key is not None:
+            self._row_bounds[key] = bounds
+        return bounds
+
+    def plan(self, start_bounds, end_bounds, max_distance, num_suggestions, rng):
+        """
+        Plan the order to visit the clusters in, the same way the road trip search chooses parks: each step
+        goes to one of the num_suggestions closest clusters not yet planned, at random, as long as the
+        distance bounds of the plan so far, the step, and the end of the trip from that cluster fit in
+        max_distance.
+        :param start_bounds: A list of the shortest distance from the start of the trip to each cluster.
+        :param end_bounds: A list of the shortest distance from each cluster to the end of the trip.
+        :param max_distance: The driving distance (in km) the plan must fit in.
+        :param num_suggestions: How many of the closest clusters to choose between at each step.
+        :param rng: A random.Random.
+        :return: A list of cluster indexes, in the order to visit them.
+        """
+        plan = []
+        planned = set()
+        distance = 0
+        row = start_bounds
+        nearest = sorted(self._planned_clusters, key=row.__getitem__)
+        while True:
+            options = list(
+                islice(
+                    (
+                        (row[x], x)
+                        for x in nearest
+                        if x not in planned
+                        and distance + row[x] + end_bounds[x] <= max_distance
+                    ),
+                    num_suggestions,
+                )
+            )
+            if not options:
+                return plan
+            step, cluster = rng.choice(options)
+            plan.append(cluster)
+            planned.add(cluster)
+            distance += step
+            row = self._bounds[cluster]
+            nearest = self._nearest[cluster]
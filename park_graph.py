@@ -0,0 +1,237 @@
+# A sparse k-nearest-neighbor graph of driving distances between parks, stored in CSR form.
+# Each park keeps only its k closest parks by driving distance, so memory and Distance Matrix cost grow
+# with N * k rather than N * N.
+import heapq
+import math
+from array import array
+from bisect import bisect_left
+
+EARTH_RADIUS_KM = 6371.0
+# Used to estimate drive durations where the dataset only has distances.
+AVERAGE_SPEED_KMH = 80.0
+
+
+def estimate_duration(distance):
+    """
+    Estimate a drive duration from its distance, at the average speed.
+    :param distance: The driving distance (in km), or 'N/A'.
+    :return: The duration (in hours), or 'N/A'.
+    """
+    if distance == "N/A":
+        return "N/A"
+    return distance / AVERAGE_SPEED_KMH
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """
+    Returns the great-circle distance between two points. This is a lower bound on the driving distance.
+    :return: The distance, in km.
+    """
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def haversine_candidates(coordinates, num_candidates):
+    """
+    For each park, find the parks that are closest in a straight line. Only these candidates have their
+    driving distances requested.
+    :param coordinates: A dict of park place_id to (latitude, longitude).
+    :param num_candidates: How many candidates to keep for each park.
+    :return: A dict of park place_id to a list of candidate place_ids, closest first.
+    """
+    candidates = {}
+    for place_id, (lat, lng) in coordinates.items():
+        distances = sorted(
+            (haversine_km(lat, lng, other_lat, other_lng), other_id)
+            for other_id, (other_lat, other_lng) in coordinates.items()
+            if other_id != place_id
+        )
+        candidates[place_id] = [x[1] for x in distances[:num_candidates]]
+    return candidates
+
+
+def build_park_graph(distance_rows, k, duration_rows=None):
+    """
+    Build the graph from driving distances, keeping each park's k closest parks.
+    :param distance_rows: A dict of origin place_id to a dict of destination place_id to distance (in km),
+                            or 'N/A' if there is no route. Rows may be sparse.
+    :param k: The max number of neighbors to keep for each park.
+    :param duration_rows: Optional. The drive durations (in hours), in the same format as distance_rows.
+                            Missing durations are estimated from the distance.
+    :return: A json-serializable dict with the CSR arrays: park_ids (sorted), indptr, indices and distances,
+                and durations if duration_rows were given. Row i holds the neighbors of park_ids[i], sorted
+                by index.
+    """
+    park_ids = sorted(distance_rows)
+    park_id_to_index = {park_id: index for index, park_id in enumerate(park_ids)}
+    indptr = [0]
+    indices = []
+    distances = []
+    durations = []
+    for park_id in park_ids:
+        valid = sorted(
+            (distance, dest_id)
+            for dest_id, distance in distance_rows[park_id].items()
+            if distance != "N/A" and dest_id != park_id and dest_id in park_id_to_index
+        )
+        row = sorted(
+            (park_id_to_index[dest_id], distance) for distance, dest_id in valid[:k]
+        )
+        indices.extend(x[0] for x in row)
+        distances.extend(x[1] for x in row)
+        if duration_rows is not None:
+            duration_row = duration_rows.get(park_id, {})
+            for index, distance in row:
+                duration = duration_row.get(park_ids[index], "N/A")
+                if duration == "N/A":
+                    duration = estimate_duration(distance)
+                durations.append(duration)
+        indptr.append(len(indices))
+    graph = {
+        "park_ids": park_ids,
+        "indptr": indptr,
+        "indices": indices,
+        "distances": distances,
+    }
+    if duration_rows is not None:
+        graph["durations"] = durations
+    return graph
+
+
+def subgraph(graph_data, park_ids):
+    """
+    Restrict a graph to some of its parks, dropping the edges to the other parks.
+    :param graph_data: The dict returned by build_park_graph.
+    :param park_ids: The place_ids of the parks to keep.
+    :return: A json-serializable dict in the same format, with the kept parks re-indexed.
+    """
+    kept_park_ids = []
+    old_to_new = {}
+    for old_index, park_id in enumerate(graph_data["park_ids"]):
+        if park_id in park_ids:
+            old_to_new[old_index] = len(kept_park_ids)
+            kept_park_ids.append(park_id)
+    # The kept parks stay in sorted order, so the rows stay sorted by index.
+    columns = [
+        key for key in ("indices", "distances", "durations") if key in graph_data
+    ]
+    graph = {"park_ids": kept_park_ids, "indptr": [0]}
+    graph.update({key: [] for key in columns})
+    indptr = graph_data["indptr"]
+    for old_index in sorted(old_to_new):
+        for i in range(indptr[old_index], indptr[old_index + 1]):
+            dest_index = old_to_new.get(graph_data["indices"][i])
+            if dest_index is None:
+                continue
+            graph["indices"].append(dest_index)
+            for key in columns[1:]:
+                graph[key].append(graph_data[key][i])
+        graph["indptr"].append(len(graph["indices"]))
+    return graph
+
+
+class ParkGraph:
+    def __init__(self, graph_data):
+        """
+        :param graph_data: The dict returned by build_park_graph, as read from data/park_graph.json.
+        """
+        self.park_ids = graph_data["park_ids"]
+        self._park_id_to_index = {
+            park_id: index for index, park_id in enumerate(self.park_ids)
+        }
+        # Compact typed arrays, rather than a dict per park.
+        self._indptr = array("l", graph_data["indptr"])
+        self._indices = array("l", graph_data["indices"])
+        self._distances = array("d", graph_data["distances"])
+        # Graphs built without durations estimate them from the distances.
+        self._durations = None
+        if "durations" in graph_data:
+            self._durations = array("d", graph_data["durations"])
+
+    def neighbors(self, place_id):
+        """
+        Returns the neighbors of a park, and the driving distance to each.
+        :param place_id: The park's place_id.
+        :return: A list of (place_id, distance) tuples.
+        """
+        index = self._park_id_to_index[place_id]
+        start, end = self._indptr[index], self._indptr[index + 1]
+        return [
+            (self.park_ids[self._indices[i]], self._distances[i])
+            for i in range(start, end)
+        ]
+
+    def arrays(self):
+        """
+        Returns the CSR arrays of the graph. Row i holds the neighbors of park_ids[i].
+        :return: A tuple of (indptr, indices, distances) typed arrays.
+        """
+        return self._indptr, self._indices, self._distances
+
+    def shortest_distances(self, place_id):
+        """
+        Returns the shortest driving distance from a park to every park it can reach through the graph.
+        A road trip between parks only drives along graph edges, so this bounds the distance of any such trip.
+        :param place_id: The origin park's place_id.
+        :return: A dict of place_id to the shortest distance (in km), including the origin at 0.
+        """
+        origin = self._park_id_to_index[place_id]
+        shortest = {origin: 0.0}
+        heap = [(0.0, origin)]
+        while heap:
+            distance, index = heapq.heappop(heap)
+            if distance > shortest[index]:
+                continue
+            for i in range(self._indptr[index], self._indptr[index + 1]):
+                dest_index = self._indices[i]
+                dest_distance = distance + self._distances[i]
+                if dest_distance < shortest.get(dest_index, math.inf):
+                    shortest[dest_index] = dest_distance
+                    heapq.heappush(heap, (dest_distance, dest_index))
+        return {self.park_ids[index]: x for index, x in shortest.items()}
+
+    def distance(self, origin_id, dest_id):
+        """
+        Returns the driving distance between two parks, if the destination is a neighbor of the origin.
+        :param origin_id: The origin park's place_id.
+        :param dest_id: The destination park's place_id.
+        :return: The distance (in km), or 'N/A' if the destination is not a neighbor.
+        """
+        i = self._edge(origin_id=origin_id, dest_id=dest_id)
+        if i is None:
+            return "N/A"
+        return self._distances[i]
+
+    def duration(self, origin_id, dest_id):
+        """
+        Returns the drive duration between two parks, if the destination is a neighbor of the origin.
+        :param origin_id: The origin park's place_id.
+        :param dest_id: The destination park's place_id.
+        :return: The duration (in hours), or 'N/A' if the destination is not a neighbor.
+        """
+        i = self._edge(origin_id=origin_id, dest_id=dest_id)
+        if i is None:
+            return "N/A"
+        if self._durations is None:
+            return estimate_duration(self._distances[i])
+        return self._durations[i]
+
+    def _edge(self, origin_id, dest_id):
+        """
+        Returns the position of the edge between two parks in the CSR arrays.
+        :return: The position, or None if the destination is not a neighbor of the origin.
+        """
+        index = self._park_id_to_index[origin_id]
+        dest_index = self._park_id_to_index.get(dest_id)
+        if dest_index is None:
+            return None
+        start, end = self._indptr[index], self._indptr[index + 1]
+        # Rows are sorted by index, so a binary search finds the destination.
+        i = bisect_left(self._indices, dest_index, start, end)
+        if i < end and self._indices[i] == dest_index:
+            return i
+        return None
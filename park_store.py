@@ -0,0 +1,120 @@
+# Park attributes, split into a small hot table used by the search, and a cold store read on demand.
+import json
+import mmap
+import os
+
+# Fields the search reads for every candidate park. Everything else is only needed to describe the parks
+# in the final road trip, and is kept in the cold store.
+# rating, popularity and national_park are the inputs of blended_rating, for requests with custom scoring.
+HOT_FIELDS = ("state", "blended_rating", "rating", "popularity", "national_park")
+
+
+class ParkRecord:
+    # __slots__ keeps each of the resident records small.
+    __slots__ = (
+        "index",
+        "state",
+        "blended_rating",
+        "rating",
+        "popularity",
+        "national_park",
+        "cold_offset",
+        "cold_length",
+    )
+
+    def __init__(
+        self,
+        index,
+        state,
+        blended_rating,
+        rating,
+        popularity,
+        national_park,
+        cold_offset,
+        cold_length,
+    ):
+        self.index = index  # A small, stable integer index, for compact keys.
+        self.state = state
+        self.blended_rating = blended_rating
+        self.rating = rating  # The average google rating.
+        self.popularity = popularity  # From 0 (fewest reviews) to 1 (most reviews).
+        self.national_park = national_park
+        # Where the park's cold attributes are in the cold store.
+        self.cold_offset = cold_offset
+        self.cold_length = cold_length
+
+
+def write_park_store(park_info, data_dir="data"):
+    """
+    Offline. Split the park info into data/park_hot.json and data/park_cold.jsonl.
+    Files are written under a temporary name and then replaced, since serving workers may have the old
+    cold store memory-mapped.
+    :param park_info: A dict of park place_id to park info, as in data/park_id_to_park_info.json.
+    :param data_dir: The directory to write the files to.
+    :return: None
+    """
+    cold_file_name = os.path.join(data_dir, "park_cold.jsonl")
+    hot_file_name = os.path.join(data_dir, "park_hot.json")
+    hot_parks = {}
+    with open(f"{cold_file_name}.tmp", "wb") as fp:
+        for place_id in sorted(park_info):
+            info = park_info[place_id]
+            cold_info = {k: v for k, v in info.items() if k not in HOT_FIELDS}
+            line = (json.dumps(cold_info) + "\n").encode()
+            hot_parks[place_id] = [info[k] for k in HOT_FIELDS] + [
+                fp.tell(),
+                len(line),
+            ]
+            fp.write(line)
+    with open(f"{hot_file_name}.tmp", "w") as fp:
+        json.dump({"fields": list(HOT_FIELDS), "parks": hot_parks}, fp)
+    os.replace(f"{cold_file_name}.tmp", cold_file_name)
+    os.replace(f"{hot_file_name}.tmp", hot_file_name)
+
+
+def read_park_records(hot_data):
+    """
+    Build the hot park records from the contents of data/park_hot.json.
+    :param hot_data: The parsed park_hot.json.
+    :return: A dict of park place_id to ParkRecord.
+    """
+    fields = hot_data["fields"]
+    return {
+        place_id: ParkRecord(
+            index=index,
+            cold_offset=values[-2],
+            cold_length=values[-1],
+            **{field: values[i] for i, field in enumerate(fields)},
+        )
+        for index, (place_id, values) in enumerate(sorted(hot_data["parks"].items()))
+    }
+
+
+class ColdParkStore:
+    def __init__(self, file_name):
+        """
+        Memory-map the cold store. Pages are only read in when a park is described, so the store does
+        not add to the resident memory of the worker.
+        :param file_name: The path to data/park_cold.jsonl.
+        """
+        with open(file_name, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def get(self, record):
+        """
+        Read a park's cold attributes.
+        :param record: The park's ParkRecord.
+        :return: A dictionary of the park's cold attributes, such as name, photos and description.
+        """
+        return json.loads(
+            self._mmap[record.cold_offset : record.cold_offset + record.cold_length]
+        )
+
+    def blocks(self, block_size=1 << 16):
+        """
+        Read the whole store, in blocks.
+        :param block_size: The size of each block (in bytes).
+        :return: A generator of bytes blocks.
+        """
+        for offset in range(0, len(self._mmap), block_size):
+            yield self._mmap[offset : offset + block_size]
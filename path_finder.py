@@ -1,35 +1,179 @@
+import math
 import random
+import sys
+from collections import namedtuple
+from itertools import combinations
 
 from lookup import Lookup
+from park_graph import haversine_km
+from photo_variants import PHOTO_URL_PREFIX
+from scoring import DEFAULT_SCORING, park_value
+from search_cache import pareto_cache
+
+# The most must-visit parks a road trip can have. Their bounds are computed for every subset of them.
+MAX_MUST_VISIT = 6
+# How many partial road trips the must-visit search may expand before it gives up.
+MAX_MUST_VISIT_EXPANSIONS = 500
+# The must-visit search starts over this many times, each with its share of the expansions, so one
+# unlucky early choice can't use up all of them.
+MUST_VISIT_RESTARTS = 5
+# Road trips with at least this much distance to search (in km) are first planned over the regional park
+# clusters, then over the parks of each cluster in turn.
+CLUSTER_PLAN_MIN_DISTANCE = 5000
+
+# A daily driving cap: at most max_daily_km driven each day, and optionally at most days days (None for no
+# limit on the number of days).
+DailyLimit = namedtuple("DailyLimit", ["max_daily_km", "days"])
+# Where a road trip with a daily driving cap is in its schedule: the day (from 1), and the distance already
+# driven that day.
+Schedule = namedtuple("Schedule", ["day", "day_distance"])
+FIRST_DAY = Schedule(day=1, day_distance=0)
+
+
+# One hop of a road trip with a daily driving cap: the Schedule on arriving, the distance and duration driven,
+# and the place_id of the city stayed in overnight on the way (None if the hop is driven the same day).
+DailyHop = namedtuple("DailyHop", ["schedule", "distance", "duration", "overnight"])
+
+
+# A partial road trip in the Pareto search, stored as a linked list of hops so that continuations
+# can be shared between labels. place_id is the next stop, hop_distance the distance to reach it,
+# and rest the label for the remainder of the trip (None once the trip reaches a city).
+ParetoLabel = namedtuple(
+    "ParetoLabel",
+    ["distance", "rating", "num_parks", "place_id", "hop_distance", "rest"],
+)
+
+
+# The memory used by one hop of a ParetoLabel: the tuple, its floats and its number of parks.
+# place_ids are shared with the dataset, so they are not counted.
+_LABEL_BYTES = (
+    sys.getsizeof(ParetoLabel(0.0, 0.0, 0, "", 0.0, None))
+    + 3 * sys.getsizeof(0.0)
+    + sys.getsizeof(0)
+)
+
+
+def _labels_size(labels):
+    """
+    Estimate the memory used by a tuple of ParetoLabels, counting every hop of every label. Hops shared
+    between labels are counted once per label, so this is an upper bound.
+    :param labels: A tuple of ParetoLabels.
+    :return: The estimated size, in bytes.
+    """
+    hops = sum(label.num_parks + 1 for label in labels)
+    return sys.getsizeof(labels) + hops * _LABEL_BYTES
+
+
+def _pareto_entry_size(key, labels, cost):
+    """
+    Estimate the memory used by a Pareto front in the search cache. Park indices and the search settings
+    are shared with other entries, so only the tuples that hold them are counted.
+    :param key: The memo key, as built by PathFinder._pareto_suffixes.
+    :param labels: A tuple of ParetoLabels.
+    :param cost: The number of expansions stored with the front.
+    :return: The estimated size, in bytes.
+    """
+    park_index, budget, parks_in_reach, signature = key
+    return (
+        sys.getsizeof(key)
+        + sys.getsizeof(budget)
+        + sys.getsizeof(parks_in_reach)
+        + sys.getsizeof(signature)
+        + sys.getsizeof(signature[1])
+        + sys.getsizeof((labels, cost))
+        + sys.getsizeof(cost)
+        + _labels_size(labels)
+    )
+
+
+def _label_hops(label):
+    """
+    Iterate over the hops of a ParetoLabel.
+    :param label: A ParetoLabel.
+    :return: A generator of (place_id, distance to reach it) tuples.
+    """
+    while label is not None:
+        yield label.place_id, label.hop_distance
+        label = label.rest
+
+
+class _CachedSearchTooLarge(Exception):
+    """
+    Raised when a Pareto search that reads the shared cache might have run out of expansions without it.
+    The search is then repeated without reading the cache, so its result never depends on the cache.
+    """
 
 
 class PathFinder:
-    def __init__(self):
-        self.lookup = Lookup()
+    def __init__(self, lookup=None, search_cache=pareto_cache, seed=None, scoring=None):
+        # The dataset is expensive to load, so it can be shared between PathFinders.
+        self.lookup = Lookup() if lookup is None else lookup
+        # A Scoring to rank the suggestions with. None (or the default scoring) uses the precomputed lists.
+        self.scoring = None if scoring == DEFAULT_SCORING else scoring
+        # Each PathFinder has its own random generator, so a seeded road trip is reproducible even when
+        # other requests are running in the same worker.
+        self.random = random.Random(seed)
+        # Memo table of best continuations for the Pareto search, shared across requests.
+        self.search_cache = search_cache
         self.path = []  # List of road trip place_ids, starting and ending with cities.
         self.distances = []  # Distances travelled between each two points on the path.
+        self.days = (
+            []
+        )  # The day each place on the path is reached, if the trip has a daily driving cap.
+        self.overnight_stops = (
+            []
+        )  # The city stayed in the night before reaching each place on the path (or None), as for days.
+        self.pareto_paths = (
+            []
+        )  # List of (path, distances) tuples found by the Pareto search.
+        self.error_msg = None  # Why no road trip was found, if the search can say more than return_path.
 
     def filter_suggestions_on_distance(
-        self, place_id, distance_remaining, suggestions, num_suggestions, from_city
+        self,
+        place_id,
+        distance_remaining,
+        suggestions,
+        num_suggestions,
+        from_city,
+        end_city_distances=None,
+        hours_remaining=None,
+        end_city_durations=None,
     ):
         """
-        Return a filtered list of suggestions that meet the distance constraint.
+        Return a filtered list of suggestions that meet the distance (and time) constraints.
         :param place_id: The city or park origin place_id.
         :param distance_remaining: the max distance on the trip
         :param suggestions: the unfiltered list of potential destinations.
         :param num_suggestions: max number of suggestions in the filtered list.
         :param from_city: True if we start from a city, False if start from park.
+        :param end_city_distances: Optional row of park place_id to distance to the chosen end city.
+        :param hours_remaining: Optional. The max drive duration remaining on the trip (in hours).
+        :param end_city_durations: Optional row of park place_id to duration to the chosen end city.
         :return: A filtered list of suggestions.
         """
         # Now take the top num_suggestions of parks that satisfy the distance constraint.
         parks_found = 0
         top_suggestions = []
         for park_id in suggestions:
-            if self.is_next_park_within_distance(
-                distance_remaining=distance_remaining,
+            legs = self._leg_distances(
                 origin_id=place_id,
                 dest_id=park_id,
                 from_city=from_city,
+                end_city_distances=end_city_distances,
+            )
+            if (
+                legs is not None
+                and legs[0] + legs[1] <= distance_remaining
+                and (
+                    hours_remaining is None
+                    or self.is_next_park_within_hours(
+                        hours_remaining=hours_remaining,
+                        origin_id=place_id,
+                        dest_id=park_id,
+                        from_city=from_city,
+                        end_city_durations=end_city_durations,
+                    )
+                )
             ):
                 top_suggestions.append(park_id)
                 parks_found += 1
@@ -37,32 +181,85 @@ class PathFinder:
                     break
         return top_suggestions
 
+    def _leg_distances(self, origin_id, dest_id, from_city, end_city_distances=None):
+        """
+        Returns the distances of the two legs checked by is_next_park_within_distance.
+        :param origin_id: The place_id of the current park.
+        :param dest_id: The place_id of the prospective next park.
+        :param from_city: True if the origin is a city, False if it is a park.
+        :param end_city_distances: Optional row of park place_id to distance to the chosen end city.
+        :return: A tuple of (distance to the next park, distance from it to the end of the trip), or None if
+                    the end of the trip can not be reached from the next park.
+        """
+        if end_city_distances is None:
+            distance_from_next_park_to_city = self.lookup.distance_to_nearest_city(
+                dest_id
+            )
+        else:
+            distance_from_next_park_to_city = end_city_distances[dest_id]
+        if distance_from_next_park_to_city == "N/A":
+            # The end of the trip can not be reached from this park.
+            return None
+        if from_city:
+            distance_to_next_park = self.lookup.distance_from_city_to_park(
+                origin_id, dest_id
+            )
+        else:
+            distance_to_next_park = self.lookup.distance_from_park_to_park(
+                origin_id, dest_id
+            )
+        return distance_to_next_park, distance_from_next_park_to_city
+
     def is_next_park_within_distance(
-        self, distance_remaining, origin_id, dest_id, from_city
+        self, distance_remaining, origin_id, dest_id, from_city, end_city_distances=None
     ):
         """
         We want to see if we can visit the next park while satisfying distance constraints.
         In order to be possible, it must be possible to drive to the next destination, and
         then from the next destination to a major city within distance_remaining.
+        If an end city was chosen, it must be possible to reach that city instead.
         :param distance_remaining: The max. distance that is remaining on the road trip.
         :param origin_id: The place_id of the current park.
         :param dest_id: The place_id of the prospective next park.
         :param from_city: True if the origin is a city, False if it is a park.
+        :param end_city_distances: Optional row of park place_id to distance to the chosen end city.
         :return: True if possible, False if not.
         """
+        legs = self._leg_distances(
+            origin_id=origin_id,
+            dest_id=dest_id,
+            from_city=from_city,
+            end_city_distances=end_city_distances,
+        )
+        return legs is not None and legs[0] + legs[1] <= distance_remaining
+
+    def is_next_park_within_hours(
+        self, hours_remaining, origin_id, dest_id, from_city, end_city_durations=None
+    ):
+        """
+        The same check as is_next_park_within_distance, against the drive duration remaining.
+        :param hours_remaining: The max. drive duration that is remaining on the road trip (in hours).
+        :param origin_id: The place_id of the current park.
+        :param dest_id: The place_id of the prospective next park.
+        :param from_city: True if the origin is a city, False if it is a park.
+        :param end_city_durations: Optional row of park place_id to duration to the chosen end city.
+        :return: True if possible, False if not.
+        """
+        if end_city_durations is None:
+            hours_from_next_park_to_city = self.lookup.duration_to_nearest_city(dest_id)
+        else:
+            hours_from_next_park_to_city = end_city_durations[dest_id]
+        if hours_from_next_park_to_city == "N/A":
+            return False
         if from_city:
-            distance_to_next_park = self.lookup.distance_from_city_to_park(
+            hours_to_next_park = self.lookup.duration_from_city_to_park(
                 origin_id, dest_id
             )
         else:
-            distance_to_next_park = self.lookup.distance_from_park_to_park(
+            hours_to_next_park = self.lookup.duration_from_park_to_park(
                 origin_id, dest_id
             )
-        distance_from_next_park_to_city = self.lookup.distance_to_nearest_city(dest_id)
-        return (
-            distance_to_next_park + distance_from_next_park_to_city
-            <= distance_remaining
-        )
+        return hours_to_next_park + hours_from_next_park_to_city <= hours_remaining
 
     def select_park_from_list(self, parks, randomly=False):
         """
@@ -73,7 +270,7 @@ class PathFinder:
         :return: The park id of the selected place.
         """
         if randomly:
-            return random.choice(parks)
+            return self.random.choice(parks)
         # Given that the sum of the infinite series 1/2 + 1/4 + 1/8... = 1,
         # we assign each park a probability of 1/(2^i), where i is its position in the array (starting from 1).
         # For any remaining probability, we add it to the first park.
@@ -83,9 +280,22 @@ class PathFinder:
             probability_weights.append(1 / 2 ** (i + 1))
         probability_weights[0] += 1 - sum(probability_weights)
         weights = tuple(probability_weights)
-        selected_park = random.choices(parks, weights=weights, k=1)
+        selected_park = self.random.choices(parks, weights=weights, k=1)
         return selected_park[0]
 
+    def park_rating(self, place_id):
+        """
+        Returns the value of visiting a park, which the Pareto search sums over a road trip.
+        :param place_id: The place_id of the park.
+        :return: The park's blended_rating, or its value under the custom scoring.
+        """
+        if self.scoring is None:
+            return self.lookup.lookup_park_blended_rating(place_id=place_id)
+        return park_value(
+            record=self.lookup.lookup_park_record(place_id=place_id),
+            scoring=self.scoring,
+        )
+
     def suggest_next_locations_from_park(
         self,
         place_id,
@@ -93,65 +303,166 @@ class PathFinder:
         distance_remaining,
         num_suggestions,
         unvisitable_states,
+        end_city_id=None,
+        end_city_distances=None,
+        hours_remaining=None,
+        end_city_durations=None,
+        allowed_parks=None,
+        schedule=None,
+        daily_limit=None,
     ):
         """
         Suggest a list of num_suggestions next parks to visit.
-        If no parks are possible, then return the nearest city instead.
+        If no parks are possible, then return the nearest city (or the chosen end city) instead.
         :param place_id: The place_id of the current park.
         :param unvisitable_parks: A set of parks that have been visited/eliminated already, for being too close.
         :param distance_remaining: The remaining distance on the road trip.
         :param num_suggestions: How many suggestions to return.
         :param unvisitable_states: A set of states that have been visited already.
+        :param end_city_id: Optional place_id of the city the trip must end in.
+        :param end_city_distances: Optional row of park place_id to distance to the end city.
+        :param hours_remaining: Optional. The remaining drive duration on the road trip (in hours).
+        :param end_city_durations: Optional row of park place_id to duration to the end city.
+        :param allowed_parks: Optional. A set of the only parks that may be suggested.
+        :param schedule: Optional. The Schedule so far, if the trip has a daily driving cap.
+        :param daily_limit: Optional. The DailyLimit of the road trip, as in iter_path.
         :return: A dictionary with key either as "parks" or "city", and the value as a list of suggestions that
-                    are returned, or a dict with the city name and distance if no parks are possible.
+                    are returned, or a dict with the city name, distance and duration if no parks are possible.
         """
         # Get the suggested parks.
-        suggestions = self.lookup.suggestions_from_park(park_id=place_id)
-        # Filter out the ones that are in the set of unvisitable parks, or states.
+        if self.scoring is None:
+            suggestions = self.lookup.suggestions_from_park(park_id=place_id)
+        else:
+            suggestions = self.lookup.suggestion_ranker().suggestions_from_park(
+                park_id=place_id, scoring=self.scoring, num_suggestions=num_suggestions
+            )
+        # Filter out the ones that are in the set of unvisitable parks, or states. The filters are lazy, so
+        # suggestions past the first num_suggestions that fit are never looked at.
         parks_too_close = set(self.lookup.parks_too_close_to_park_id(park_id=place_id))
         all_unvisitable_parks = unvisitable_parks.union(parks_too_close)
-        suggestions = [x for x in suggestions if x not in all_unvisitable_parks]
-        suggestions = [
+        suggestions = (x for x in suggestions if x not in all_unvisitable_parks)
+        if allowed_parks is not None:
+            suggestions = (x for x in suggestions if x in allowed_parks)
+        suggestions = (
             x
             for x in suggestions
             if (self.lookup.lookup_park_state(place_id=x)) not in unvisitable_states
-        ]
+        )
+        if daily_limit is not None:
+            suggestions = (
+                x
+                for x in suggestions
+                if self._fits_daily_limit(
+                    schedule=schedule,
+                    origin_id=place_id,
+                    dest_id=x,
+                    from_city=False,
+                    daily_limit=daily_limit,
+                    distance_remaining=distance_remaining,
+                    hours_remaining=hours_remaining,
+                    end_city_id=end_city_id,
+                    end_city_distances=end_city_distances,
+                )
+            )
         top_suggestions = self.filter_suggestions_on_distance(
             place_id=place_id,
             distance_remaining=distance_remaining,
             suggestions=suggestions,
             num_suggestions=num_suggestions,
             from_city=False,
+            end_city_distances=end_city_distances,
+            hours_remaining=hours_remaining,
+            end_city_durations=end_city_durations,
         )
         if top_suggestions:
             # We found at least one park.
             return {"parks": top_suggestions}
+        elif end_city_id is not None:
+            info = {
+                "name": self.lookup.lookup_city_name(place_id=end_city_id),
+                "distance": end_city_distances[place_id],
+                "duration": self.lookup.duration_from_city_to_park(
+                    city_id=end_city_id, park_id=place_id
+                ),
+            }
+            return {"city": info}
         else:
             nearest_city_name = self.lookup.nearest_city_name(place_id=place_id)
             distance_to_nearest_city = self.lookup.distance_to_nearest_city(
                 place_id=place_id
             )
-            info = {"name": nearest_city_name, "distance": distance_to_nearest_city}
+            info = {
+                "name": nearest_city_name,
+                "distance": distance_to_nearest_city,
+                "duration": self.lookup.duration_to_nearest_city(place_id=place_id),
+            }
             return {"city": info}
 
     def suggest_next_locations_from_city(
-        self, city_name, distance_remaining, num_suggestions
+        self,
+        city_name,
+        distance_remaining,
+        num_suggestions,
+        end_city_distances=None,
+        hours_remaining=None,
+        end_city_durations=None,
+        unvisitable_parks=frozenset(),
+        allowed_parks=None,
+        end_city_id=None,
+        schedule=None,
+        daily_limit=None,
     ):
         """
         Suggest a list of max num_suggestions parks to visit.
         :param city_name: The name of the starting city.
         :param distance_remaining: The maximum distance.
         :param num_suggestions: The maximum number of suggestions to return.
+        :param end_city_distances: Optional row of park place_id to distance to the chosen end city.
+        :param hours_remaining: Optional. The maximum drive duration (in hours).
+        :param end_city_durations: Optional row of park place_id to duration to the chosen end city.
+        :param unvisitable_parks: Optional. A set of parks that must not be suggested.
+        :param allowed_parks: Optional. A set of the only parks that may be suggested.
+        :param end_city_id: Optional place_id of the chosen end city.
+        :param schedule: Optional. The Schedule so far, if the trip has a daily driving cap.
+        :param daily_limit: Optional. The DailyLimit of the road trip, as in iter_path.
         :return: A dictionary with key of either "parks", or "error" if no parks were found.
         """
         city_id = self.lookup.lookup_city_id(city_name=city_name)
-        suggestions = self.lookup.suggestions_from_city(city_id=city_id)
+        if self.scoring is None:
+            suggestions = self.lookup.suggestions_from_city(city_id=city_id)
+        else:
+            suggestions = self.lookup.suggestion_ranker().suggestions_from_city(
+                city_id=city_id, scoring=self.scoring, num_suggestions=num_suggestions
+            )
+        if unvisitable_parks:
+            suggestions = (x for x in suggestions if x not in unvisitable_parks)
+        if allowed_parks is not None:
+            suggestions = (x for x in suggestions if x in allowed_parks)
+        if daily_limit is not None:
+            suggestions = (
+                x
+                for x in suggestions
+                if self._fits_daily_limit(
+                    schedule=schedule,
+                    origin_id=city_id,
+                    dest_id=x,
+                    from_city=True,
+                    daily_limit=daily_limit,
+                    distance_remaining=distance_remaining,
+                    hours_remaining=hours_remaining,
+                    end_city_id=end_city_id,
+                    end_city_distances=end_city_distances,
+                )
+            )
         top_suggestions = self.filter_suggestions_on_distance(
             place_id=city_id,
             distance_remaining=distance_remaining,
             suggestions=suggestions,
             num_suggestions=num_suggestions,
             from_city=True,
+            end_city_distances=end_city_distances,
+            hours_remaining=hours_remaining,
+            end_city_durations=end_city_durations,
         )
         if top_suggestions:
             return {"parks": top_suggestions}
@@ -163,93 +474,1394 @@ class PathFinder:
     def reset_data(self):
         self.path = []
         self.distances = []
+        self.days = []
+        self.overnight_stops = []
+        self.pareto_paths = []
+        self.error_msg = None
 
-    def generate_path(self, starting_city, max_distance, num_suggestions=5):
+    def generate_path(
+        self,
+        starting_city,
+        max_distance=None,
+        num_suggestions=5,
+        end_city=None,
+        max_hours=None,
+        kept_parks=(),
+        daily_limit=None,
+        excluded_parks=(),
+    ):
         """
         Given a starting city and a path, generate a suggested road trip.
         :param starting_city: The name of the starting city.
+        :param max_distance: The max driving distance for the road trip. Optional if max_hours is given.
+        :param num_suggestions: The max number of suggestions to return each time.
+        :param end_city: Optional name of the city to end in. If None, end at the city nearest the last park.
+        :param max_hours: Optional. The max drive duration for the road trip (in hours).
+        :param kept_parks: Optional. place_ids of the first parks to visit, as in iter_path.
+        :param daily_limit: Optional. A DailyLimit, as in iter_path.
+        :param excluded_parks: Optional. place_ids of parks that must not be chosen.
+        :return: None. Store the path in self.path
+        """
+        for _ in self.iter_path(
+            starting_city=starting_city,
+            max_distance=max_distance,
+            num_suggestions=num_suggestions,
+            end_city=end_city,
+            max_hours=max_hours,
+            kept_parks=kept_parks,
+            daily_limit=daily_limit,
+            excluded_parks=excluded_parks,
+        ):
+            pass
+
+    def _must_visit_bounds(self, must_visit, end_city_distances=None):
+        """
+        Precompute lower bounds on the distance still needed to visit the must-visit parks and then end the
+        trip. Driving distances are shortest routes, so driving between two places via other parks is never
+        shorter than driving there directly. Where the park graph has no direct route, the straight-line
+        distance is used instead.
+        :param must_visit: A set of park place_ids.
+        :param end_city_distances: Optional row of park place_id to distance to the end city.
+        :return: A function of (place_id, True if it is a city, frozenset of must-visit parks still to visit)
+                    to the bound. The bound is infinite if the parks can't end the trip in a city.
+        """
+        coordinates = {}
+
+        def place_coordinates(place_id, is_city):
+            if place_id not in coordinates:
+                if is_city:
+                    coordinates[place_id] = self.lookup.lookup_city_geocoordinates(
+                        city_name=self.lookup.lookup_city_name(place_id=place_id)
+                    )
+                else:
+                    coordinates[place_id] = self.lookup.lookup_park_geocoordinates(
+                        place_id=place_id
+                    )
+            return coordinates[place_id]
+
+        def hop(place_id, is_city, park_id):
+            if is_city:
+                distance = self.lookup.distance_from_city_to_park(place_id, park_id)
+            else:
+                distance = self.lookup.distance_from_park_to_park(place_id, park_id)
+            if distance == "N/A":
+                distance = haversine_km(
+                    *place_coordinates(place_id, is_city),
+                    *place_coordinates(park_id, False),
+                )
+            return distance
+
+        # tours[(parks, park)]: the shortest route that starts at park, visits the rest of parks, and then
+        # ends the trip.
+        tours = {}
+        for size in range(1, len(must_visit) + 1):
+            for parks in map(frozenset, combinations(must_visit, size)):
+                for park in parks:
+                    rest = parks - {park}
+                    if rest:
+                        tours[parks, park] = min(
+                            hop(park, False, x) + tours[rest, x] for x in rest
+                        )
+                    else:
+                        if end_city_distances is not None:
+                            distance = end_city_distances[park]
+                        else:
+                            distance = self.lookup.distance_to_nearest_city(park)
+                        tours[parks, park] = math.inf if distance == "N/A" else distance
+
+        bounds = {}
+
+        def bound(place_id, is_city, outstanding):
+            key = (place_id, outstanding)
+            if key not in bounds:
+                bounds[key] = min(
+                    hop(place_id, is_city, x) + tours[outstanding, x]
+                    for x in outstanding
+                )
+            return bounds[key]
+
+        return bound
+
+    def _must_visit_candidates(
+        self, place_id, from_city, distance_remaining, outstanding, visited, search
+    ):
+        """
+        Returns the next parks a must-visit road trip could go to: the top suggestions, and the must-visit
+        parks still to visit, that leave enough distance for the rest of the must-visit parks and the end.
+        Must-visit parks may be chosen even if they are close to a visited park, or in a visited state.
+        :param place_id: The place_id of the current city or park.
+        :param from_city: True if the current place is the starting city.
+        :param distance_remaining: The remaining distance on the road trip.
+        :param outstanding: A frozenset of the must-visit parks still to visit.
+        :param visited: A tuple of (unvisitable parks, unvisitable states), as in iter_path.
+        :param search: A dict with the settings of the search.
+        :return: A list of (place_id, distance to reach it) tuples.
+        """
+        unvisitable_parks, unvisitable_states = visited
+        if from_city:
+            hop_distance = lambda x: self.lookup.distance_from_city_to_park(place_id, x)
+        else:
+            hop_distance = lambda x: self.lookup.distance_from_park_to_park(place_id, x)
+
+        def fits(park_id):
+            distance = hop_distance(park_id)
+            if distance == "N/A":
+                return None
+            rest = outstanding - {park_id}
+            if rest:
+                needed = search["bound"](park_id, False, rest)
+            elif search["end_city_distances"] is not None:
+                needed = search["end_city_distances"][park_id]
+            else:
+                needed = self.lookup.distance_to_nearest_city(park_id)
+            if needed == "N/A" or distance + needed > distance_remaining:
+                return None
+            return distance
+
+        if self.scoring is not None:
+            ranker = self.lookup.suggestion_ranker()
+            if from_city:
+                suggestions = ranker.suggestions_from_city(
+                    city_id=place_id,
+                    scoring=self.scoring,
+                    num_suggestions=search["num_suggestions"],
+                )
+            else:
+                suggestions = ranker.suggestions_from_park(
+                    park_id=place_id,
+                    scoring=self.scoring,
+                    num_suggestions=search["num_suggestions"],
+                )
+        elif from_city:
+            suggestions = self.lookup.suggestions_from_city(city_id=place_id)
+        else:
+            suggestions = self.lookup.suggestions_from_park(park_id=place_id)
+        if not from_city:
+            unvisitable_parks = unvisitable_parks.union(
+                self.lookup.parks_too_close_to_park_id(park_id=place_id)
+            )
+        candidates = []
+        for park_id in suggestions:
+            if (
+                park_id in outstanding
+                or park_id in unvisitable_parks
+                or self.lookup.lookup_park_state(place_id=park_id) in unvisitable_states
+            ):
+                continue
+            distance = fits(park_id)
+            if distance is not None:
+                candidates.append((park_id, distance))
+                if len(candidates) >= search["num_suggestions"]:
+                    break
+        for park_id in sorted(outstanding):
+            distance = fits(park_id)
+            if distance is not None:
+                candidates.append((park_id, distance))
+        return candidates
+
+    def _must_visit_hops(
+        self,
+        place_id,
+        from_city,
+        distance_remaining,
+        outstanding,
+        visited,
+        current_state,
+        search,
+    ):
+        """
+        Depth-first search for the hops that visit every must-visit park, choosing among the candidates at
+        random like the random walk, and backtracking from dead ends. The candidates depend on the distance
+        remaining and on the visited parks and states, so a dead end is only skipped when the search reaches
+        it again in exactly the same state.
+        :param place_id: The place_id of the current city or park.
+        :param from_city: True if the current place is the starting city.
+        :param distance_remaining: The remaining distance on the road trip.
+        :param outstanding: A frozenset of the must-visit parks still to visit.
+        :param visited: A tuple of (unvisitable parks, unvisitable states), as in iter_path.
+        :param current_state: The state of the current park, or None at the starting city.
+        :param search: A dict with the settings of the search, the number of expansions, and the set of dead
+                        ends.
+        :return: A list of park place_ids that ends with the last must-visit park, or None if there is none
+                    (or the search ran out of expansions).
+        """
+        if not outstanding:
+            return []
+        key = (place_id, distance_remaining, outstanding, visited, current_state)
+        if key in search["dead_ends"]:
+            return None
+        search["expansions"] += 1
+        if search["expansions"] > search["max_expansions"]:
+            return None
+        candidates = self._must_visit_candidates(
+            place_id=place_id,
+            from_city=from_city,
+            distance_remaining=distance_remaining,
+            outstanding=outstanding,
+            visited=visited,
+            search=search,
+        )
+        self.random.shuffle(candidates)
+        unvisitable_parks, unvisitable_states = visited
+        if not from_city:
+            # The same updates as when the random walk leaves a park.
+            unvisitable_parks = unvisitable_parks.union(
+                self.lookup.parks_too_close_to_park_id(park_id=place_id), [place_id]
+            )
+        for park_id, distance in candidates:
+            next_state = self.lookup.lookup_park_state(place_id=park_id)
+            next_unvisitable_states = unvisitable_states
+            if current_state is not None and next_state != current_state:
+                next_unvisitable_states = unvisitable_states.union([current_state])
+            hops = self._must_visit_hops(
+                place_id=park_id,
+                from_city=False,
+                distance_remaining=distance_remaining - distance,
+                outstanding=outstanding - {park_id},
+                visited=(unvisitable_parks, next_unvisitable_states),
+                current_state=next_state,
+                search=search,
+            )
+            if hops is not None:
+                return [park_id] + hops
+        if search["expansions"] <= search["max_expansions"]:
+            # Only a search that was not cut short shows the state is a dead end.
+            search["dead_ends"].add(key)
+        return None
+
+    def plan_must_visit_parks(
+        self,
+        starting_city,
+        must_visit,
+        max_distance,
+        num_suggestions=5,
+        end_city=None,
+        kept_parks=(),
+        excluded_parks=(),
+    ):
+        """
+        Search the first parks of a random road trip that visits every must-visit park, up to the last
+        must-visit park, pruning the partial trips that can't visit the rest of them within max_distance.
+        :param starting_city: The name of the starting city.
+        :param must_visit: A list of place_ids of the parks the road trip must visit.
+        :param max_distance: The max driving distance for the road trip.
+        :param num_suggestions: The max number of suggestions to choose from each time.
+        :param end_city: Optional name of the city to end in. If None, end at the city nearest the last park.
+        :param kept_parks: Optional. place_ids of the first parks to visit, in order, as in iter_path. The
+                            search continues after them.
+        :param excluded_parks: Optional. place_ids of parks that must not be chosen.
+        :return: A list of place_ids of the first parks, starting with kept_parks, to pass to iter_path as
+                    its kept_parks. None if no road trip was found, with the reason in self.error_msg.
+        """
+        must_visit = frozenset(must_visit)
+        if len(must_visit) > MAX_MUST_VISIT:
+            raise ValueError(f"At most {MAX_MUST_VISIT} must-visit parks are allowed.")
+        if must_visit & set(excluded_parks):
+            raise ValueError("A must-visit park can't be excluded.")
+        starting_city_id = self.lookup.lookup_city_id(city_name=starting_city)
+        end_city_distances = None
+        if end_city is not None:
+            end_city_id = self.lookup.lookup_city_id(city_name=end_city)
+            end_city_distances = self.lookup.distances_to_city(city_id=end_city_id)
+        # Visit the kept parks as iter_path does, to start the search where they end.
+        place_id, from_city = starting_city_id, True
+        distance_remaining = max_distance
+        unvisitable_parks = set(excluded_parks)
+        unvisitable_states = set()
+        current_state = None
+        for park_id in kept_parks:
+            if from_city:
+                distance = self.lookup.distance_from_city_to_park(place_id, park_id)
+            else:
+                distance = self.lookup.distance_from_park_to_park(place_id, park_id)
+                unvisitable_parks.update(
+                    self.lookup.parks_too_close_to_park_id(park_id=place_id)
+                )
+                unvisitable_parks.add(place_id)
+            if distance == "N/A":
+                raise ValueError(f"There is no route to the kept park {park_id}.")
+            state = self.lookup.lookup_park_state(place_id=park_id)
+            if current_state is not None and state != current_state:
+                unvisitable_states.add(current_state)
+            current_state = state
+            distance_remaining -= distance
+            place_id, from_city = park_id, False
+        outstanding = must_visit.difference(kept_parks)
+        search = {
+            "bound": self._must_visit_bounds(
+                must_visit=outstanding, end_city_distances=end_city_distances
+            ),
+            "end_city_distances": end_city_distances,
+            "num_suggestions": num_suggestions,
+            "expansions": 0,
+            "max_expansions": MAX_MUST_VISIT_EXPANSIONS // MUST_VISIT_RESTARTS,
+            "dead_ends": set(),
+        }
+        if outstanding and (
+            search["bound"](place_id, from_city, outstanding) > distance_remaining
+        ):
+            raise ValueError(
+                "The must-visit parks can't all be visited within max_distance."
+            )
+        for _ in range(MUST_VISIT_RESTARTS):
+            # The dead ends found so far are kept, so each restart searches less.
+            search["expansions"] = 0
+            hops = self._must_visit_hops(
+                place_id=place_id,
+                from_city=from_city,
+                distance_remaining=distance_remaining,
+                outstanding=outstanding,
+                visited=(frozenset(unvisitable_parks), frozenset(unvisitable_states)),
+                current_state=current_state,
+                search=search,
+            )
+            if hops is not None:
+                break
+        if hops is None:
+            self.error_msg = "No road trip could visit every must-visit park."
+            return None
+        return list(kept_parks) + hops
+
+    def generate_must_visit_path(
+        self,
+        starting_city,
+        must_visit,
+        max_distance,
+        num_suggestions=5,
+        end_city=None,
+        kept_parks=(),
+        excluded_parks=(),
+    ):
+        """
+        Generate a random road trip that visits every must-visit park. The trip is searched until the last
+        must-visit park, as in plan_must_visit_parks, and then continues as a random walk.
+        :param starting_city: The name of the starting city.
+        :param must_visit: A list of place_ids of the parks the road trip must visit.
         :param max_distance: The max driving distance for the road trip.
+        :param num_suggestions: The max number of suggestions to choose from each time.
+        :param end_city: Optional name of the city to end in. If None, end at the city nearest the last park.
+        :param kept_parks: Optional. place_ids of the first parks to visit, as in iter_path.
+        :param excluded_parks: Optional. place_ids of parks that must not be chosen.
+        :return: None. Store the path in self.path, which is empty if no road trip was found (with the reason
+                    in self.error_msg).
+        """
+        self.reset_data()
+        kept_parks = self.plan_must_visit_parks(
+            starting_city=starting_city,
+            must_visit=must_visit,
+            max_distance=max_distance,
+            num_suggestions=num_suggestions,
+            end_city=end_city,
+            kept_parks=kept_parks,
+            excluded_parks=excluded_parks,
+        )
+        if kept_parks is None:
+            return
+        self.generate_path(
+            starting_city=starting_city,
+            max_distance=max_distance,
+            num_suggestions=num_suggestions,
+            end_city=end_city,
+            kept_parks=kept_parks,
+            excluded_parks=excluded_parks,
+        )
+
+    def replan_path(
+        self,
+        path,
+        index,
+        max_distance=None,
+        num_suggestions=5,
+        end_city=None,
+        max_hours=None,
+        excluded_parks=(),
+        must_visit=(),
+        daily_limit=None,
+    ):
+        """
+        Re-plan a road trip from one of its parks on: the places before it are kept as they are, and the
+        rest of the trip is generated again from the budget that remains, without that park.
+        :param path: The road trip's place_ids, starting and ending with cities, as in self.path.
+        :param index: The position on the path of the first park to change.
+        :param max_distance: The max driving distance for the whole road trip. Optional if max_hours is given.
         :param num_suggestions: The max number of suggestions to return each time.
+        :param end_city: Optional name of the city to end in. If None, end at the city nearest the last park.
+        :param max_hours: Optional. The max drive duration for the whole road trip (in hours).
+        :param excluded_parks: Optional. place_ids of other parks that must not be chosen.
+        :param must_visit: Optional. place_ids of the parks the whole road trip must visit, as in
+                            generate_must_visit_path. Not supported with max_hours or daily_limit.
+        :param daily_limit: Optional. The DailyLimit of the whole road trip, as in iter_path.
         :return: None. Store the path in self.path
         """
+        if not 0 < index < len(path) - 1:
+            raise ValueError("The index must be the position of a park on the path.")
+        starting_city = self.lookup.lookup_city_name(place_id=path[0])
+        excluded_parks = set(excluded_parks) | {path[index]}
+        if must_visit:
+            if max_distance is None or max_hours is not None or daily_limit is not None:
+                raise ValueError(
+                    "must_visit takes max_distance, and not max_hours or max_daily_km."
+                )
+            self.generate_must_visit_path(
+                starting_city=starting_city,
+                must_visit=must_visit,
+                max_distance=max_distance,
+                num_suggestions=num_suggestions,
+                end_city=end_city,
+                kept_parks=path[1:index],
+                excluded_parks=excluded_parks,
+            )
+            return
+        for _ in self.iter_path(
+            starting_city=starting_city,
+            max_distance=max_distance,
+            num_suggestions=num_suggestions,
+            end_city=end_city,
+            max_hours=max_hours,
+            kept_parks=path[1:index],
+            excluded_parks=excluded_parks,
+            daily_limit=daily_limit,
+        ):
+            pass
+
+    def iter_path(
+        self,
+        starting_city,
+        max_distance=None,
+        num_suggestions=5,
+        end_city=None,
+        max_hours=None,
+        kept_parks=(),
+        excluded_parks=(),
+        daily_limit=None,
+    ):
+        """
+        Generate a suggested road trip one hop at a time, yielding each place as soon as it is chosen.
+        The path is also stored in self.path as it grows. If no path is possible, self.path is emptied
+        and the generator stops.
+        :param starting_city: The name of the starting city.
+        :param max_distance: The max driving distance for the road trip. Optional if max_hours is given.
+        :param num_suggestions: The max number of suggestions to return each time.
+        :param end_city: Optional name of the city to end in. If None, end at the city nearest the last park.
+        :param max_hours: Optional. The max drive duration for the road trip (in hours).
+        :param kept_parks: Optional. place_ids of the first parks to visit, in order, as in a trip being
+                            re-planned. The search only chooses the parks after them.
+        :param excluded_parks: Optional. place_ids of parks that must not be chosen.
+        :param daily_limit: Optional. A DailyLimit. Every hop must fit the daily driving cap as in _daily_hop,
+                            stopping for the night in a park's nearest city, and leave enough of the
+                            days (if given) to end the trip. The day each place is reached is stored in
+                            self.days, and the city of the night before in self.overnight_stops.
+                            max_distance defaults to days * max_daily_km.
+        :return: A generator of (place_id, distance to reach it, distance remaining, is_city, duration to
+                    reach it, hours remaining) tuples, starting with the starting city and ending with the
+                    end city. The remaining distance (or hours) is infinite if there is no such limit.
+        """
+        if (
+            max_distance is None
+            and daily_limit is not None
+            and daily_limit.days is not None
+        ):
+            max_distance = daily_limit.days * daily_limit.max_daily_km
+        if max_distance is None and max_hours is None:
+            raise ValueError("Either max_distance or max_hours must be given.")
         self.reset_data()
-        # TODO: Later, support choosing the end city as well.
         starting_city_id = self.lookup.lookup_city_id(city_name=starting_city)
+        end_city_id = None
+        end_city_distances = None
+        end_city_durations = None
+        if end_city is not None:
+            # Read the end city's row once, so every hop can prune parks that can't reach it.
+            end_city_id = self.lookup.lookup_city_id(city_name=end_city)
+            end_city_distances = self.lookup.distances_to_city(city_id=end_city_id)
+            if max_hours is not None:
+                end_city_durations = self.lookup.durations_to_city(city_id=end_city_id)
+        # Without a time budget, the remaining hours are infinite and durations are not checked.
+        time_limited = max_hours is not None
+        if max_distance is None:
+            max_distance = math.inf
+        if max_hours is None:
+            max_hours = math.inf
+        schedule = FIRST_DAY
         self.path.append(starting_city_id)
-        unvisitable_parks = set()
+        if daily_limit is not None:
+            self.days.append(schedule.day)
+            self.overnight_stops.append(None)
+        yield starting_city_id, 0, max_distance, True, 0, max_hours
+        unvisitable_parks = set(excluded_parks)
         unvisitable_states = set()
         initial_suggestion = True
+        kept_parks = iter(kept_parks)
+        # The clusters still to visit, planned at the first hop the search chooses.
+        clusters = self.lookup.park_clusters()
+        cluster_plan = None
 
         # Where we currently are.
         current_place = starting_city
         current_state = None
         # The distance we have remaining.
         distance_remaining = max_distance
+        # The drive duration we have remaining, if the trip has a time budget.
+        hours_remaining = max_hours
 
         while True:
-            if initial_suggestion:
-                suggestions = self.suggest_next_locations_from_city(
-                    city_name=current_place,
-                    distance_remaining=max_distance,
-                    num_suggestions=num_suggestions,
-                )
-            else:
-                suggestions = self.suggest_next_locations_from_park(
-                    place_id=current_place,
-                    unvisitable_parks=unvisitable_parks,
+            # Kept parks are visited without a search, updating the budget and the visited parks and
+            # states as if they had been chosen.
+            next_dest = next(kept_parks, None)
+            kept = next_dest is not None
+            if not kept:
+                hours_budget = hours_remaining if time_limited else None
+                distance_budget = self._distance_budget(
                     distance_remaining=distance_remaining,
-                    num_suggestions=num_suggestions,
-                    unvisitable_states=unvisitable_states,
+                    schedule=schedule,
+                    daily_limit=daily_limit,
                 )
-            if "parks" not in suggestions:
-                # Either no parks were found, or we reached the end city.
+                if cluster_plan is None:
+                    cluster_plan = self._plan_clusters(
+                        place_id=(
+                            starting_city_id if initial_suggestion else current_place
+                        ),
+                        from_city=initial_suggestion,
+                        max_distance=distance_budget,
+                        num_suggestions=num_suggestions,
+                        end_city_id=end_city_id,
+                        end_city_distances=end_city_distances,
+                    )
+                # Search the parks of the current and the next planned cluster first. If none of them fit,
+                # the current cluster is done with, and every park is searched.
+                searches = [None]
+                if cluster_plan:
+                    searches.insert(0, clusters.parks_of(tuple(cluster_plan[:2])))
+                for allowed_parks in searches:
+                    if allowed_parks is None and cluster_plan:
+                        cluster_plan.pop(0)
+                    if initial_suggestion:
+                        suggestions = self.suggest_next_locations_from_city(
+                            city_name=current_place,
+                            distance_remaining=distance_budget,
+                            num_suggestions=num_suggestions,
+                            end_city_distances=end_city_distances,
+                            hours_remaining=hours_budget,
+                            end_city_durations=end_city_durations,
+                            unvisitable_parks=unvisitable_parks,
+                            allowed_parks=allowed_parks,
+                            end_city_id=end_city_id,
+                            schedule=schedule,
+                            daily_limit=daily_limit,
+                        )
+                    else:
+                        suggestions = self.suggest_next_locations_from_park(
+                            place_id=current_place,
+                            unvisitable_parks=unvisitable_parks,
+                            distance_remaining=distance_budget,
+                            num_suggestions=num_suggestions,
+                            unvisitable_states=unvisitable_states,
+                            end_city_id=end_city_id,
+                            end_city_distances=end_city_distances,
+                            hours_remaining=hours_budget,
+                            end_city_durations=end_city_durations,
+                            allowed_parks=allowed_parks,
+                            schedule=schedule,
+                            daily_limit=daily_limit,
+                        )
+                    if "parks" in suggestions:
+                        break
                 if "error" in suggestions:
                     print(suggestions["error"])
                     self.path = []
                     return
-                else:
+                if "city" in suggestions:
                     # We reached the end city.
                     end_city_name = suggestions["city"]["name"]
                     end_city_id = self.lookup.lookup_city_id(city_name=end_city_name)
                     self.path.append(end_city_id)
                     distance = suggestions["city"]["distance"]
+                    duration = suggestions["city"]["duration"]
+                    if daily_limit is not None:
+                        # The search only goes to parks the trip can end after.
+                        schedule, distance, duration, overnight = self._daily_hop(
+                            schedule=schedule,
+                            origin_id=current_place,
+                            dest_id=end_city_id,
+                            distance=distance,
+                            duration=duration,
+                            daily_limit=daily_limit,
+                            to_city=True,
+                        )
+                        self.days.append(schedule.day)
+                        self.overnight_stops.append(overnight)
                     self.distances.append(distance)
+                    distance_remaining -= distance
+                    hours_remaining -= duration
+                    yield (
+                        end_city_id,
+                        distance,
+                        distance_remaining,
+                        True,
+                        duration,
+                        hours_remaining,
+                    )
                     return
+                # Choose a destination in the list off of a given probability function.
+                next_dest = self.select_park_from_list(
+                    parks=suggestions["parks"], randomly=True
+                )
+                # Move the plan on to the cluster of the chosen park, if it is a later one.
+                if cluster_plan and clusters.cluster(next_dest) in cluster_plan[1:]:
+                    del cluster_plan[: cluster_plan.index(clusters.cluster(next_dest))]
+
+            next_dest_state = self.lookup.lookup_park_state(place_id=next_dest)
+            if current_state is None:
+                current_state = next_dest_state
+            self.path.append(next_dest)
+            origin_id = starting_city_id if initial_suggestion else current_place
+            from_city = initial_suggestion
+            if initial_suggestion:
+                distance = self.lookup.distance_from_city_to_park(
+                    city_id=starting_city_id, park_id=next_dest
+                )
+                duration = self.lookup.duration_from_city_to_park(
+                    city_id=starting_city_id, park_id=next_dest
+                )
+                initial_suggestion = False
             else:
-                park_ids = suggestions["parks"]
+                distance = self.lookup.distance_from_park_to_park(
+                    origin_id=current_place, dest_id=next_dest
+                )
+                duration = self.lookup.duration_from_park_to_park(
+                    origin_id=current_place, dest_id=next_dest
+                )
+                # Add the parks nearby to unvisitable parks.
+                too_close_parks = self.lookup.parks_too_close_to_park_id(
+                    park_id=current_place
+                )
+                for park in too_close_parks:
+                    unvisitable_parks.add(park)
+                # Add the current park to unvisitable parks.
+                unvisitable_parks.add(current_place)
+            if distance == "N/A":
+                raise ValueError(f"There is no route to the kept park {next_dest}.")
 
-                # Choose a destination in the list off of a given probability function.
-                next_dest = self.select_park_from_list(parks=park_ids, randomly=True)
-                next_dest_state = self.lookup.lookup_park_state(place_id=next_dest)
-                if current_state is None:
-                    current_state = next_dest_state
-                self.path.append(next_dest)
-                if initial_suggestion:
-                    distance = self.lookup.distance_from_city_to_park(
-                        city_id=starting_city_id, park_id=next_dest
+            if daily_limit is not None:
+                hop = self._daily_hop(
+                    schedule=schedule,
+                    origin_id=origin_id,
+                    dest_id=next_dest,
+                    distance=distance,
+                    duration=duration,
+                    daily_limit=daily_limit,
+                    from_city=from_city,
+                )
+                if hop is None:
+                    # Only kept parks are not searched.
+                    raise ValueError(
+                        f"The kept park {next_dest} can't be reached within max_daily_km."
                     )
-                    initial_suggestion = False
-                else:
-                    distance = self.lookup.distance_from_park_to_park(
-                        origin_id=current_place, dest_id=next_dest
+                schedule, distance, duration, overnight = hop
+                self.days.append(schedule.day)
+                self.overnight_stops.append(overnight)
+            self.distances.append(distance)
+            distance_remaining -= distance
+            hours_remaining -= duration
+            if kept:
+                # Kept parks are not searched, so check that the trip can still end after them.
+                end_distance, end_duration = self._cheapest_end(
+                    place_id=next_dest,
+                    end_city_id=end_city_id,
+                    end_city_distances=end_city_distances,
+                    schedule=schedule,
+                    daily_limit=daily_limit,
+                )
+                distance_budget = self._distance_budget(
+                    distance_remaining=distance_remaining,
+                    schedule=schedule,
+                    daily_limit=daily_limit,
+                )
+                if (
+                    end_distance == "N/A"
+                    or end_distance > distance_budget
+                    or end_duration > hours_remaining
+                ):
+                    raise ValueError(
+                        "The kept parks leave too little of the budget to end the road trip."
+                    )
+            yield (
+                next_dest,
+                distance,
+                distance_remaining,
+                False,
+                duration,
+                hours_remaining,
+            )
+
+            # Set the current place to the next destination park.
+            current_place = next_dest
+            if next_dest_state != current_state:
+                unvisitable_states.add(current_state)
+                current_state = next_dest_state
+
+    def _plan_clusters(
+        self,
+        place_id,
+        from_city,
+        max_distance,
+        num_suggestions,
+        end_city_id=None,
+        end_city_distances=None,
+    ):
+        """
+        Plan the order a long road trip visits the regional park clusters in, from where it is now.
+        :param place_id: The place_id of the current city or park.
+        :param from_city: Whether place_id is a city.
+        :param max_distance: The distance (in km) left to drive.
+        :param num_suggestions: How many of the closest clusters to choose between at each step.
+        :param end_city_id: Optional place_id of the city the trip must end in.
+        :param end_city_distances: Optional row of park place_id to distance to the end city.
+        :return: A list of cluster indexes. Empty if the trip is too short to plan, or the dataset has no
+                    clusters.
+        """
+        clusters = self.lookup.park_clusters()
+        if clusters is None or not CLUSTER_PLAN_MIN_DISTANCE <= max_distance < math.inf:
+            return []
+        if from_city:
+            # Driving distances are treated as symmetric, so the city's row is also the distance from it.
+            start_bounds = clusters.bounds(
+                self.lookup.distances_to_city(city_id=place_id), key=place_id
+            )
+        elif clusters.cluster(place_id) is None:
+            return []
+        else:
+            start_bounds = clusters.bounds_from(clusters.cluster(place_id))
+        if end_city_distances is not None:
+            end_bounds = clusters.bounds(end_city_distances, key=end_city_id)
+        else:
+            end_bounds = clusters.bounds(
+                self.lookup.distances_to_nearest_city(), key="nearest city"
+            )
+        return clusters.plan(
+            start_bounds=start_bounds,
+            end_bounds=end_bounds,
+            max_distance=max_distance,
+            num_suggestions=num_suggestions,
+            rng=self.random,
+        )
+
+    def _distance_budget(self, distance_remaining, schedule, daily_limit=None):
+        """
+        Returns the most a road trip can still drive.
+        :param distance_remaining: The remaining distance on the road trip.
+        :param schedule: The Schedule of the road trip so far.
+        :param daily_limit: Optional. The DailyLimit of the road trip, as in iter_path.
+        :return: The distance (in km). Infinite if the trip has no limit.
+        """
+        if daily_limit is None or daily_limit.days is None:
+            return distance_remaining
+        # The most the schedule can still drive in the days left. Each hop is also checked against the days
+        # by _daily_hop, since a day may end before its cap.
+        return min(
+            distance_remaining,
+            (daily_limit.days - schedule.day + 1) * daily_limit.max_daily_km
+            - schedule.day_distance,
+        )
+
+    def _cheapest_end(
+        self,
+        place_id,
+        end_city_id=None,
+        end_city_distances=None,
+        schedule=None,
+        daily_limit=None,
+    ):
+        """
+        Returns the distance and duration of ending a road trip right after the given park, which is the
+        cheapest way to end it from there.
+        :param place_id: The place_id of the park.
+        :param end_city_id: Optional place_id of the city the trip must end in.
+        :param end_city_distances: Optional row of park place_id to distance to the end city.
+        :param schedule: Optional. The Schedule on arriving at the park, if the trip has a daily driving cap.
+        :param daily_limit: Optional. The DailyLimit of the road trip, as in iter_path.
+        :return: A tuple of (distance, duration). The distance could also be 'N/A', including if the end
+                    can't fit the daily driving cap.
+        """
+        if end_city_id is not None:
+            distance = end_city_distances[place_id]
+            duration = self.lookup.duration_from_city_to_park(
+                city_id=end_city_id, park_id=place_id
+            )
+        else:
+            distance = self.lookup.distance_to_nearest_city(place_id=place_id)
+            duration = self.lookup.duration_to_nearest_city(place_id=place_id)
+        if daily_limit is not None and distance != "N/A":
+            hop = self._daily_hop(
+                schedule=schedule,
+                origin_id=place_id,
+                dest_id=end_city_id,
+                distance=distance,
+                duration=duration,
+                daily_limit=daily_limit,
+                to_city=True,
+            )
+            if hop is None:
+                return "N/A", "N/A"
+            distance, duration = hop.distance, hop.duration
+        return distance, duration
+
+    def _overnight_leg(self, origin_id, dest_id, distance, duration, to_city=False):
+        """
+        Returns how a hop is driven by way of a night in the nearest city of the park it starts from.
+        :param origin_id: The place_id of the park the hop starts from.
+        :param dest_id: The place_id of the next park. Not used if to_city.
+        :param distance: The direct driving distance of the hop.
+        :param duration: The direct drive duration of the hop.
+        :param to_city: Whether the hop ends the road trip in a city.
+        :return: A tuple of (city place_id, distance to it, duration to it, distance on from it, duration on
+                    from it), or None if the park has no nearest city. The distance on could also be 'N/A'.
+        """
+        city_name = self.lookup.nearest_city_name(place_id=origin_id)
+        if city_name == "N/A":
+            return None
+        city_id = self.lookup.lookup_city_id(city_name=city_name)
+        to_distance = self.lookup.distance_to_nearest_city(place_id=origin_id)
+        to_duration = self.lookup.duration_to_nearest_city(place_id=origin_id)
+        if to_city:
+            # There are no distances between cities, so the trip drives back by way of the park.
+            return (
+                city_id,
+                to_distance,
+                to_duration,
+                to_distance + distance,
+                to_duration + duration,
+            )
+        return (
+            city_id,
+            to_distance,
+            to_duration,
+            self.lookup.distance_from_city_to_park(city_id=city_id, park_id=dest_id),
+            self.lookup.duration_from_city_to_park(city_id=city_id, park_id=dest_id),
+        )
+
+    def _daily_hop(
+        self,
+        schedule,
+        origin_id,
+        dest_id,
+        distance,
+        duration,
+        daily_limit,
+        from_city=False,
+        to_city=False,
+    ):
+        """
+        Plan how a road trip with a daily driving cap drives one hop. Nights are spent in the nearest city
+        of a park: a hop that does not fit in the rest of the day drives to the nearest city of the park it
+        starts from, and on to its destination the next day. A park is only reached with enough of the day
+        left to drive to its own nearest city, so the trip can always stop for the night after it.
+        :param schedule: The Schedule before the hop.
+        :param origin_id: The place_id of the park the hop starts from, or of the starting city if from_city.
+        :param dest_id: The place_id of the next park, or of the city the trip ends in if to_city.
+        :param distance: The direct driving distance of the hop. Could also be 'N/A'.
+        :param duration: The direct drive duration of the hop.
+        :param daily_limit: The DailyLimit of the road trip, as in iter_path.
+        :param from_city: Whether the hop starts from the starting city.
+        :param to_city: Whether the hop ends the road trip in a city.
+        :return: A DailyHop, or None if the hop can't fit the daily driving cap and the days.
+        """
+        if distance == "N/A":
+            return None
+        max_daily_km = daily_limit.max_daily_km
+        stop_distance = 0
+        if not to_city:
+            stop_distance = self.lookup.distance_to_nearest_city(place_id=dest_id)
+            if stop_distance == "N/A":
+                return None
+        if schedule.day_distance + distance + stop_distance <= max_daily_km:
+            hop = DailyHop(
+                schedule=Schedule(
+                    day=schedule.day, day_distance=schedule.day_distance + distance
+                ),
+                distance=distance,
+                duration=duration,
+                overnight=None,
+            )
+        else:
+            leg = None
+            if not from_city:
+                leg = self._overnight_leg(
+                    origin_id=origin_id,
+                    dest_id=dest_id,
+                    distance=distance,
+                    duration=duration,
+                    to_city=to_city,
+                )
+            if leg is None:
+                return None
+            city_id, to_distance, to_duration, on_distance, on_duration = leg
+            if (
+                schedule.day_distance + to_distance > max_daily_km
+                or on_distance == "N/A"
+                or on_distance + stop_distance > max_daily_km
+            ):
+                return None
+            hop = DailyHop(
+                schedule=Schedule(day=schedule.day + 1, day_distance=on_distance),
+                distance=to_distance + on_distance,
+                duration=to_duration + on_duration,
+                overnight=city_id,
+            )
+        if daily_limit.days is not None and hop.schedule.day > daily_limit.days:
+            return None
+        return hop
+
+    def _fits_daily_limit(
+        self,
+        schedule,
+        origin_id,
+        dest_id,
+        from_city,
+        daily_limit,
+        distance_remaining,
+        hours_remaining=None,
+        end_city_id=None,
+        end_city_distances=None,
+    ):
+        """
+        Whether a road trip with a daily driving cap can go on to a park, and still end after it within the
+        budget and the days.
+        :param schedule: The Schedule so far.
+        :param origin_id: The place_id of the current park, or of the starting city if from_city.
+        :param dest_id: The place_id of the prospective next park.
+        :param from_city: True if the current place is the starting city.
+        :param daily_limit: The DailyLimit of the road trip, as in iter_path.
+        :param distance_remaining: The remaining distance on the road trip.
+        :param hours_remaining: Optional. The remaining drive duration on the road trip (in hours).
+        :param end_city_id: Optional place_id of the city the trip must end in.
+        :param end_city_distances: Optional row of park place_id to distance to the end city.
+        :return: True if the park fits.
+        """
+        if from_city:
+            distance = self.lookup.distance_from_city_to_park(
+                city_id=origin_id, park_id=dest_id
+            )
+            duration = self.lookup.duration_from_city_to_park(
+                city_id=origin_id, park_id=dest_id
+            )
+        else:
+            distance = self.lookup.distance_from_park_to_park(
+                origin_id=origin_id, dest_id=dest_id
+            )
+            duration = self.lookup.duration_from_park_to_park(
+                origin_id=origin_id, dest_id=dest_id
+            )
+        hop = self._daily_hop(
+            schedule=schedule,
+            origin_id=origin_id,
+            dest_id=dest_id,
+            distance=distance,
+            duration=duration,
+            daily_limit=daily_limit,
+            from_city=from_city,
+        )
+        if hop is None:
+            return False
+        end_distance, end_duration = self._cheapest_end(
+            place_id=dest_id,
+            end_city_id=end_city_id,
+            end_city_distances=end_city_distances,
+            schedule=hop.schedule,
+            daily_limit=daily_limit,
+        )
+        return (
+            end_distance != "N/A"
+            and hop.distance + end_distance <= distance_remaining
+            and (
+                hours_remaining is None
+                or hop.duration + end_duration <= hours_remaining
+            )
+        )
+
+    def _trip_end(self, place_id, end_city_id=None, end_city_distances=None):
+        """
+        Returns the city a trip ends in if it stops at the given park, and the distance to that city.
+        :param place_id: The place_id of the last park.
+        :param end_city_id: Optional place_id of the city the trip must end in.
+        :param end_city_distances: Optional row of park place_id to distance to the end city.
+        :return: A tuple of (city place_id, distance). The distance could also be 'N/A'.
+        """
+        if end_city_id is not None:
+            return end_city_id, end_city_distances[place_id]
+        distance = self.lookup.distance_to_nearest_city(place_id=place_id)
+        if distance == "N/A":
+            return None, distance
+        city_name = self.lookup.nearest_city_name(place_id=place_id)
+        return self.lookup.lookup_city_id(city_name=city_name), distance
+
+    def _pareto_front(self, labels, max_paths):
+        """
+        Reduce a list of labels to the ones that are not dominated. A label is dominated if another label
+        is no longer, and has at least the same summed rating and number of parks.
+        :param labels: A list of ParetoLabels.
+        :param max_paths: The max number of labels to keep. Kept labels are spread out over the distances.
+        :return: A list of non-dominated ParetoLabels, sorted by distance.
+        """
+        labels = sorted(labels, key=lambda x: (x.distance, -x.rating, -x.num_parks))
+        front = []
+        for label in labels:
+            dominated = False
+            for kept in front:
+                if kept.rating >= label.rating and kept.num_parks >= label.num_parks:
+                    dominated = True
+                    break
+            if not dominated:
+                front.append(label)
+        if len(front) > max_paths > 1:
+            step = (len(front) - 1) / (max_paths - 1)
+            front = [front[round(i * step)] for i in range(max_paths)]
+        return front
+
+    def _pareto_suffixes(
+        self,
+        place_id,
+        distance_remaining,
+        current_state,
+        unvisitable_parks,
+        unvisitable_states,
+        search,
+        since,
+    ):
+        """
+        Find the Pareto front of ways to continue a road trip from a park.
+        Fronts are memoized on (park index, budget bucket, unvisitable parks in reach, state-set signature).
+        Only the unvisitable parks that the budget can still reach through the park graph can change the
+        front, so fronts found along different paths are shared exactly. Budgets are rounded down to the
+        bucket, so a memoized front always fits within the actual remaining distance.
+        Complete fronts are also stored in the shared search cache, with the number of expansions they cost.
+        :param place_id: The place_id of the current park.
+        :param distance_remaining: The remaining distance on the road trip.
+        :param current_state: The state of the current park.
+        :param unvisitable_parks: A set of parks that have been visited/eliminated already.
+        :param unvisitable_states: A set of states that have been visited already.
+        :param search: A dict with the settings and memo table of the current search.
+        :param since: The memo tick of the caller. Memoized fronts from this tick on were found while
+                        expanding the caller, and so are already counted in its cost.
+        :return: A tuple of (list of ParetoLabels, whose hops start after the current park and end at a city,
+                    an upper bound on the number of expansions the front costs without any memo table).
+        """
+        bucket = search["budget_bucket"]
+        budget = distance_remaining - distance_remaining % bucket
+        reach = self.lookup.distances_within_graph(park_id=place_id)
+        parks_in_reach = tuple(
+            sorted(x for x in unvisitable_parks if reach.get(x, math.inf) <= budget)
+        )
+        signature = (current_state, tuple(sorted(unvisitable_states))) + search[
+            "settings"
+        ]
+        key = (
+            self.lookup.lookup_park_index(place_id=place_id),
+            budget,
+            parks_in_reach,
+            signature,
+        )
+        # The local memo stores (labels, complete, cost, tick), where complete is False if the front was
+        # cut short, and tick orders the fronts by when they were first looked up.
+        entry = search["memo"].get(key)
+        if entry is not None:
+            labels, complete, cost, tick = entry
+            if not complete:
+                # Reusing a front that was cut short makes the caller's front incomplete too.
+                search["cuts"] += 1
+            return labels, cost if tick < since else 0
+        tick = search["ticks"]
+        search["ticks"] += 1
+
+        cached = self.search_cache.get(key) if search["read_cache"] else None
+        if cached is not None:
+            labels, cost = cached
+            complete = True
+            # Charge the cached front's expansions, so the search budget runs out no later than it
+            # would have without the cache.
+            search["expansions"] += cost
+            search["cache_hits"] += 1
+            if search["expansions"] > search["max_expansions"]:
+                raise _CachedSearchTooLarge()
+        else:
+            cuts = search["cuts"]
+            labels, cost = self._expand_pareto_suffixes(
+                place_id=place_id,
+                budget=budget,
+                current_state=current_state,
+                unvisitable_parks=unvisitable_parks,
+                unvisitable_states=unvisitable_states,
+                search=search,
+                tick=tick,
+            )
+            labels = tuple(labels)
+            complete = search["cuts"] == cuts
+            if self.search_cache is not None and complete:
+                # Only share fronts that were not cut short by the search budget.
+                self.search_cache.put(
+                    key,
+                    (labels, cost),
+                    size=_pareto_entry_size(key=key, labels=labels, cost=cost),
+                )
+        search["memo"][key] = (labels, complete, cost, tick)
+        return labels, cost
+
+    def _expand_pareto_suffixes(
+        self,
+        place_id,
+        budget,
+        current_state,
+        unvisitable_parks,
+        unvisitable_states,
+        search,
+        tick,
+    ):
+        """
+        Compute the Pareto front of continuations from a park, without looking at the memo table.
+        Parameters are the same as _pareto_suffixes, with budget already rounded down to a bucket, and
+        tick the memo tick of this park.
+        :return: A tuple of (list of ParetoLabels, number of expansions it costs without any memo table).
+        """
+        labels = []
+        end_city_id, distance_to_end = self._trip_end(
+            place_id=place_id,
+            end_city_id=search["end_city_id"],
+            end_city_distances=search["end_city_distances"],
+        )
+        if distance_to_end != "N/A" and distance_to_end <= budget:
+            # We can always choose to end the road trip here.
+            labels.append(
+                ParetoLabel(distance_to_end, 0, 0, end_city_id, distance_to_end, None)
+            )
+        if search["expansions"] >= search["max_expansions"]:
+            if search["cache_hits"]:
+                # Without the cached fronts the search might not have run out here, so start over.
+                raise _CachedSearchTooLarge()
+            # Out of search budget, only allow ending the trip from here on. Nothing was read from the
+            # cache, so the rest of the search can't read it either without changing the result.
+            search["read_cache"] = False
+            search["cuts"] += 1
+            return labels, 0
+        search["expansions"] += 1
+        cost = 1
+
+        suggestions = self.suggest_next_locations_from_park(
+            place_id=place_id,
+            unvisitable_parks=unvisitable_parks,
+            distance_remaining=budget,
+            num_suggestions=search["num_suggestions"],
+            unvisitable_states=unvisitable_states,
+            end_city_id=search["end_city_id"],
+            end_city_distances=search["end_city_distances"],
+        )
+        next_unvisitable_parks = unvisitable_parks.union(
+            self.lookup.parks_too_close_to_park_id(park_id=place_id)
+        )
+        next_unvisitable_parks.add(place_id)
+        for park_id in suggestions.get("parks", []):
+            distance = self.lookup.distance_from_park_to_park(
+                origin_id=place_id, dest_id=park_id
+            )
+            park_state = self.lookup.lookup_park_state(place_id=park_id)
+            next_unvisitable_states = unvisitable_states
+            if park_state != current_state:
+                next_unvisitable_states = unvisitable_states.union({current_state})
+            rating = self.park_rating(place_id=park_id)
+            suffixes, suffixes_cost = self._pareto_suffixes(
+                place_id=park_id,
+                distance_remaining=budget - distance,
+                current_state=park_state,
+                unvisitable_parks=next_unvisitable_parks,
+                unvisitable_states=next_unvisitable_states,
+                search=search,
+                since=tick,
+            )
+            cost += suffixes_cost
+            for suffix in suffixes:
+                labels.append(
+                    ParetoLabel(
+                        distance + suffix.distance,
+                        rating + suffix.rating,
+                        suffix.num_parks + 1,
+                        park_id,
+                        distance,
+                        suffix,
+                    )
+                )
+        return self._pareto_front(labels=labels, max_paths=search["max_paths"]), cost
+
+    def _starting_pareto_labels(self, starting_city_id, park_ids, max_distance, search):
+        """
+        Find the road trips that start by driving from the starting city to one of the given parks.
+        :param starting_city_id: The place_id of the starting city.
+        :param park_ids: The place_ids of the parks to drive to first.
+        :param max_distance: The max driving distance for the road trip.
+        :param search: A dict with the settings and memo table of the search.
+        :return: A list of ParetoLabels, starting at the first park.
+        """
+        labels = []
+        for park_id in park_ids:
+            distance = self.lookup.distance_from_city_to_park(
+                city_id=starting_city_id, park_id=park_id
+            )
+            rating = self.park_rating(place_id=park_id)
+            suffixes, _ = self._pareto_suffixes(
+                place_id=park_id,
+                distance_remaining=max_distance - distance,
+                current_state=self.lookup.lookup_park_state(place_id=park_id),
+                unvisitable_parks=set(),
+                unvisitable_states=set(),
+                search=search,
+                since=0,
+            )
+            for suffix in suffixes:
+                labels.append(
+                    ParetoLabel(
+                        distance + suffix.distance,
+                        rating + suffix.rating,
+                        suffix.num_parks + 1,
+                        park_id,
+                        distance,
+                        suffix,
                     )
-                    # Add the parks nearby to unvisitable parks.
-                    too_close_parks = self.lookup.parks_too_close_to_park_id(
-                        park_id=current_place
+                )
+        return labels
+
+    def generate_pareto_paths(
+        self,
+        starting_city,
+        max_distance,
+        num_suggestions=3,
+        end_city=None,
+        max_paths=10,
+        budget_bucket=50,
+        max_expansions=5000,
+    ):
+        """
+        Given a starting city and a max distance, search for a small Pareto front of road trips.
+        The front trades off total distance against the summed park rating (see park_rating) and number of parks,
+        so a single search can serve both "the best trip within X km" and "the shortest trip with N parks".
+        :param starting_city: The name of the starting city.
+        :param max_distance: The max driving distance for the road trip.
+        :param num_suggestions: How many of the top suggestions to branch on at each park.
+        :param end_city: Optional name of the city to end in. If None, end at the city nearest the last park.
+        :param max_paths: The max number of road trips to keep in the front.
+        :param budget_bucket: Remaining distances are rounded down to a multiple of this (in km) when memoizing.
+        :param max_expansions: The max number of parks to expand, which bounds the search time.
+        :return: None. Store the road trips in self.pareto_paths, sorted by total distance.
+        """
+        self.reset_data()
+        starting_city_id = self.lookup.lookup_city_id(city_name=starting_city)
+        end_city_id = None
+        end_city_distances = None
+        if end_city is not None:
+            end_city_id = self.lookup.lookup_city_id(city_name=end_city)
+            end_city_distances = self.lookup.distances_to_city(city_id=end_city_id)
+        settings = (
+            self.lookup.version,
+            end_city_id,
+            num_suggestions,
+            max_paths,
+            self.scoring,
+        )
+
+        suggestions = self.suggest_next_locations_from_city(
+            city_name=starting_city,
+            distance_remaining=max_distance,
+            num_suggestions=num_suggestions,
+            end_city_distances=end_city_distances,
+        )
+        if "parks" not in suggestions:
+            print(suggestions["error"])
+            return
+
+        # The front only depends on the request, so a repeated request reuses it, even if its search
+        # ran out of expansions.
+        request_key = (
+            "request",
+            starting_city_id,
+            max_distance,
+            budget_bucket,
+            max_expansions,
+        ) + settings
+        front = None
+        if self.search_cache is not None:
+            front = self.search_cache.get(request_key)
+        if front is None:
+            # Search with the shared cache first. If the cached fronts might have hidden a cut, search
+            # again without reading them, so the same request always finds the same front.
+            for read_cache in (self.search_cache is not None, False):
+                search = {
+                    "memo": {},
+                    # Settings that change the result of a search, and so are part of every memo key.
+                    "settings": settings,
+                    "expansions": 0,
+                    "cuts": 0,
+                    "ticks": 0,
+                    "cache_hits": 0,
+                    "read_cache": read_cache,
+                    "max_expansions": max_expansions,
+                    "budget_bucket": budget_bucket,
+                    "num_suggestions": num_suggestions,
+                    "max_paths": max_paths,
+                    "end_city_id": end_city_id,
+                    "end_city_distances": end_city_distances,
+                }
+                try:
+                    labels = self._starting_pareto_labels(
+                        starting_city_id=starting_city_id,
+                        park_ids=suggestions["parks"],
+                        max_distance=max_distance,
+                        search=search,
                     )
-                    for park in too_close_parks:
-                        unvisitable_parks.add(park)
-                    # Add the current park to unvisitable parks.
-                    unvisitable_parks.add(current_place)
+                    break
+                except _CachedSearchTooLarge:
+                    continue
+            front = tuple(self._pareto_front(labels=labels, max_paths=max_paths))
+            if self.search_cache is not None:
+                self.search_cache.put(
+                    request_key,
+                    front,
+                    size=sys.getsizeof(request_key) + _labels_size(front),
+                )
 
-                self.distances.append(distance)
-                distance_remaining -= distance
+        for label in front:
+            hops = list(_label_hops(label))
+            path = [starting_city_id] + [hop[0] for hop in hops]
+            distances = [hop[1] for hop in hops]
+            self.pareto_paths.append((path, distances))
 
-                # Set the current place to the next destination park.
-                current_place = next_dest
-                if next_dest_state != current_state:
-                    unvisitable_states.add(current_state)
-                    current_state = next_dest_state
+    def return_pareto_paths(self):
+        """
+        Describe the road trips found by the Pareto search.
+        :return: A dictionary with the result, and a list of path infos sorted by total distance.
+        """
+        response = {}
+
+        if not self.pareto_paths:
+            error_msg = (
+                "No path was possible for the provided starting city and distance."
+            )
+            print(error_msg)
+            response["result"] = error_msg
+            return response
+
+        response["result"] = "ok"
+        response_paths = []
+        for path, distances in self.pareto_paths:
+            parks = path[1:-1]
+            response_paths.append(
+                {
+                    "total_distance": sum(distances),
+                    "total_hours": sum(self.path_durations(path=path)),
+                    "total_rating": sum(
+                        self.park_rating(place_id=park) for park in parks
+                    ),
+                    "num_parks": len(parks),
+                    "path": self._describe_path(path=path, distances=distances),
+                }
+            )
+        response["paths"] = response_paths
+        return response
 
     def return_path(self):
         """
@@ -261,56 +1873,134 @@ class PathFinder:
 
         if not self.path:
             error_msg = (
-                "No path was possible for the provided starting city and distance."
+                self.error_msg
+                or "No path was possible for the provided starting city and distance."
             )
             print(error_msg)
             response["result"] = error_msg
             return response
 
         response["result"] = "ok"
+        response["path"] = self._describe_path(
+            path=self.path, distances=self.distances, verbose=True
+        )
+        response["total_hours"] = sum(
+            self.path_durations(path=self.path, overnight_stops=self.overnight_stops)
+        )
+        if self.days:
+            for place_info, day, city_id in zip(
+                response["path"], self.days, self.overnight_stops
+            ):
+                place_info["day"] = day
+                if city_id is not None:
+                    place_info["overnight"] = self.lookup.lookup_city_name(
+                        place_id=city_id
+                    )
+            response["total_days"] = self.days[-1]
+        return response
+
+    def path_durations(self, path, overnight_stops=None):
+        """
+        Returns the drive duration of each hop of a road trip.
+        :param path: A list of place_ids, starting and ending with cities.
+        :param overnight_stops: Optional. The city stayed in the night before reaching each place on the path
+                                (or None), as in self.overnight_stops.
+        :return: A list of durations (in hours), one fewer than the places on the path.
+        """
+        durations = [self.lookup.duration_from_city_to_park(path[0], path[1])]
+        for origin_id, dest_id in zip(path[1:-2], path[2:-1]):
+            durations.append(self.lookup.duration_from_park_to_park(origin_id, dest_id))
+        durations.append(self.lookup.duration_from_city_to_park(path[-1], path[-2]))
+        for i, city_id in enumerate(overnight_stops or ()):
+            if city_id is not None:
+                _, _, to_duration, _, on_duration = self._overnight_leg(
+                    origin_id=path[i - 1],
+                    dest_id=path[i],
+                    distance=0,
+                    duration=durations[i - 1],
+                    to_city=i == len(path) - 1,
+                )
+                durations[i - 1] = to_duration + on_duration
+        return durations
+
+    def describe_park(self, place_id):
+        """
+        Describe a park on a road trip.
+        :param place_id: The place_id of the park.
+        :return: A dictionary with the park's name, rating, num_reviews, state, photos (remote urls) and
+                    photo_variants (a list with a dict per photo, of variant name to url on this server).
+        """
+        details = self.lookup.lookup_park_details(place_id=place_id)
+        return {
+            "name": details["name"],
+            "rating": self.lookup.lookup_park_rating(place_id=place_id),
+            "num_reviews": details["num_ratings"],
+            "state": self.lookup.lookup_park_state(place_id=place_id),
+            "photos": details["photos"],
+            "photo_variants": [
+                {k: PHOTO_URL_PREFIX + v for k, v in variants.items()}
+                for variants in self.lookup.lookup_park_photo_variants(
+                    place_id=place_id
+                )
+            ],
+        }
 
+    def _describe_path(self, path, distances, verbose=False):
+        """
+        Describe each place on a path.
+        :param path: A list of place_ids, starting and ending with cities.
+        :param distances: Distances travelled between each two points on the path.
+        :param verbose: Whether to print the description as well.
+        :return: A list of dictionaries, one for each place on the path.
+        """
         response_path = []
 
-        ending_index = len(self.path) - 1
-        for index, place in enumerate(self.path):
+        ending_index = len(path) - 1
+        for index, place in enumerate(path):
             if index == 0:
                 city_name = self.lookup.lookup_city_name(place_id=place)
-                distance_to_next_dest = self.distances[index]
+                distance_to_next_dest = distances[index]
                 response_path.append(
-                    {"name": city_name, "next_distance": distance_to_next_dest}
+                    {
+                        "place_id": place,
+                        "name": city_name,
+                        "next_distance": distance_to_next_dest,
+                    }
                 )
-                print(f"Starting city: {city_name}.")
-                print(f"Distance to next destination: {distance_to_next_dest} km. \n")
+                if verbose:
+                    print(f"Starting city: {city_name}.")
+                    print(
+                        f"Distance to next destination: {distance_to_next_dest} km. \n"
+                    )
             elif index == ending_index:
                 city_name = self.lookup.lookup_city_name(place_id=place)
-                total_dist = sum(self.distances)
-                response_path.append({"name": city_name, "next_distance": total_dist})
-                print(f"Ending city: {city_name}.")
-                print(f"Total road trip driving distance: {total_dist} km.")
-            else:
-                park_name = self.lookup.lookup_park_name(place_id=place)
-                state = self.lookup.lookup_park_state(place_id=place)
-                avg_rating = self.lookup.lookup_park_rating(place_id=place)
-                num_reviews = self.lookup.lookup_park_num_ratings(place_id=place)
-                distance_to_next_dest = self.distances[index]
-                photos = self.lookup.lookup_park_photos(place_id=place)
+                total_dist = sum(distances)
                 response_path.append(
-                    {
-                        "name": park_name,
-                        "next_distance": distance_to_next_dest,
-                        "rating": avg_rating,
-                        "num_reviews": num_reviews,
-                        "state": state,
-                        "photos": photos,
-                    }
+                    {"place_id": place, "name": city_name, "next_distance": total_dist}
                 )
-                print(f"Park #{index}: {park_name}")
-                print(f"State: {state}")
-                print(f"Average Google Review: {avg_rating}")
-                print(f"Number of Google Reviews: {num_reviews}")
-                print(f"Distance to next destination: {distance_to_next_dest} km. \n")
-                for photo in photos:
-                    print(photo)
-
-        response["path"] = response_path
-        return response
+                if verbose:
+                    print(f"Ending city: {city_name}.")
+                    print(f"Total road trip driving distance: {total_dist} km.")
+            else:
+                park_info = self.describe_park(place_id=place)
+                park_name = park_info["name"]
+                state = park_info["state"]
+                avg_rating = park_info["rating"]
+                num_reviews = park_info["num_reviews"]
+                distance_to_next_dest = distances[index]
+                photos = park_info["photos"]
+                park_info["place_id"] = place
+                park_info["next_distance"] = distance_to_next_dest
+                response_path.append(park_info)
+                if verbose:
+                    print(f"Park #{index}: {park_name}")
+                    print(f"State: {state}")
+                    print(f"Average Google Review: {avg_rating}")
+                    print(f"Number of Google Reviews: {num_reviews}")
+                    print(
+                        f"Distance to next destination: {distance_to_next_dest} km. \n"
+                    )
+                    for photo in photos:
+                        print(photo)
+
+        return response_path
@@ -0,0 +1,100 @@
+# Offline. Render the downloaded park photos into small, fixed-size variants that the API serves itself.
+# Variant files are named by a hash of their contents, so they never change once written, and can be
+# cached by browsers forever.
+import hashlib
+import io
+import json
+import os
+
+# The variants rendered for every photo: name -> max width (in pixels).
+VARIANT_WIDTHS = {"thumb": 320, "medium": 960}
+VARIANT_FORMAT = "WEBP"
+VARIANT_EXTENSION = ".webp"
+VARIANT_QUALITY = 80
+# Where the variants are written, and the URL path the API serves them from.
+PHOTO_VARIANTS_DIR = "photos/variants"
+PHOTO_URL_PREFIX = "/photos/"
+
+
+def _content_hash(contents):
+    return hashlib.sha1(contents).hexdigest()
+
+
+def _render_variant(image, width):
+    """
+    Resize an image to at most the given width, keeping its aspect ratio, and encode it.
+    :param image: A PIL Image.
+    :param width: The max width (in pixels).
+    :return: The encoded image bytes.
+    """
+    variant = image.copy()
+    # thumbnail keeps the aspect ratio, and never enlarges the image.
+    variant.thumbnail((width, variant.height))
+    output = io.BytesIO()
+    variant.save(output, format=VARIANT_FORMAT, quality=VARIANT_QUALITY, method=6)
+    return output.getvalue()
+
+
+def build_photo_variants(
+    photos_dir="photos",
+    variants_dir=PHOTO_VARIANTS_DIR,
+    manifest_file="data/photo_manifest.json",
+):
+    """
+    Render every downloaded photo (photos/<letter>/<park name>_photo_<i>.jpg) into each of VARIANT_WIDTHS, and
+    record the variant file names in the manifest. Photos whose contents are unchanged since the last run
+    are skipped.
+    Pillow is only needed here, so it is imported by this function.
+    :param photos_dir: The directory with the downloaded photos.
+    :param variants_dir: The directory to write the variants to.
+    :param manifest_file: The json manifest of photo file name to a dict with the 'source' content hash, and
+                            the file name of each variant.
+    :return: The manifest.
+    """
+    from PIL import Image, ImageOps
+
+    manifest = {}
+    if os.path.exists(manifest_file):
+        with open(manifest_file) as f:
+            manifest = json.load(f)
+    os.makedirs(variants_dir, exist_ok=True)
+
+    rendered = 0
+    new_manifest = {}
+    for letter in sorted(os.listdir(photos_dir)):
+        letter_dir = os.path.join(photos_dir, letter)
+        if len(letter) != 1 or not os.path.isdir(letter_dir):
+            continue
+        for file_name in sorted(os.listdir(letter_dir)):
+            with open(os.path.join(letter_dir, file_name), "rb") as f:
+                contents = f.read()
+            source_hash = _content_hash(contents)
+            entry = manifest.get(file_name)
+            if entry is not None and entry["source"] == source_hash:
+                new_manifest[file_name] = entry
+                continue
+            try:
+                image = Image.open(io.BytesIO(contents))
+                image = ImageOps.exif_transpose(image).convert("RGB")
+            except OSError as e:
+                print(f"Could not read photo {file_name}: {e}")
+                continue
+            entry = {"source": source_hash}
+            for variant, width in VARIANT_WIDTHS.items():
+                variant_contents = _render_variant(image=image, width=width)
+                variant_name = _content_hash(variant_contents)[:20] + VARIANT_EXTENSION
+                variant_path = os.path.join(variants_dir, variant_name)
+                if not os.path.exists(variant_path):
+                    with open(variant_path, "wb") as fp:
+                        fp.write(variant_contents)
+                entry[variant] = variant_name
+            new_manifest[file_name] = entry
+            rendered += 1
+
+    with open(f"{manifest_file}.tmp", "w") as fp:
+        json.dump(new_manifest, fp)
+    os.replace(f"{manifest_file}.tmp", manifest_file)
+    print(
+        f"Rendered variants for {rendered} photos, {len(new_manifest) - rendered} unchanged."
+    )
+    return new_manifest
@@ -0,0 +1,137 @@
+# Resolve many Google Places text queries concurrently, for the offline pipeline.
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from googlemaps import exceptions
+
+# Errors worth retrying: the request timed out, failed in transit, or Google asked us to slow down.
+TRANSIENT_ERRORS = (
+    exceptions.Timeout,
+    exceptions.TransportError,
+    exceptions._OverQueryLimit,
+    ConnectionError,
+    TimeoutError,
+)
+# Statuses of an ApiError that are worth retrying.
+TRANSIENT_STATUSES = {"OVER_QUERY_LIMIT", "UNKNOWN_ERROR"}
+
+
+def is_transient(error):
+    """
+    Returns whether a failed request should be retried.
+    :param error: The exception raised by the request.
+    :return: True if the error is transient.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, exceptions.ApiError) and error.status in TRANSIENT_STATUSES
+
+
+class RateLimiter:
+    def __init__(self, queries_per_second, clock=time.monotonic, sleep=time.sleep):
+        """
+        Spaces out requests from any number of threads, so at most queries_per_second start each second.
+        :param queries_per_second: The max request rate.
+        :param clock: A monotonic clock, in seconds. Replaceable for testing.
+        :param sleep: A function to sleep for a number of seconds. Replaceable for testing.
+        """
+        self._interval = 1 / queries_per_second
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+
+    def wait(self):
+        """
+        Block until the caller may send its request.
+        :return: None
+        """
+        with self._lock:
+            now = self._clock()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self._interval
+        if slot > now:
+            self._sleep(slot - now)
+
+
+class PlacesResolver:
+    def __init__(
+        self,
+        g_places,
+        max_workers=8,
+        queries_per_second=10,
+        max_retries=3,
+        backoff=1.0,
+        sleep=time.sleep,
+    ):
+        """
+        :param g_places: A GPlaces, or any object with the same search_for_places method (such as a fake
+                            for testing).
+        :param max_workers: The max number of requests in flight.
+        :param queries_per_second: The max request rate, across all workers.
+        :param max_retries: How many times to retry a query that failed with a transient error.
+        :param backoff: The wait before the first retry (in seconds). It doubles with each retry.
+        :param sleep: A function to sleep for a number of seconds. Replaceable for testing.
+        """
+        self._g_places = g_places
+        self._max_workers = max_workers
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._sleep = sleep
+        self._rate_limiter = RateLimiter(
+            queries_per_second=queries_per_second, sleep=sleep
+        )
+
+    def _search(self, query, location_bias):
+        """
+        Search for one query, retrying transient errors with exponential backoff.
+        :param query: The text query.
+        :param location_bias: The location bias, as in GPlaces.search_for_places.
+        :return: The Places response, or None if the query failed.
+        """
+        for attempt in range(self._max_retries + 1):
+            self._rate_limiter.wait()
+            try:
+                return self._g_places.search_for_places(
+                    query=query, location_bias=location_bias
+                )
+            except Exception as e:
+                if not is_transient(e):
+                    print(f"Search for {query} failed: {e!r}")
+                    return None
+                if attempt == self._max_retries:
+                    print(
+                        f"Search for {query} failed after {attempt + 1} attempts: {e!r}"
+                    )
+                    return None
+                self._sleep(self._backoff * 2**attempt)
+
+    def resolve(self, queries, location_bias="ipbias"):
+        """
+        Search for many queries concurrently. Each distinct query is only sent once.
+        :param queries: A list of text queries.
+        :param location_bias: The location bias for every query, as in GPlaces.search_for_places.
+        :return: A list of Places responses, in the order of the queries. A response is None if its query
+                    failed.
+        """
+        unique_queries = list(dict.fromkeys(queries))
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self._max_workers) as pool:
+            responses = dict(
+                zip(
+                    unique_queries,
+                    pool.map(
+                        lambda query: self._search(
+                            query=query, location_bias=location_bias
+                        ),
+                        unique_queries,
+                    ),
+                )
+            )
+        failed = sum(response is None for response in responses.values())
+        print(
+            f"Resolved {len(unique_queries)} unique queries of {len(queries)} in "
+            f"{time.perf_counter() - start:.1f}s, {failed} failed."
+        )
+        return [responses[query] for query in queries]
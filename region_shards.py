@@ -0,0 +1,316 @@
+# Region shards: overlapping circular regions of the dataset, each a complete dataset directory of its own.
+# Driving distances are never shorter than the straight line, so a trip of max_distance from a start city
+# never leaves the circle of that radius around it, and can be searched in any shard that contains the
+# circle. Its result is the same as with the full dataset.
+import csv
+import json
+import os
+import shutil
+import threading
+
+from dataset import write_dataset_manifest
+from lookup import Lookup
+from park_clusters import CLUSTERS_FILE, subset_clusters
+from park_graph import haversine_km, subgraph
+from park_store import write_park_store
+
+SHARDS_DIR = "data/shards"
+# Shards are built at each of these radii (in km), centered on cities so that every city is within half
+# the radius of a center. Requests with a max_distance up to half the radius always fit in a shard.
+SHARD_RADII = (1000, 2000)
+
+
+def _shard_name(radius, city_name):
+    city_slug = "".join(x if x.isalnum() else "-" for x in city_name.lower())
+    return f"{radius}km-" + "-".join(filter(None, city_slug.split("-")))
+
+
+def _write_json(shard_dir, file_name, data):
+    file_name = os.path.join(shard_dir, file_name)
+    with open(f"{file_name}.tmp", "w") as fp:
+        json.dump(data, fp)
+    os.replace(f"{file_name}.tmp", file_name)
+
+
+def _filter_rows(rows, keys, values):
+    """
+    Restrict a dict of lists or dicts to the given keys, and each list or dict to the given values.
+    """
+    return {
+        key: (
+            [x for x in row if x in values]
+            if isinstance(row, list)
+            else {x: v for x, v in row.items() if x in values}
+        )
+        for key, row in rows.items()
+        if key in keys
+    }
+
+
+def build_region_shards(data_dir="data", shards_dir=SHARDS_DIR, radii=SHARD_RADII):
+    """
+    Offline. Partition the dataset into overlapping region shards, and write each shard as a dataset
+    directory that Lookup can load, with its own distance matrices, park graph and suggestion lists.
+    A shard has the parks and cities within its radius of its center, plus the nearest city of each of its
+    parks, which may be just outside the radius, so that every trip in the shard can end in a city.
+    Shards that would have every park are not written, since the full dataset serves those requests.
+    Run this after the rest of the pipeline, whenever the dataset changes.
+    :param data_dir: The directory with the full dataset.
+    :param shards_dir: The directory to write the shards to, one sub-directory per shard, and the manifest,
+                        shards.json.
+    :param radii: The radii (in km) to build shards at.
+    :return: The manifest: a dict with the version of the full dataset the shards were built from, and a
+                list of shards, smallest first, each with its name, center, radius, num_parks and cities.
+    """
+    lookup = Lookup(data_dir=data_dir)
+
+    def load(file_name):
+        with open(os.path.join(data_dir, file_name)) as f:
+            return json.load(f)
+
+    cities_to_place_id = load("cities_to_place_id.json")
+    place_ids_to_city = load("place_ids_to_city.json")
+    city_coordinates = {
+        city_name: lookup.lookup_city_geocoordinates(city_name=city_name)
+        for city_name in cities_to_place_id
+    }
+    park_coordinates = {
+        park_id: tuple(map(float, lookup.lookup_park_geocoordinates(place_id=park_id)))
+        for park_id in lookup.all_park_ids()
+    }
+    park_id_to_park_info = load("park_id_to_park_info.json")
+    park_id_to_nearest_city = load("park_id_to_nearest_city.json")
+    # The dataset files that only need to be restricted to the shard: file name to whether they are keyed
+    # by park or city, and whether their values are lists or dicts of parks, which are restricted too.
+    park_files = {
+        "park_id_to_unvisitable_parks.json": ("park", True),
+        "park_id_suggestions.json": ("park", True),
+        "park_id_to_nearest_city.json": ("park", False),
+        "place_ids_to_park_name.json": ("park", False),
+        "city_place_ids_to_parks_distances.json": ("city", True),
+        "city_place_ids_to_park_suggestions.json": ("city", True),
+        "city_place_ids_to_parks_durations.json": ("city", True),
+    }
+    park_files = {
+        file_name: (kind, has_parks, load(file_name))
+        for file_name, (kind, has_parks) in park_files.items()
+        if os.path.exists(os.path.join(data_dir, file_name))
+    }
+    park_graph = load("park_graph.json")
+    park_clusters = None
+    if os.path.exists(os.path.join(data_dir, CLUSTERS_FILE)):
+        park_clusters = load(CLUSTERS_FILE)
+    with open(
+        os.path.join(data_dir, "us_cities.csv"), newline="", encoding="utf-8-sig"
+    ) as f:
+        city_rows = list(csv.DictReader(f))
+
+    manifest = {"version": lookup.version, "shards": []}
+    os.makedirs(shards_dir, exist_ok=True)
+    for radius in radii:
+        # Cities are listed largest first, so the largest cities become the centers.
+        centers = []
+        for city_name, (lat, lng) in city_coordinates.items():
+            if all(
+                haversine_km(lat, lng, *city_coordinates[x]) > radius / 2
+                for x in centers
+            ):
+                centers.append(city_name)
+        for center in centers:
+            lat, lng = city_coordinates[center]
+            park_ids = {
+                park_id
+                for park_id, coordinates in park_coordinates.items()
+                if haversine_km(lat, lng, *coordinates) <= radius
+            }
+            if len(park_ids) == len(park_coordinates):
+                continue
+            city_names = {
+                city_name
+                for city_name, coordinates in city_coordinates.items()
+                if haversine_km(lat, lng, *coordinates) <= radius
+            }
+            city_names.update(
+                park_id_to_nearest_city[park_id]["nearest_city"]
+                for park_id in park_ids
+                if park_id_to_nearest_city[park_id]["nearest_city"] != "N/A"
+            )
+            city_ids = {cities_to_place_id[x] for x in city_names}
+
+            name = _shard_name(radius=radius, city_name=center)
+            shard_dir = os.path.join(shards_dir, name)
+            os.makedirs(shard_dir, exist_ok=True)
+            with open(os.path.join(shard_dir, "us_cities.csv"), "w", newline="") as fp:
+                writer = csv.DictWriter(fp, fieldnames=list(city_rows[0]))
+                writer.writeheader()
+                writer.writerows(
+                    x
+                    for x in city_rows
+                    if f"{x['city']}, {x['state_id']}" in city_names
+                )
+            _write_json(
+                shard_dir,
+                "cities_to_place_id.json",
+                {x: v for x, v in cities_to_place_id.items() if x in city_names},
+            )
+            _write_json(
+                shard_dir,
+                "place_ids_to_city.json",
+                {x: v for x, v in place_ids_to_city.items() if x in city_ids},
+            )
+            write_park_store(
+                park_info={x: park_id_to_park_info[x] for x in park_ids},
+                data_dir=shard_dir,
+            )
+            _write_json(
+                shard_dir, "park_graph.json", subgraph(park_graph, park_ids=park_ids)
+            )
+            for file_name, (kind, has_parks, rows) in park_files.items():
+                keys = park_ids if kind == "park" else city_ids
+                if has_parks:
+                    rows = _filter_rows(rows, keys=keys, values=park_ids)
+                else:
+                    rows = {x: v for x, v in rows.items() if x in keys}
+                _write_json(shard_dir, file_name, rows)
+            if park_clusters is not None:
+                _write_json(
+                    shard_dir,
+                    CLUSTERS_FILE,
+                    subset_clusters(park_clusters, park_ids=park_ids),
+                )
+            if os.path.exists(os.path.join(data_dir, "photo_manifest.json")):
+                shutil.copyfile(
+                    os.path.join(data_dir, "photo_manifest.json"),
+                    os.path.join(shard_dir, "photo_manifest.json"),
+                )
+            write_dataset_manifest(data_dir=shard_dir)
+            manifest["shards"].append(
+                {
+                    "name": name,
+                    "center": [lat, lng],
+                    "radius": radius,
+                    "num_parks": len(park_ids),
+                    "cities": sorted(city_names),
+                }
+            )
+            print(f"Shard {name}: {len(park_ids)} parks, {len(city_names)} cities.")
+
+    manifest["shards"].sort(key=lambda x: (x["num_parks"], x["radius"], x["name"]))
+    # Remove the shards of a previous build that are not in this one.
+    shard_names = {x["name"] for x in manifest["shards"]}
+    for entry in os.scandir(shards_dir):
+        if entry.is_dir() and entry.name not in shard_names:
+            shutil.rmtree(entry.path)
+    _write_json(shards_dir, "shards.json", manifest)
+    return manifest
+
+
+class ShardRouter:
+    def __init__(self, shards_dir=SHARDS_DIR):
+        """
+        Route requests to the smallest region shard that can serve them, from the manifest alone. The shards'
+        datasets are never loaded here: a region worker loads the one shard it serves at startup.
+        :param shards_dir: The directory with the shards written by build_region_shards.
+        """
+        self._shards_dir = shards_dir
+        self._lock = threading.Lock()
+        self._manifest = {"version": None, "shards": []}
+        self._manifest_mtime = None
+
+    def _current_manifest(self):
+        """
+        Returns the manifest, reading it again if the shards were rebuilt.
+        """
+        file_name = os.path.join(self._shards_dir, "shards.json")
+        try:
+            mtime = os.stat(file_name).st_mtime_ns
+        except FileNotFoundError:
+            return self._manifest
+        if mtime != self._manifest_mtime:
+            with open(file_name) as f:
+                manifest = json.load(f)
+            with self._lock:
+                self._manifest, self._manifest_mtime = manifest, mtime
+        return self._manifest
+
+    def data_dir(self, name):
+        """
+        Returns the dataset directory of a shard, to load it with a DatasetHandle.
+        :param name: The shard's name.
+        """
+        return os.path.join(self._shards_dir, name)
+
+    def version(self):
+        """
+        Returns the version of the full dataset that the shards were built from, or None if there are no
+        shards.
+        """
+        return self._current_manifest()["version"]
+
+    def _covering_shards(self, lookup, starting_city, max_distance, end_city):
+        """
+        Yield the shards that contain every place within max_distance of the starting city, smallest first.
+        """
+        manifest = self._current_manifest()
+        if max_distance is None:
+            return
+        lat, lng = lookup.lookup_city_geocoordinates(city_name=starting_city)
+        for shard in manifest["shards"]:
+            if (
+                haversine_km(lat, lng, *shard["center"]) + max_distance
+                > shard["radius"]
+            ):
+                continue
+            if end_city is not None and end_city not in shard["cities"]:
+                continue
+            yield shard
+
+    def route(self, lookup, starting_city, max_distance, end_city=None):
+        """
+        Find the smallest shard that contains every place within max_distance of the starting city.
+        :param lookup: The Lookup of the full dataset.
+        :param starting_city: The resolved starting city.
+        :param max_distance: The max driving distance (in km), or None.
+        :param end_city: The resolved end city, or None.
+        :return: The shard's name, or None if no shard covers the request, or the shards were built from a
+                    different version of the dataset.
+        """
+        if self.version() != lookup.version:
+            return None
+        for shard in self._covering_shards(
+            lookup=lookup,
+            starting_city=starting_city,
+            max_distance=max_distance,
+            end_city=end_city,
+        ):
+            return shard["name"]
+        return None
+
+    def covers(self, name, lookup, starting_city, max_distance, end_city=None):
+        """
+        Whether a shard contains every place within max_distance of the starting city.
+        :param name: The shard's name.
+        :param lookup: The Lookup of the shard, or of the full dataset.
+        :param starting_city: The resolved starting city.
+        :param max_distance: The max driving distance (in km), or None.
+        :param end_city: The resolved end city, or None.
+        :return: A boolean.
+        """
+        return any(
+            shard["name"] == name
+            for shard in self._covering_shards(
+                lookup=lookup,
+                starting_city=starting_city,
+                max_distance=max_distance,
+                end_city=end_city,
+            )
+        )
+
+    def stats(self):
+        """
+        Describe the shards.
+        :return: A dictionary with the version of the full dataset the shards were built from, and the number
+                    of shards.
+        """
+        manifest = self._current_manifest()
+        return {"version": manifest["version"], "num_shards": len(manifest["shards"])}
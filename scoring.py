@@ -0,0 +1,217 @@
+# Custom scoring of the suggested next parks, for requests that weigh rating, popularity and distance
+# differently from the precomputed suggestion lists.
+from collections import namedtuple
+
+from search_cache import SearchCache
+
+# Suggested hops are limited to these distances (in km), as in the precomputed suggestion lists.
+MAX_HOP_FROM_PARK = 1000
+MAX_HOP_FROM_CITY = 1500
+
+# Distances are rounded to the metre, so places can be 0 km apart. They are scored as if they were this far
+# (in km), the smallest non-zero distance, so the score stays finite.
+MIN_SCORED_DISTANCE = 0.001
+
+# How many candidates are ranked up front, per suggestion asked for. The rest are only sorted if too many
+# of the top candidates are filtered out by the search.
+TOP_K_PER_SUGGESTION = 4
+
+# A park's value is rating_weight * rating + popularity_weight * popularity + designation_bonus (if it is a
+# national park), and a candidate next park is scored by value / distance ** distance_exponent.
+# Parks rated below min_rating are never suggested. The defaults give blended_rating / distance, which is
+# the order of the precomputed suggestion lists.
+Scoring = namedtuple(
+    "Scoring",
+    [
+        "rating_weight",
+        "popularity_weight",
+        "designation_bonus",
+        "distance_exponent",
+        "min_rating",
+    ],
+    defaults=(1.0, 4.0, 1.0, 1.0, None),
+)
+
+DEFAULT_SCORING = Scoring()
+
+
+def park_value(record, scoring):
+    """
+    Returns the value of visiting a park, under the given scoring.
+    :param record: The park's ParkRecord.
+    :param scoring: A Scoring.
+    :return: The park's value. With the default scoring, this is its blended_rating.
+    """
+    value = scoring.rating_weight * record.rating
+    value += scoring.popularity_weight * record.popularity
+    if record.national_park:
+        value += scoring.designation_bonus
+    return value
+
+
+class SuggestionRanker:
+    def __init__(self, park_graph, parks, city_to_park_distances):
+        """
+        Ranks the candidate next parks on the fly, from the park attributes and the distance arrays.
+        numpy is only imported here, so the API does not import it unless a request has custom scoring.
+        :param park_graph: The ParkGraph of driving distances between parks.
+        :param parks: A dict of park place_id to ParkRecord.
+        :param city_to_park_distances: A dict of city place_id to a dict of park place_id to distance.
+        """
+        import numpy as np
+
+        self._np = np
+        self.park_ids = park_graph.park_ids
+        self._park_id_to_index = {
+            park_id: index for index, park_id in enumerate(self.park_ids)
+        }
+        # Park attributes (rating, popularity, national park), in the order of the park graph.
+        records = [parks[park_id] for park_id in self.park_ids]
+        self._attributes = np.array(
+            [(x.rating, x.popularity, x.national_park) for x in records],
+            dtype=np.float64,
+        )
+        # Copy the park graph's rows without the hops that are too long, with the attributes of each
+        # neighbor next to its distance, so ranking a row only reads contiguous slices.
+        indptr, indices, distances = park_graph.arrays()
+        distances = np.array(distances, dtype=np.float64)
+        keep = distances <= MAX_HOP_FROM_PARK
+        kept_before = np.concatenate(([0], np.cumsum(keep)))
+        self._indptr = kept_before[np.array(indptr, dtype=np.int64)].tolist()
+        self._park_rows = self._row(
+            indices=np.array(indices, dtype=np.int64)[keep], distances=distances[keep]
+        )
+        self._city_to_park_distances = city_to_park_distances
+        # City rows, built the first time a city is ranked.
+        self._city_rows = {}
+        # The top candidates of each (scoring, origin), so repeated hops from the same place, as in the
+        # Pareto search or in requests with the same weights, are as fast as the precomputed lists.
+        self._top_cache = SearchCache(max_bytes=8 * 1024 * 1024)
+
+    def _row(self, indices, distances):
+        """
+        Returns a row of candidates, as a tuple of (park indices, distances, park attributes).
+        """
+        return (
+            indices,
+            self._np.maximum(distances, MIN_SCORED_DISTANCE),
+            self._attributes[indices],
+        )
+
+    def _park_row(self, park_id):
+        index = self._park_id_to_index[park_id]
+        start, end = self._indptr[index], self._indptr[index + 1]
+        return tuple(x[start:end] for x in self._park_rows)
+
+    def _city_row(self, city_id):
+        row = self._city_rows.get(city_id)
+        if row is None:
+            np = self._np
+            pairs = [
+                (self._park_id_to_index[park_id], distance)
+                for park_id, distance in self._city_to_park_distances[city_id].items()
+                if distance != "N/A"
+                and distance <= MAX_HOP_FROM_CITY
+                and park_id in self._park_id_to_index
+            ]
+            row = self._row(
+                indices=np.array([x[0] for x in pairs], dtype=np.int64),
+                distances=np.array([x[1] for x in pairs], dtype=np.float64),
+            )
+            self._city_rows[city_id] = row
+        return row
+
+    def _score(self, row, scoring):
+        """
+        Score a row of candidates.
+        :param row: The candidates, as returned by _row.
+        :param scoring: A Scoring.
+        :return: A tuple of (park indices, scores) of the candidates that are rated highly enough.
+        """
+        np = self._np
+        indices, distances, attributes = row
+        weights = np.array(
+            (
+                scoring.rating_weight,
+                scoring.popularity_weight,
+                scoring.designation_bonus,
+            )
+        )
+        scores = attributes @ weights
+        if scoring.distance_exponent == 1:
+            scores /= distances
+        else:
+            scores /= distances**scoring.distance_exponent
+        if scoring.min_rating is not None:
+            keep = attributes[:, 0] >= scoring.min_rating
+            indices, scores = indices[keep], scores[keep]
+        return indices, scores
+
+    def _ranked(self, origin, get_row, scoring, num_suggestions):
+        """
+        Yield the candidates best first. Only the top candidates are sorted up front, with argpartition,
+        since the search usually stops after the first few that fit. The rest are sorted if needed.
+        :param origin: A hashable key for the origin, for the cache.
+        :param get_row: A function that returns the origin's row of candidates.
+        :param scoring: A Scoring.
+        :param num_suggestions: How many suggestions the search needs.
+        :return: A generator of place_ids, best first.
+        """
+        np = self._np
+        k = num_suggestions * TOP_K_PER_SUGGESTION
+        key = (scoring, origin, k)
+        cached = self._top_cache.get(key)
+        if cached is None:
+            indices, scores = self._score(row=get_row(), scoring=scoring)
+            if k >= len(scores):
+                top = np.argsort(-scores, kind="stable")
+            else:
+                top = np.argpartition(-scores, k)[:k]
+                top = top[np.argsort(-scores[top], kind="stable")]
+            cached = (
+                tuple(self.park_ids[index] for index in indices[top].tolist()),
+                k >= len(scores),
+            )
+            self._top_cache.put(key, cached)
+        top_ids, complete = cached
+        yield from top_ids
+        if complete:
+            return
+        # The search needs more than the top candidates, so sort the rest too.
+        indices, scores = self._score(row=get_row(), scoring=scoring)
+        rest = np.ones(len(scores), dtype=bool)
+        rest[np.argpartition(-scores, k)[:k]] = False
+        rest = np.flatnonzero(rest)
+        rest = rest[np.argsort(-scores[rest], kind="stable")]
+        for index in indices[rest].tolist():
+            yield self.park_ids[index]
+
+    def suggestions_from_park(self, park_id, scoring, num_suggestions):
+        """
+        Rank a park's neighbors in the park graph as the next park to visit.
+        :param park_id: place_id of the park.
+        :param scoring: A Scoring.
+        :param num_suggestions: How many suggestions the search needs.
+        :return: A generator of place_ids of parks, best first.
+        """
+        return self._ranked(
+            origin=park_id,
+            get_row=lambda: self._park_row(park_id),
+            scoring=scoring,
+            num_suggestions=num_suggestions,
+        )
+
+    def suggestions_from_city(self, city_id, scoring, num_suggestions):
+        """
+        Rank the parks as the first park to visit from a city.
+        :param city_id: place_id of the city.
+        :param scoring: A Scoring.
+        :param num_suggestions: How many suggestions the search needs.
+        :return: A generator of place_ids of parks, best first.
+        """
+        return self._ranked(
+            origin=city_id,
+            get_row=lambda: self._city_row(city_id),
+            scoring=scoring,
+            num_suggestions=num_suggestions,
+        )
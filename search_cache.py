@@ -0,0 +1,110 @@
+# A bounded, thread-safe LRU memo table that is shared between requests in a worker.
+import sys
+import threading
+from collections import OrderedDict
+
+
+def _estimate_size(obj):
+    """
+    Roughly estimate the memory used by a (possibly nested) key or value.
+    Tuples, lists and frozensets are followed all the way down, which includes the linked lists of hops in
+    cached Pareto fronts. Objects reached more than once within the value are counted once, but suffixes
+    shared with other entries are counted for every entry, so this is an upper bound. Strings are not
+    counted, as they are place_ids and state codes shared with the dataset.
+    :param obj: The object to measure.
+    :return: The estimated size, in bytes.
+    """
+    size = 0
+    seen = set()
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, str) or id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, (tuple, list, frozenset)):
+            stack.extend(obj)
+    return size
+
+
+class SearchCache:
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        """
+        :param max_bytes: The estimated memory the cache may use before the least recently used entries
+                            are evicted.
+        """
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, estimated size in bytes).
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, key):
+        """
+        Returns the cached value for a key, and marks it as recently used.
+        :param key: A hashable key.
+        :return: The cached value, or None if the key is not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[0]
+
+    def put(self, key, value, size=None):
+        """
+        Store a value, evicting the least recently used entries if the cache grows too large.
+        :param key: A hashable key.
+        :param value: The value to store.
+        :param size: Optional. The memory used by the key and value (in bytes), for callers that can count it
+                        more cheaply than walking them. Estimated if None.
+        :return: None
+        """
+        if size is None:
+            size = _estimate_size(key) + _estimate_size(value)
+        with self._lock:
+            old_entry = self._entries.pop(key, None)
+            if old_entry is not None:
+                self._bytes -= old_entry[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        """
+        Remove all entries. The hit and miss counters are kept.
+        :return: None
+        """
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Describe the cache usage.
+        :return: A dictionary with the number of entries, estimated memory, and hit/miss/eviction counts.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "memory_bytes": self._bytes,
+                "max_bytes": self._max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+            }
+
+
+# The cache of best continuations for the Pareto search, shared by every request in this worker.
+pareto_cache = SearchCache()
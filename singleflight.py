@@ -0,0 +1,62 @@
+# Coalesces identical concurrent calls, so that only the first one does the work.
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    def __init__(self):
+        """
+        Calls with the same key that overlap in time share one execution: the first caller runs the
+        function, and the others wait on its future and get the same result, or the same exception.
+        Only threading primitives are used, which gevent and eventlet workers patch to be cooperative, so
+        waiting callers yield to the one doing the work under both threaded and async workers.
+        """
+        self._lock = threading.Lock()
+        self._in_flight = {}  # key -> Future of the running call.
+        self._calls = 0
+        self._executions = 0
+        self._coalesced = 0
+
+    def do(self, key, fn):
+        """
+        Run fn, unless a call with the same key is already running, in which case wait for its result.
+        :param key: A hashable key. Calls with equal keys must return equal results.
+        :param fn: A function with no arguments.
+        :return: A tuple of (the result of fn, whether the result was shared from another call).
+        """
+        with self._lock:
+            self._calls += 1
+            future = self._in_flight.get(key)
+            shared = future is not None
+            if shared:
+                self._coalesced += 1
+            else:
+                future = Future()
+                self._in_flight[key] = future
+                self._executions += 1
+        if shared:
+            return future.result(), True
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            # Calls made from now on start a new execution, so they see newer data.
+            with self._lock:
+                del self._in_flight[key]
+        return future.result(), False
+
+    def stats(self):
+        """
+        Describe how many calls were coalesced.
+        :return: A dictionary with the number of calls, executions, coalesced calls, the coalesce rate and
+                    the number of calls in flight.
+        """
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "executions": self._executions,
+                "coalesced": self._coalesced,
+                "coalesce_rate": self._coalesced / self._calls if self._calls else 0.0,
+                "in_flight": len(self._in_flight),
+            }
@@ -0,0 +1,353 @@
+import json
+import sqlite3
+
+import pytest
+
+import api
+from dataset import DatasetHandle
+from itinerary_library import ItineraryLibrary
+from park_graph import haversine_km
+from region_shards import ShardRouter, build_region_shards
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        api,
+        "itinerary_library",
+        ItineraryLibrary(file_name=str(tmp_path / "itinerary_library.sqlite")),
+    )
+    return api.app.test_client()
+
+
+def _city_name():
+    return api.dataset.current().lookup.all_city_names()[0]
+
+
+def _seeded_request(client, headers=None):
+    return client.get(
+        "/api",
+        query_string={"start_city": _city_name(), "max_distance": 800, "seed": 7},
+        headers=headers or {},
+    )
+
+
+def test_seeded_trips_are_revalidated_with_their_etag(client):
+    response = _seeded_request(client)
+    assert response.status_code == 200
+    assert response.get_json()["result"] == "ok"
+    etag = response.headers["ETag"]
+
+    again = _seeded_request(client, headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.headers["ETag"] == etag
+    assert again.data == b""
+
+
+def test_revalidated_trips_are_not_routed(client, monkeypatch):
+    etag = _seeded_request(client).headers["ETag"]
+
+    def route_lookup(**kwargs):
+        raise AssertionError("A revalidated request was routed.")
+
+    monkeypatch.setattr(api, "route_lookup", route_lookup)
+    assert _seeded_request(client, headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_pareto_trips_do_not_depend_on_the_search_cache(client):
+    query_string = {"start_city": _city_name(), "max_distance": 1500, "mode": "pareto"}
+    api.pareto_cache.clear()
+    cold = client.get("/api", query_string=query_string)
+    warm = client.get("/api", query_string=query_string)
+    assert cold.get_json()["result"] == "ok"
+    # The ETag is strong, so the body must be byte for byte the same.
+    assert warm.data == cold.data
+    assert warm.headers["ETag"] == cold.headers["ETag"]
+
+    again = client.get(
+        "/api",
+        query_string=query_string,
+        headers={"If-None-Match": cold.headers["ETag"]},
+    )
+    assert again.status_code == 304
+
+
+def test_unseeded_trips_have_no_etag(client):
+    response = client.get(
+        "/api", query_string={"start_city": _city_name(), "max_distance": 800}
+    )
+    assert response.status_code == 200
+    assert "ETag" not in response.headers
+
+
+def test_rebuilding_the_library_changes_the_etag(client, tmp_path):
+    etag = _seeded_request(client).headers["ETag"]
+
+    connection = sqlite3.connect(str(tmp_path / "itinerary_library.sqlite"))
+    connection.execute(
+        "CREATE TABLE buckets (city_id TEXT, max_distance REAL, num_paths INTEGER, "
+        "total_score REAL, PRIMARY KEY (city_id, max_distance))"
+    )
+    connection.commit()
+    connection.close()
+
+    response = _seeded_request(client, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+def _parks_without_a_route(lookup):
+    parks = lookup.all_park_ids()
+    for origin_id in parks:
+        for dest_id in parks:
+            if (
+                origin_id != dest_id
+                and lookup.distance_from_park_to_park(origin_id, dest_id) == "N/A"
+            ):
+                return origin_id, dest_id
+
+
+def _replan(client, path, index):
+    return client.get(
+        "/api/replan",
+        query_string={"path": ",".join(path), "index": index, "max_distance": 20000},
+    ).get_json()
+
+
+def test_replanning_a_path_with_unknown_places_is_rejected(client):
+    lookup = api.dataset.current().lookup
+    city_id = lookup.lookup_city_id(city_name=_city_name())
+    park_id = lookup.all_park_ids()[0]
+    assert _replan(client, [city_id, "unknown", city_id], 1) == {
+        "result": "Invalid path provided."
+    }
+    assert _replan(client, [city_id, park_id, "unknown"], 5) == {
+        "result": "Invalid path provided."
+    }
+
+
+def test_replanning_kept_parks_without_a_route_is_an_error(client):
+    lookup = api.dataset.current().lookup
+    city_id = lookup.lookup_city_id(city_name=_city_name())
+    origin_id, dest_id = _parks_without_a_route(lookup)
+    response = _replan(
+        client, [city_id, origin_id, dest_id, lookup.all_park_ids()[0], city_id], 3
+    )
+    assert response == {"result": f"There is no route to the kept park {dest_id}."}
+
+
+def test_streamed_trips_have_their_days(client):
+    response = client.get(
+        "/api/stream",
+        query_string={
+            "start_city": _city_name(),
+            "max_daily_km": 500,
+            "days": 4,
+            "seed": 1,
+        },
+    )
+    lines = [json.loads(x) for x in response.data.decode().splitlines()]
+    assert lines[-1]["result"] == "ok"
+    assert lines[-1]["total_days"] == lines[-2]["day"] <= 4
+    assert [x["day"] for x in lines[:-1]] == sorted(x["day"] for x in lines[:-1])
+    # A hop stops for the night exactly when it starts a new day.
+    days = [1] + [x["day"] for x in lines[:-1]]
+    assert [("overnight" in x) for x in lines[:-1]] == [
+        a < b for a, b in zip(days, days[1:])
+    ]
+
+
+def test_streamed_and_replanned_trips_visit_the_must_visit_parks(client):
+    lookup = api.dataset.current().lookup
+    city_name = lookup.all_city_names()[1]
+    lat, lng = lookup.lookup_city_geocoordinates(city_name=city_name)
+    park_id = min(
+        lookup.all_park_ids(),
+        key=lambda x: haversine_km(
+            lat, lng, *map(float, lookup.lookup_park_geocoordinates(place_id=x))
+        ),
+    )
+    park_name = lookup.lookup_park_name(place_id=park_id)
+    query = {
+        "start_city": city_name,
+        "max_distance": 2000,
+        "must_visit": park_name,
+        "seed": 1,
+    }
+    response = client.get("/api/stream", query_string=query)
+    lines = [json.loads(x) for x in response.data.decode().splitlines()]
+    assert lines[-1]["result"] == "ok"
+    assert park_name in [x["name"] for x in lines[:-1]]
+
+    trip = client.get("/api", query_string=query).get_json()
+    place_ids = [x["place_id"] for x in trip["path"]]
+    index = next(i for i, x in enumerate(place_ids[1:-1], 1) if x != park_id)
+    query = {"path": ",".join(place_ids), "index": index, "max_distance": 2000}
+    replanned = client.get(
+        "/api/replan", query_string=dict(query, must_visit=park_name)
+    ).get_json()
+    assert replanned["result"] == "ok"
+    assert park_id in [x["place_id"] for x in replanned["path"]]
+
+
+def test_misspelled_end_cities_are_resolved_and_unknown_ones_rejected(client):
+    lookup = api.dataset.current().lookup
+    end_city = lookup.all_city_names()[3]
+    response = client.get(
+        "/api",
+        query_string={
+            "start_city": _city_name(),
+            "end_city": end_city.lower(),
+            "max_distance": 6000,
+            "seed": 1,
+        },
+    ).get_json()
+    assert response["result"] == "ok"
+    assert response["path"][-1]["name"] == end_city
+
+    response = client.get(
+        "/api",
+        query_string={
+            "start_city": _city_name(),
+            "end_city": "Qqqqqq, ZZ",
+            "max_distance": 6000,
+        },
+    ).get_json()
+    assert response == {"result": "Invalid city name Qqqqqq, ZZ provided."}
+
+
+def test_streamed_trips_match_the_seeded_trip(client):
+    query = {"start_city": _city_name(), "max_distance": 1500, "seed": 3}
+    response = client.get("/api/stream", query_string=query)
+    assert response.mimetype == "application/x-ndjson"
+    lines = [json.loads(x) for x in response.data.decode().splitlines()]
+    trip = client.get("/api", query_string=query).get_json()
+    assert trip["result"] == lines[-1]["result"] == "ok"
+    assert [x["name"] for x in lines[:-1]] == [x["name"] for x in trip["path"]]
+    assert lines[0]["distance"] == 0
+    assert lines[-1]["total_distance"] == sum(x["distance"] for x in lines[:-1])
+    for line in lines[:-1]:
+        assert line["hours_remaining"] is None
+    driven = 0
+    for line in lines[:-1]:
+        driven += line["distance"]
+        assert abs(line["distance_remaining"] - (1500 - driven)) < 1e-6
+
+
+def test_streamed_requests_without_a_start_city_send_only_the_error(client):
+    response = client.get("/api/stream", query_string={"max_distance": 1500})
+    assert response.data.decode().splitlines() == [
+        json.dumps({"result": "Provide start_city."})
+    ]
+
+
+def test_trips_can_be_budgeted_in_hours(client):
+    trip = client.get(
+        "/api", query_string={"start_city": _city_name(), "max_hours": 15, "seed": 2}
+    ).get_json()
+    assert trip["result"] == "ok"
+    assert 0 < trip["total_hours"] <= 15
+
+
+@pytest.mark.parametrize("endpoint", ["/api", "/api/stream", "/api/replan"])
+def test_invalid_scoring_weights_are_rejected(client, endpoint):
+    response = client.get(
+        endpoint,
+        query_string={
+            "start_city": _city_name(),
+            "max_distance": 800,
+            "rating_weight": "abc",
+        },
+    )
+    assert response.status_code == 400
+    assert json.loads(response.data.decode().splitlines()[-1]) == {
+        "result": "rating_weight must be a number."
+    }
+
+
+def test_scoring_weights_fall_back_to_the_defaults(client):
+    trip = _seeded_request(client)
+    default_weights = client.get(
+        "/api",
+        query_string={
+            "start_city": _city_name(),
+            "max_distance": 800,
+            "seed": 7,
+            "rating_weight": 1,
+            "popularity_weight": "4.0",
+        },
+    )
+    assert default_weights.status_code == 200
+    assert default_weights.get_json() == trip.get_json()
+    assert default_weights.headers["ETag"] == trip.headers["ETag"]
+
+
+@pytest.fixture(scope="module")
+def shards_dir(tmp_path_factory):
+    shards_dir = str(tmp_path_factory.mktemp("shards"))
+    build_region_shards(shards_dir=shards_dir, radii=(1000,))
+    return shards_dir
+
+
+def _covered_trip(shards_dir, max_distance):
+    """
+    Returns the shard with the most parks, and a city it covers trips of max_distance from.
+    """
+    with open(f"{shards_dir}/shards.json") as f:
+        shard = max(json.load(f)["shards"], key=lambda x: x["num_parks"])
+    lookup = api.dataset.current().lookup
+    for city_name in shard["cities"]:
+        lat, lng = lookup.lookup_city_geocoordinates(city_name=city_name)
+        if haversine_km(lat, lng, *shard["center"]) + max_distance <= shard["radius"]:
+            return shard, city_name
+
+
+def test_region_workers_only_serve_the_trips_their_shard_covers(
+    client, shards_dir, monkeypatch
+):
+    shard, city_name = _covered_trip(shards_dir, max_distance=400)
+    full_trip = client.get(
+        "/api",
+        query_string={"start_city": city_name, "max_distance": 400, "seed": 3},
+    )
+    router = ShardRouter(shards_dir=shards_dir)
+    monkeypatch.setattr(api, "shard_router", router)
+    monkeypatch.setattr(api, "SERVED_SHARD", shard["name"])
+    monkeypatch.setattr(
+        api, "dataset", DatasetHandle(data_dir=router.data_dir(shard["name"]))
+    )
+
+    response = client.get(
+        "/api",
+        query_string={"start_city": city_name, "max_distance": 400, "seed": 3},
+    )
+    trip = response.get_json()
+    assert trip["result"] == "ok"
+    assert response.headers["X-Dataset-Shard"] == shard["name"]
+    assert api.dataset.current().lookup.is_path([x["place_id"] for x in trip["path"]])
+
+    # The same trip from the full dataset has another ETag.
+    assert response.headers["ETag"] != full_trip.headers["ETag"]
+
+    response = client.get(
+        "/api",
+        query_string={"start_city": city_name, "max_distance": shard["radius"]},
+    )
+    assert response.get_json() == {
+        "result": f"This server only serves trips within the {shard['name']} region."
+    }
+
+
+def test_other_workers_name_the_region_shard_of_a_trip(client, shards_dir, monkeypatch):
+    shard, city_name = _covered_trip(shards_dir, max_distance=400)
+    router = ShardRouter(shards_dir=shards_dir)
+    monkeypatch.setattr(api, "shard_router", router)
+    response = client.get(
+        "/api",
+        query_string={"start_city": city_name, "max_distance": 400, "seed": 3},
+    )
+    assert response.get_json()["result"] == "ok"
+    assert "X-Dataset-Shard" not in response.headers
+    assert response.headers["X-Region-Shard"] == router.route(
+        api.dataset.current().lookup, starting_city=city_name, max_distance=400
+    )
@@ -0,0 +1,58 @@
+import io
+import json
+
+import batch_trips
+from batch_trips import generate_trips, read_jobs
+from lookup import Lookup
+
+
+def _write_jobs(tmp_path):
+    city_names = Lookup().all_city_names()
+    jobs_file = tmp_path / "jobs.jsonl"
+    jobs_file.write_text(
+        "\n".join(
+            [
+                json.dumps(
+                    {"start_city": city_names[0], "max_distance": 2000, "count": 250}
+                ),
+                "",
+                json.dumps(
+                    {
+                        "start_city": city_names[4],
+                        "max_distance": 4000,
+                        "count": 120,
+                        "seed": 7,
+                        "end_city": city_names[5],
+                    }
+                ),
+            ]
+        )
+    )
+    return str(jobs_file)
+
+
+def _generate(jobs, processes):
+    output = io.StringIO()
+    written = generate_trips(jobs=jobs, output=output, processes=processes)
+    return written, output.getvalue().splitlines()
+
+
+def test_read_jobs_fills_in_the_defaults(tmp_path):
+    jobs = read_jobs(_write_jobs(tmp_path))
+    assert [job["seed"] for job in jobs] == [0, 7]
+    assert jobs[0]["end_city"] is None
+
+
+def test_trips_do_not_depend_on_the_number_of_workers(tmp_path, monkeypatch):
+    # Small chunks, so the jobs are split between the workers.
+    monkeypatch.setattr(batch_trips, "CHUNK_SIZE", 50)
+    jobs = read_jobs(_write_jobs(tmp_path))
+    written, lines = _generate(jobs, processes=1)
+    assert written == len(lines) == 370
+    assert _generate(jobs, processes=3) == (written, lines)
+
+    trips = [json.loads(line) for line in lines]
+    assert [(trip["job"], trip["trip"]) for trip in trips] == [
+        (0, trip) for trip in range(250)
+    ] + [(1, trip) for trip in range(120)]
+    assert len({tuple(trip["path"]) for trip in trips}) > 1
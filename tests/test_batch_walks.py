@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from batch_walks import BatchWalker
+from lookup import Lookup
+from park_graph import haversine_km
+
+
+@pytest.fixture(scope="module")
+def lookup():
+    return Lookup()
+
+
+@pytest.fixture(scope="module")
+def walker(lookup):
+    return BatchWalker(lookup=lookup)
+
+
+def _trips(walker, seed, **kwargs):
+    walks = walker.run(num_walks=500, seed=seed, **kwargs)
+    return walks, walker.paths(walks)
+
+
+@pytest.mark.parametrize("weighting", ["uniform", "halving"])
+@pytest.mark.parametrize("city_index, max_distance", [(0, 1500), (4, 4000)])
+def test_walks_stay_within_the_distance_budget(
+    lookup, walker, weighting, city_index, max_distance
+):
+    _, trips = _trips(
+        walker,
+        seed=0,
+        starting_city=lookup.all_city_names()[city_index],
+        max_distance=max_distance,
+        weighting=weighting,
+    )
+    assert all(path for path, _ in trips)
+    for path, distances in trips:
+        assert len(distances) == len(path) - 1
+        assert sum(distances) <= max_distance + 1e-6
+        assert distances[0] == lookup.distance_from_city_to_park(path[0], path[1])
+        for origin_id, dest_id, distance in zip(path[1:-2], path[2:-1], distances[1:]):
+            assert distance == lookup.distance_from_park_to_park(origin_id, dest_id)
+        assert distances[-1] == lookup.distance_to_nearest_city(path[-2])
+
+
+def test_walks_never_visit_blocked_parks_or_return_to_a_state(lookup, walker):
+    _, trips = _trips(
+        walker, seed=1, starting_city=lookup.all_city_names()[2], max_distance=6000
+    )
+    assert max(len(path) for path, _ in trips) > 5
+    for path, _ in trips:
+        blocked = set()
+        left_states = set()
+        state = None
+        for park_id in path[1:-1]:
+            assert park_id not in blocked
+            park_state = lookup.lookup_park_state(place_id=park_id)
+            assert park_state not in left_states
+            if state is not None and park_state != state:
+                left_states.add(state)
+            state = park_state
+            blocked.add(park_id)
+            blocked.update(lookup.parks_too_close_to_park_id(park_id=park_id))
+
+
+def test_walks_end_in_the_chosen_end_city(lookup, walker):
+    city_names = lookup.all_city_names()
+    coordinates = lookup.lookup_city_geocoordinates(city_name=city_names[0])
+    end_city = min(
+        city_names[1:],
+        key=lambda x: haversine_km(
+            *coordinates, *lookup.lookup_city_geocoordinates(city_name=x)
+        ),
+    )
+    end_city_id = lookup.lookup_city_id(city_name=end_city)
+    _, trips = _trips(
+        walker,
+        seed=2,
+        starting_city=city_names[0],
+        max_distance=3000,
+        end_city=end_city,
+    )
+    end_city_distances = lookup.distances_to_city(city_id=end_city_id)
+    assert all(path for path, _ in trips)
+    for path, distances in trips:
+        assert path[-1] == end_city_id
+        assert distances[-1] == end_city_distances[path[-2]]
+        assert sum(distances) <= 3000 + 1e-6
+
+
+def test_walks_are_reproducible_with_a_seed(lookup, walker):
+    kwargs = {"starting_city": lookup.all_city_names()[3], "max_distance": 3000}
+    walks, trips = _trips(walker, seed=5, **kwargs)
+    again, trips_again = _trips(walker, seed=5, **kwargs)
+    for key in ("parks", "distances", "end_city", "end_distance"):
+        assert np.array_equal(walks[key], again[key])
+    assert trips == trips_again
+    _, other_trips = _trips(walker, seed=6, **kwargs)
+    assert other_trips != trips
+
+
+def test_no_walks_are_possible_within_a_tiny_budget(lookup, walker):
+    walks, trips = _trips(
+        walker, seed=0, starting_city=lookup.all_city_names()[0], max_distance=1
+    )
+    assert trips == [([], [])] * 500
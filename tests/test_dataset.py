@@ -0,0 +1,95 @@
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+from dataset import MANIFEST_FILE, DatasetHandle, write_dataset_manifest
+from lookup import Lookup
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for entry in os.scandir("data"):
+        if entry.is_file():
+            shutil.copyfile(entry.path, tmp_path / entry.name)
+    return str(tmp_path)
+
+
+def _rename_a_park(data_dir, new_name):
+    with open(os.path.join(data_dir, "park_hot.json")) as f:
+        park_id = sorted(json.load(f)["parks"])[0]
+    file_name = os.path.join(data_dir, "place_ids_to_park_name.json")
+    with open(file_name) as f:
+        names = json.load(f)
+    names[park_id] = new_name
+    with open(file_name, "w") as fp:
+        json.dump(names, fp)
+    return park_id
+
+
+def _wait_for_reload(handle):
+    deadline = time.monotonic() + 30
+    while handle._loading and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _check_for_new_version(handle):
+    _wait_for_reload(handle)
+    handle.current()
+    _wait_for_reload(handle)
+    return handle.current()
+
+
+def test_the_dataset_matches_its_manifest():
+    with open(os.path.join("data", MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    for file_name, file_hash in Lookup().file_hashes.items():
+        assert manifest["files"][file_name] == file_hash, file_name
+
+
+def test_a_new_version_is_swapped_in_once_its_manifest_is_written(data_dir):
+    swapped = []
+    handle = DatasetHandle(data_dir=data_dir, poll_interval=0, on_swap=swapped.append)
+    old_dataset = handle.current()
+
+    # The pipeline has written some of the new files, but not the manifest yet.
+    park_id = _rename_a_park(data_dir, "A Renamed Park")
+    assert _check_for_new_version(handle) is old_dataset
+    assert handle.stats()["reloads"] == 0
+
+    write_dataset_manifest(data_dir=data_dir)
+    dataset = _check_for_new_version(handle)
+    assert dataset is not old_dataset
+    assert dataset.version != old_dataset.version
+    assert swapped == [dataset]
+    assert handle.stats()["reloads"] == 1
+    assert dataset.lookup.resolve_park_name("A Renamed Park") == park_id
+    # Requests that started on the old version keep a consistent view of it.
+    assert old_dataset.lookup.resolve_park_name("A Renamed Park") != park_id
+
+
+def test_datasets_without_a_manifest_are_not_swapped_in_while_changing(data_dir):
+    os.remove(os.path.join(data_dir, MANIFEST_FILE))
+    handle = DatasetHandle(data_dir=data_dir, poll_interval=0)
+    fingerprint = handle._artifact_fingerprint()
+    _rename_a_park(data_dir, "A Renamed Park")
+    with pytest.raises(ValueError):
+        handle._load(fingerprint=fingerprint)
+
+    dataset = _check_for_new_version(handle)
+    assert handle.stats()["reloads"] == 1
+    assert dataset.lookup.resolve_park_name("A Renamed Park") is not None
+
+
+def test_an_inconsistent_dataset_is_loaded_again_at_the_next_check(data_dir):
+    _rename_a_park(data_dir, "A Renamed Park")
+    handle = DatasetHandle(data_dir=data_dir, poll_interval=0)
+    old_dataset = handle.stats()
+    write_dataset_manifest(data_dir=data_dir)
+    dataset = _check_for_new_version(handle)
+    # The files did not change, so the version is the same, but it is now known to be consistent.
+    assert dataset.version == old_dataset["version"]
+    assert handle.stats()["reloads"] == 0
+    assert handle._fingerprint == handle._artifact_fingerprint()
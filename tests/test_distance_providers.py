@@ -0,0 +1,216 @@
+import json
+import math
+import os
+import sys
+import types
+
+import pytest
+
+from distance_providers import LocalRoadNetworkProvider, make_synthetic_road_graph
+from google_distance_matrix import GDistanceMatrix
+from park_graph import AVERAGE_SPEED_KMH, ParkGraph, build_park_graph, haversine_km
+
+# A few places around Utah, and one at the same spot as another, which snaps to the same road node.
+PLACES = {
+    "arches": (38.73, -109.59),
+    "canyonlands": (38.33, -109.88),
+    "capitol_reef": (38.37, -111.26),
+    "bryce": (37.59, -112.19),
+    "zion": (37.30, -113.03),
+    "moab": (38.57, -109.55),
+    "moab_visitor_center": (38.57, -109.55),
+}
+DETOUR = 1.3
+
+
+@pytest.fixture(scope="module")
+def provider(tmp_path_factory):
+    file_name = str(tmp_path_factory.mktemp("roads") / "roads.npz")
+    make_synthetic_road_graph(
+        PLACES, file_name=file_name, extra_nodes=300, neighbors=6, detour=DETOUR
+    )
+    return LocalRoadNetworkProvider(graph_file=file_name, place_coordinates=PLACES)
+
+
+def _distances(response):
+    return [
+        [
+            x["distance"]["value"] if x["status"] == "OK" else None
+            for x in row["elements"]
+        ]
+        for row in response["rows"]
+    ]
+
+
+def test_one_to_many_matches_point_to_point(provider):
+    places = list(PLACES)
+    matrix = _distances(provider.distance_matrix(places, places))
+    for i, origin in enumerate(places):
+        for j, dest in enumerate(places):
+            (single,) = _distances(provider.distance_matrix([origin], [dest]))
+            assert single[0] == matrix[i][j]
+
+
+def test_distances_are_never_shorter_than_the_roads_allow(provider):
+    places = list(PLACES)
+    matrix = _distances(provider.distance_matrix(places, places))
+    for i, origin in enumerate(places):
+        for j, dest in enumerate(places):
+            if matrix[i][j] is None:
+                continue
+            # Every road is the straight line times the detour, so no route can beat that.
+            straight_line_m = haversine_km(*PLACES[origin], *PLACES[dest]) * 1000
+            assert matrix[i][j] >= math.floor(straight_line_m * DETOUR * 0.999)
+            # Roads go both ways, so the graph is symmetric.
+            assert matrix[i][j] == matrix[j][i]
+
+
+def test_places_on_the_same_road_node_are_zero_apart(provider, tmp_path):
+    response = provider.distance_matrix(["moab"], ["moab_visitor_center"])
+    assert _distances(response) == [[0]]
+
+    distance_matrix = GDistanceMatrix(provider=provider)
+    file_name = str(tmp_path / "test_distances.json")
+    distance_matrix._block_distance_matrix_request(
+        file_name=file_name,
+        origin_ids=["moab"],
+        dest_ids=["moab", "moab_visitor_center", "arches"],
+    )
+    with open(file_name) as f:
+        distances = json.load(f)["moab"]
+    # The same place is not a hop, but two places on the same road node are.
+    assert distances["moab"] == "N/A"
+    assert distances["moab_visitor_center"] == 0
+    assert distances["arches"] > 0
+
+
+def test_durations_are_saved_next_to_the_distances(provider, tmp_path):
+    distance_matrix = GDistanceMatrix(provider=provider)
+    file_name = str(tmp_path / "test_distances.json")
+    places = ["arches", "bryce", "zion"]
+    distance_matrix._block_distance_matrix_request(
+        file_name=file_name, origin_ids=places, dest_ids=places
+    )
+    with open(file_name) as f:
+        distances = json.load(f)
+    with open(str(tmp_path / "test_durations.json")) as f:
+        durations = json.load(f)
+    assert distance_matrix._load_duration_dict(file_name) == durations
+    for origin in places:
+        for dest in places:
+            if origin == dest:
+                assert durations[origin][dest] == "N/A"
+                continue
+            # The road graph has no speeds, so durations are at the average speed.
+            assert math.isclose(
+                durations[origin][dest],
+                distances[origin][dest] / AVERAGE_SPEED_KMH,
+                rel_tol=1e-3,
+            )
+
+
+def test_the_park_graph_keeps_the_durations():
+    distance_rows = {
+        "a": {"b": 100.0, "c": 300.0},
+        "b": {"a": 100.0, "c": "N/A"},
+        "c": {"a": 300.0},
+    }
+    duration_rows = {"a": {"b": 1.5}, "c": {"a": 4.0}}
+    graph = ParkGraph(
+        build_park_graph(distance_rows=distance_rows, k=2, duration_rows=duration_rows)
+    )
+    assert graph.duration("a", "b") == 1.5
+    # Missing durations are estimated from the distance.
+    assert graph.duration("a", "c") == 300.0 / AVERAGE_SPEED_KMH
+    assert graph.duration("c", "a") == 4.0
+    assert graph.duration("b", "c") == "N/A"
+    # Graphs built without durations estimate all of them.
+    graph = ParkGraph(build_park_graph(distance_rows=distance_rows, k=2))
+    assert graph.duration("a", "b") == 100.0 / AVERAGE_SPEED_KMH
+
+
+def _park_info(place_id):
+    return {
+        "place_id": place_id,
+        "latitude": PLACES[place_id][0],
+        "longitude": PLACES[place_id][1],
+    }
+
+
+def test_the_park_graph_is_built_from_every_park(provider, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    parks = ["arches", "canyonlands", "capitol_reef", "bryce", "zion"]
+    with open("data/park_data.json", "w") as fp:
+        json.dump({name.title(): _park_info(name) for name in parks}, fp)
+    # Only some of the parks are in the cleaned park info, which is built from the graph.
+    with open("data/park_id_to_park_info.json", "w") as fp:
+        json.dump({x: {} for x in parks[:2]}, fp)
+
+    GDistanceMatrix(provider=provider).build_park_graph(k=2, num_candidates=3)
+    with open("data/park_graph.json") as f:
+        graph = ParkGraph(json.load(f))
+    assert sorted(graph.park_ids) == sorted(parks)
+    for park_id in parks:
+        assert len(graph.neighbors(park_id)) == 2
+
+
+def test_refreshed_parks_are_added_to_the_park_graph(provider, tmp_path, monkeypatch):
+    # keys.py holds the API keys, and is not in the repository.
+    monkeypatch.setitem(sys.modules, "keys", types.SimpleNamespace(NPS_API_KEY=""))
+    from google_maps_services import GMapsServices
+
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data")
+    parks = ["arches", "canyonlands", "capitol_reef", "bryce"]
+    with open("data/nps_raw_park_data.json", "w") as fp:
+        json.dump({name.title(): {"state": "UT"} for name in parks}, fp)
+    with open("data/park_data.json", "w") as fp:
+        json.dump({name.title(): _park_info(name) for name in parks}, fp)
+    with open("data/cities_to_place_id.json", "w") as fp:
+        json.dump({"Moab": "moab"}, fp)
+    services = GMapsServices(client=None)
+    services.g_distance_matrix = GDistanceMatrix(provider=provider)
+    services.g_distance_matrix.build_park_graph(k=2, num_candidates=3)
+    services.compute_distances_for_cities()
+    with open("data/park_graph.json") as f:
+        old_graph = ParkGraph(json.load(f))
+    old_neighbors = {x: dict(old_graph.neighbors(x)) for x in parks}
+    # The dataset only keeps the graph, so the refresh continues from its edges.
+    os.remove("data/park_candidate_distances.json")
+    os.remove("data/park_candidate_durations.json")
+
+    new_raw_park_data = {name.title(): {"state": "UT"} for name in parks + ["zion"]}
+    monkeypatch.setattr(
+        services, "_get_usa_national_parks_request", lambda: new_raw_park_data
+    )
+    monkeypatch.setattr(
+        services,
+        "_get_google_data_for_parks",
+        lambda park_info: {name: _park_info(name.lower()) for name in park_info},
+    )
+    requests = []
+
+    def distance_matrix(origin_list, destination_list):
+        requests.extend((x, y) for x in origin_list for y in destination_list)
+        return LocalRoadNetworkProvider.distance_matrix(
+            provider, origin_list=origin_list, destination_list=destination_list
+        )
+
+    monkeypatch.setattr(provider, "distance_matrix", distance_matrix)
+
+    diff = services.refresh_nps_park_data()
+    assert diff["added"] == ["Zion"]
+    # Only the distances to and from the new park are requested.
+    assert requests and all("zion" in pair for pair in requests)
+    with open("data/park_graph.json") as f:
+        graph = ParkGraph(json.load(f))
+    assert sorted(graph.park_ids) == sorted(parks + ["zion"])
+    assert sorted(dict(graph.neighbors("zion"))) == sorted(parks)
+    for park_id in parks:
+        neighbors = dict(graph.neighbors(park_id))
+        assert "zion" in neighbors
+        # The parks already in the graph keep their edges.
+        assert set(old_neighbors[park_id]).issubset(neighbors)
+    with open("data/city_place_ids_to_parks_distances.json") as f:
+        assert "zion" in json.load(f)["moab"]
@@ -0,0 +1,94 @@
+import io
+from contextlib import redirect_stdout
+
+import pytest
+
+from lookup import Lookup
+from path_finder import PathFinder
+from search_cache import SearchCache
+
+
+@pytest.fixture(scope="module")
+def lookup():
+    return Lookup()
+
+
+def _pareto_paths(lookup, starting_city, max_distance, search_cache=None, **kwargs):
+    p = PathFinder(lookup=lookup, search_cache=search_cache)
+    with redirect_stdout(io.StringIO()):
+        p.generate_pareto_paths(
+            starting_city=starting_city, max_distance=max_distance, **kwargs
+        )
+    return p
+
+
+def _totals(p, path, distances):
+    return (
+        sum(distances),
+        sum(p.park_rating(place_id=x) for x in path[1:-1]),
+        len(path) - 2,
+    )
+
+
+@pytest.mark.parametrize("city_index, max_distance", [(0, 1500), (5, 3000)])
+def test_pareto_trips_fit_and_do_not_dominate_each_other(
+    lookup, city_index, max_distance
+):
+    starting_city = lookup.all_city_names()[city_index]
+    p = _pareto_paths(lookup, starting_city, max_distance, max_paths=8)
+    assert 0 < len(p.pareto_paths) <= 8
+    totals = []
+    for path, distances in p.pareto_paths:
+        assert path[0] == lookup.lookup_city_id(city_name=starting_city)
+        assert lookup.is_path(path)
+        assert len(distances) == len(path) - 1
+        assert distances[0] == lookup.distance_from_city_to_park(path[0], path[1])
+        for origin_id, dest_id, distance in zip(path[1:-2], path[2:-1], distances[1:]):
+            assert distance == lookup.distance_from_park_to_park(origin_id, dest_id)
+        assert len(set(path[1:-1])) == len(path) - 2
+        totals.append(_totals(p, path, distances))
+    assert all(x[0] <= max_distance + 1e-6 for x in totals)
+    assert [x[0] for x in totals] == sorted(x[0] for x in totals)
+    for i, a in enumerate(totals):
+        for b in totals[i + 1 :]:
+            # Longer trips must be better on rating or number of parks.
+            assert b[1] > a[1] or b[2] > a[2]
+
+
+def test_pareto_trips_end_in_the_chosen_end_city(lookup):
+    city_names = lookup.all_city_names()
+    end_city_id = lookup.lookup_city_id(city_name=city_names[2])
+    p = _pareto_paths(lookup, city_names[0], 5000, end_city=city_names[2])
+    assert p.pareto_paths
+    assert all(path[-1] == end_city_id for path, _ in p.pareto_paths)
+
+
+def test_the_pareto_response_describes_every_trip(lookup):
+    p = _pareto_paths(lookup, lookup.all_city_names()[0], 2000)
+    response = p.return_pareto_paths()
+    assert response["result"] == "ok"
+    assert len(response["paths"]) == len(p.pareto_paths)
+    for trip, (path, distances) in zip(response["paths"], p.pareto_paths):
+        assert trip["total_distance"] == sum(distances)
+        assert trip["num_parks"] == len(path) - 2
+        assert [x["place_id"] for x in trip["path"]] == path
+
+
+@pytest.mark.parametrize(
+    "city_index, warm_up_distance, max_distance",
+    [(0, 2700, 2000), (0, 1500, 1200), (10, 1500, 1000)],
+)
+def test_the_shared_cache_does_not_change_the_pareto_trips(
+    lookup, city_index, warm_up_distance, max_distance
+):
+    starting_city = lookup.all_city_names()[city_index]
+    cold = _pareto_paths(lookup, starting_city, max_distance, SearchCache())
+    shared = SearchCache()
+    _pareto_paths(lookup, starting_city, warm_up_distance, shared)
+    hits = shared.stats()["hits"]
+    warm = _pareto_paths(lookup, starting_city, max_distance, shared)
+    assert shared.stats()["hits"] > hits
+    assert warm.pareto_paths == cold.pareto_paths
+    # A repeated request gives the same trips too.
+    again = _pareto_paths(lookup, starting_city, max_distance, shared)
+    assert again.pareto_paths == cold.pareto_paths
@@ -0,0 +1,98 @@
+import io
+import json
+import random
+from contextlib import redirect_stdout
+
+import pytest
+
+from lookup import Lookup
+from park_clusters import ParkClusters, subset_clusters
+from park_graph import ParkGraph
+from path_finder import PathFinder
+
+
+@pytest.fixture(scope="module")
+def lookup():
+    return Lookup()
+
+
+@pytest.fixture(scope="module")
+def graph():
+    with open("data/park_graph.json") as f:
+        return ParkGraph(json.load(f))
+
+
+def _clusters_data():
+    # Three clusters on a line: a, then b 100 km on, then c 100 km past b, which can't be driven back from.
+    return {
+        "diameter": 50,
+        "clusters": {"a1": 0, "a2": 0, "b1": 1, "c1": 2},
+        "bounds": [[0, 100, 200], [100, 0, 100], [None, None, 0]],
+    }
+
+
+def test_plans_fit_the_distance():
+    clusters = ParkClusters(_clusters_data())
+    assert clusters.parks_of((0, 1)) == {"a1", "a2", "b1"}
+    start, end = [0, 100, 200], [0, 100, 200]
+    # Out to c and back only fits 400 km.
+    assert clusters.plan(start, end, 399, 1, random.Random(0)) == [0, 1]
+    assert clusters.plan(start, end, 400, 1, random.Random(0)) == [0, 1, 2]
+    assert clusters.plan(start, end, 50, 1, random.Random(0)) == [0]
+
+
+def test_shards_keep_only_their_parks():
+    clusters = ParkClusters(subset_clusters(_clusters_data(), park_ids={"a1", "c1"}))
+    assert clusters.cluster("b1") is None
+    assert clusters.plan([0, 100, 200], [0, 100, 200], 400, 1, random.Random(0)) == [
+        0,
+        2,
+    ]
+
+
+def test_clusters_are_within_their_diameter(lookup, graph):
+    clusters = lookup.park_clusters()
+    with open("data/park_clusters.json") as f:
+        diameter = json.load(f)["diameter"]
+    for park_id in lookup.all_park_ids():
+        cluster = clusters.cluster(park_id)
+        reach = graph.shortest_distances(place_id=park_id)
+        for other_id in clusters.parks(cluster):
+            assert reach[other_id] <= diameter
+        # The bounds are never longer than the shortest distance to a park.
+        bounds = clusters.bounds_from(cluster)
+        for other_id, distance in reach.items():
+            assert bounds[clusters.cluster(other_id)] <= distance + 1e-6
+
+
+def test_long_trips_follow_the_cluster_plan(lookup, monkeypatch):
+    plans = []
+    plan_clusters = PathFinder._plan_clusters
+
+    def record_plan(self, **kwargs):
+        plans.append(list(plan_clusters(self, **kwargs)))
+        return plans[-1][:]
+
+    monkeypatch.setattr(PathFinder, "_plan_clusters", record_plan)
+    clusters = lookup.park_clusters()
+    num_parks = num_planned_parks = 0
+    for seed, city_name in enumerate(lookup.all_city_names()[:10]):
+        path_finder = PathFinder(lookup=lookup, seed=seed)
+        with redirect_stdout(io.StringIO()):
+            path_finder.generate_path(starting_city=city_name, max_distance=8000)
+        assert path_finder.path
+        assert sum(path_finder.distances) <= 8000
+        # The trip starts in the first clusters of its plan, and mostly stays in the planned clusters.
+        parks_clusters = [clusters.cluster(x) for x in path_finder.path[1:-1]]
+        assert parks_clusters[0] in plans[-1][:2]
+        num_parks += len(parks_clusters)
+        num_planned_parks += sum(x in plans[-1] for x in parks_clusters)
+    assert num_planned_parks > num_parks * 2 / 3
+
+    # Short trips are not planned.
+    path_finder = PathFinder(lookup=lookup, seed=0)
+    with redirect_stdout(io.StringIO()):
+        path_finder.generate_path(
+            starting_city=lookup.all_city_names()[0], max_distance=2000
+        )
+    assert len(plans) == 11 and plans[-1] == []
@@ -0,0 +1,59 @@
+import json
+import os
+
+from lookup import Lookup
+from park_store import (
+    HOT_FIELDS,
+    ColdParkStore,
+    read_park_records,
+    write_park_store,
+)
+
+
+def _park_info(name, state):
+    return {
+        "name": name,
+        "state": state,
+        "blended_rating": 4.5,
+        "rating": 4.6,
+        "popularity": 0.5,
+        "national_park": False,
+        "description": f"About {name}.",
+        "photos": [f"https://example.com/{name}.jpg"],
+        "local_photos": [],
+        "latitude": 1.0,
+        "longitude": 2.0,
+    }
+
+
+def test_parks_are_split_into_hot_records_and_a_cold_store(tmp_path):
+    park_info = {"b": _park_info("Park B", "UT"), "a": _park_info("Park A", "CA")}
+    write_park_store(park_info, data_dir=str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ["park_cold.jsonl", "park_hot.json"]
+
+    with open(tmp_path / "park_hot.json") as f:
+        records = read_park_records(json.load(f))
+    store = ColdParkStore(str(tmp_path / "park_cold.jsonl"))
+    # Indices follow the sorted place_ids, so they are stable for a given dataset.
+    assert [records[x].index for x in ("a", "b")] == [0, 1]
+    for place_id, info in park_info.items():
+        record = records[place_id]
+        for field in HOT_FIELDS:
+            assert getattr(record, field) == info[field]
+        cold_info = store.get(record)
+        assert cold_info == {k: v for k, v in info.items() if k not in HOT_FIELDS}
+
+
+def test_the_lookup_describes_parks_from_the_cold_store():
+    lookup = Lookup()
+    with open(os.path.join("data", "park_id_to_park_info.json")) as f:
+        park_info = json.load(f)
+    for place_id in lookup.all_park_ids()[:20]:
+        info = park_info[place_id]
+        details = lookup.lookup_park_details(place_id=place_id)
+        assert details["name"] == info["name"]
+        assert details["photos"] == info["photos"]
+        assert lookup.lookup_park_state(place_id=place_id) == info["state"]
+        assert lookup.lookup_park_blended_rating(place_id=place_id) == (
+            info["blended_rating"]
+        )
@@ -0,0 +1,294 @@
+import io
+import math
+from contextlib import redirect_stdout
+
+import pytest
+
+from lookup import Lookup
+from park_graph import haversine_km
+from path_finder import MAX_MUST_VISIT, DailyLimit, PathFinder
+
+
+@pytest.fixture(scope="module")
+def lookup():
+    return Lookup()
+
+
+def _parks_near(lookup, city_name, radius):
+    lat, lng = lookup.lookup_city_geocoordinates(city_name=city_name)
+    return [
+        park_id
+        for park_id in lookup.all_park_ids()
+        if haversine_km(
+            lat, lng, *map(float, lookup.lookup_park_geocoordinates(place_id=park_id))
+        )
+        < radius
+    ]
+
+
+def _must_visit_path(lookup, seed, **kwargs):
+    p = PathFinder(lookup=lookup, seed=seed)
+    with redirect_stdout(io.StringIO()):
+        p.generate_must_visit_path(**kwargs)
+    return p
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_must_visit_trips_visit_every_park_within_max_distance(lookup, seed):
+    city_name = lookup.all_city_names()[seed]
+    max_distance = 3000
+    # Two parks of a random trip from the city, so some trip is known to visit both.
+    trip = PathFinder(lookup=lookup, seed=seed)
+    with redirect_stdout(io.StringIO()):
+        trip.generate_path(starting_city=city_name, max_distance=max_distance)
+    parks = trip.path[1:-1]
+    assert len(parks) > 1
+    must_visit = [parks[seed % (len(parks) - 1)], parks[-1]]
+    p = _must_visit_path(
+        lookup,
+        seed,
+        starting_city=city_name,
+        must_visit=must_visit,
+        max_distance=max_distance,
+    )
+    assert p.path, p.error_msg
+    assert p.path[0] == lookup.lookup_city_id(city_name=city_name)
+    assert set(must_visit) <= set(p.path[1:-1])
+    assert len(p.distances) == len(p.path) - 1
+    assert sum(p.distances) <= max_distance + 1e-6
+    assert lookup.is_path(p.path)
+    assert p.return_path()["result"] == "ok"
+
+
+def test_must_visit_parks_out_of_reach_are_rejected(lookup):
+    city_name = lookup.all_city_names()[0]
+    far_parks = [
+        x
+        for x in lookup.all_park_ids()
+        if x not in _parks_near(lookup, city_name, radius=1000)
+    ]
+    with pytest.raises(ValueError):
+        _must_visit_path(
+            lookup,
+            0,
+            starting_city=city_name,
+            must_visit=far_parks[:1],
+            max_distance=500,
+        )
+
+
+def test_too_many_must_visit_parks_are_rejected(lookup):
+    with pytest.raises(ValueError):
+        _must_visit_path(
+            lookup,
+            0,
+            starting_city=lookup.all_city_names()[0],
+            must_visit=lookup.all_park_ids()[: MAX_MUST_VISIT + 1],
+            max_distance=100000,
+        )
+
+
+def test_replanned_must_visit_trips_keep_their_start_and_parks(lookup):
+    city_name = lookup.all_city_names()[1]
+    must_visit = _parks_near(lookup, city_name, radius=750)[:2]
+    trip = _must_visit_path(
+        lookup, 1, starting_city=city_name, must_visit=must_visit, max_distance=3000
+    )
+    assert trip.path
+    index = next(i for i, x in enumerate(trip.path[1:-1], 1) if x not in must_visit)
+    p = PathFinder(lookup=lookup, seed=2)
+    with redirect_stdout(io.StringIO()):
+        p.replan_path(
+            path=trip.path, index=index, max_distance=3000, must_visit=must_visit
+        )
+    assert p.path[:index] == trip.path[:index]
+    assert trip.path[index] not in p.path
+    assert set(must_visit) <= set(p.path)
+    assert sum(p.distances) <= 3000 + 1e-6
+
+
+def _daily_distances(lookup, p):
+    """
+    Split a road trip's hops into the distance driven each day, checking that each night is spent in the
+    nearest city of the park before it.
+    """
+    days = [0]
+    for i, (distance, city_id) in enumerate(zip(p.distances, p.overnight_stops[1:])):
+        if city_id is None:
+            days[-1] += distance
+            continue
+        park_id = p.path[i]
+        assert lookup.lookup_city_name(place_id=city_id) == lookup.nearest_city_name(
+            place_id=park_id
+        )
+        to_city = lookup.distance_to_nearest_city(place_id=park_id)
+        days[-1] += to_city
+        days.append(distance - to_city)
+    return days
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_daily_capped_trips_fit_in_their_days(lookup, seed):
+    city_name = lookup.all_city_names()[seed]
+    daily_limit = DailyLimit(max_daily_km=(300, 500, 800)[seed % 3], days=2 + seed % 5)
+    p = PathFinder(lookup=lookup, seed=seed)
+    with redirect_stdout(io.StringIO()):
+        p.generate_path(starting_city=city_name, daily_limit=daily_limit)
+    if not p.path:
+        pytest.skip(f"No trip from {city_name}.")
+    days = _daily_distances(lookup, p)
+    assert max(days) <= daily_limit.max_daily_km + 1e-6
+    assert p.days[0] == 1 and p.days == sorted(p.days)
+    assert p.return_path()["total_days"] == p.days[-1] == len(days)
+    assert len(days) <= daily_limit.days
+
+
+def test_the_daily_cap_changes_the_route(lookup):
+    # Cities whose trip starts with a long first hop. From the starting city there is nowhere to stop for the
+    # night, so a cap below that hop can't take it.
+    max_distance = 3000
+    trips = []
+    for seed, city_name in enumerate(lookup.all_city_names()):
+        p = PathFinder(lookup=lookup, seed=seed)
+        with redirect_stdout(io.StringIO()):
+            p.generate_path(starting_city=city_name, max_distance=max_distance)
+        if p.distances[0] > 250:
+            trips.append((seed, city_name, p))
+    assert len(trips) >= 5
+    num_overnight_stops = 0
+    for seed, city_name, trip in trips[:5]:
+        daily_limit = DailyLimit(max_daily_km=trip.distances[0] - 1, days=None)
+        p = PathFinder(lookup=lookup, seed=seed)
+        with redirect_stdout(io.StringIO()):
+            p.generate_path(
+                starting_city=city_name,
+                max_distance=max_distance,
+                daily_limit=daily_limit,
+            )
+        assert p.path, f"No capped trip from {city_name}."
+        assert p.path[1] != trip.path[1]
+        assert max(_daily_distances(lookup, p)) <= daily_limit.max_daily_km + 1e-6
+        assert sum(p.distances) <= max_distance + 1e-6
+        num_overnight_stops += sum(x is not None for x in p.overnight_stops)
+    assert num_overnight_stops
+
+
+def test_replanned_daily_capped_trips_fit_in_their_days(lookup):
+    city_name = lookup.all_city_names()[0]
+    daily_limit = DailyLimit(max_daily_km=500, days=6)
+    trip = PathFinder(lookup=lookup, seed=3)
+    with redirect_stdout(io.StringIO()):
+        trip.generate_path(starting_city=city_name, daily_limit=daily_limit)
+    assert len(trip.path) > 3
+    p = PathFinder(lookup=lookup, seed=4)
+    with redirect_stdout(io.StringIO()):
+        p.replan_path(path=trip.path, index=2, daily_limit=daily_limit)
+    assert p.path[:2] == trip.path[:2]
+    assert p.days[-1] <= daily_limit.days
+    assert sum(p.distances) <= daily_limit.days * daily_limit.max_daily_km + 1e-6
+
+
+def test_replanned_trips_must_end_within_the_budget(lookup):
+    trip = PathFinder(lookup=lookup, seed=0)
+    with redirect_stdout(io.StringIO()):
+        trip.generate_path(starting_city=lookup.all_city_names()[0], max_distance=4000)
+    assert len(trip.path) > 4
+    # Keep every park but the last, which ends the trip cheapest at the city nearest the last kept park.
+    index = len(trip.path) - 2
+    cheapest = sum(trip.distances[: index - 1]) + lookup.distance_to_nearest_city(
+        place_id=trip.path[index - 1]
+    )
+    p = PathFinder(lookup=lookup, seed=1)
+    with pytest.raises(ValueError, match="too little of the budget"):
+        p.replan_path(path=trip.path, index=index, max_distance=cheapest - 1)
+    # With a daily cap, the kept parks can't be driven to in the days either.
+    with pytest.raises(ValueError, match="can't be reached within max_daily_km"):
+        p.replan_path(
+            path=trip.path,
+            index=index,
+            daily_limit=DailyLimit(max_daily_km=cheapest - 1, days=1),
+        )
+    with redirect_stdout(io.StringIO()):
+        p.replan_path(path=trip.path, index=index, max_distance=cheapest + 1)
+    assert p.path[:index] == trip.path[:index]
+    assert sum(p.distances) <= cheapest + 1
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_trips_end_in_the_chosen_end_city(lookup, seed):
+    city_names = lookup.all_city_names()
+    starting_city, end_city = city_names[seed], city_names[seed + 10]
+    end_city_id = lookup.lookup_city_id(city_name=end_city)
+    max_distance = 6000
+    p = PathFinder(lookup=lookup, seed=seed)
+    with redirect_stdout(io.StringIO()):
+        p.generate_path(
+            starting_city=starting_city, max_distance=max_distance, end_city=end_city
+        )
+    assert p.path, f"No trip from {starting_city} to {end_city}."
+    assert p.path[0] == lookup.lookup_city_id(city_name=starting_city)
+    assert p.path[-1] == end_city_id
+    assert p.distances[-1] == lookup.distances_to_city(city_id=end_city_id)[p.path[-2]]
+    assert sum(p.distances) <= max_distance + 1e-6
+    # After every hop, the end city must still be reachable within the rest of the budget.
+    end_city_distances = lookup.distances_to_city(city_id=end_city_id)
+    driven = 0
+    for park_id, distance in zip(p.path[1:-1], p.distances):
+        driven += distance
+        assert driven + end_city_distances[park_id] <= max_distance + 1e-6
+
+
+def test_end_cities_out_of_reach_give_no_trip(lookup):
+    city_names = lookup.all_city_names()
+    p = PathFinder(lookup=lookup, seed=0)
+    with redirect_stdout(io.StringIO()):
+        p.generate_path(
+            starting_city=city_names[0], max_distance=50, end_city=city_names[1]
+        )
+    assert p.path == []
+    assert p.return_path()["result"] != "ok"
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_iterated_trips_match_generated_trips(lookup, seed):
+    starting_city = lookup.all_city_names()[seed]
+    max_distance = 3000
+    p = PathFinder(lookup=lookup, seed=seed)
+    with redirect_stdout(io.StringIO()):
+        hops = list(p.iter_path(starting_city=starting_city, max_distance=max_distance))
+    trip = PathFinder(lookup=lookup, seed=seed)
+    with redirect_stdout(io.StringIO()):
+        trip.generate_path(starting_city=starting_city, max_distance=max_distance)
+    assert [x[0] for x in hops] == p.path == trip.path
+    assert [x[1] for x in hops[1:]] == p.distances == trip.distances
+    assert hops[0][3] and hops[-1][3]
+    assert not any(x[3] for x in hops[1:-1])
+    # The remaining budget goes down by each hop's distance.
+    for previous, hop in zip(hops, hops[1:]):
+        assert math.isclose(hop[2], previous[2] - hop[1])
+    assert math.isinf(hops[-1][5])
+
+
+@pytest.mark.parametrize("max_distance", [None, 1500])
+def test_time_budgeted_trips_fit_in_their_hours(lookup, max_distance):
+    max_hours = 20
+    for seed in range(5):
+        p = PathFinder(lookup=lookup, seed=seed)
+        with redirect_stdout(io.StringIO()):
+            p.generate_path(
+                starting_city=lookup.all_city_names()[seed],
+                max_distance=max_distance,
+                max_hours=max_hours,
+            )
+        assert p.path
+        response = p.return_path()
+        assert response["total_hours"] == sum(p.path_durations(path=p.path))
+        assert response["total_hours"] <= max_hours + 1e-6
+        if max_distance is not None:
+            assert sum(p.distances) <= max_distance + 1e-6
+
+
+def test_trips_need_a_distance_or_time_budget(lookup):
+    p = PathFinder(lookup=lookup, seed=0)
+    with pytest.raises(ValueError):
+        p.generate_path(starting_city=lookup.all_city_names()[0])
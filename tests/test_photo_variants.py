@@ -0,0 +1,70 @@
+import os
+
+from PIL import Image
+
+import api
+from photo_variants import VARIANT_WIDTHS, build_photo_variants
+
+
+def _write_photo(photos_dir, file_name, size, color):
+    letter_dir = photos_dir / file_name[0]
+    letter_dir.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", size, color).save(str(letter_dir / file_name), format="JPEG")
+
+
+def _build(tmp_path):
+    return build_photo_variants(
+        photos_dir=str(tmp_path / "photos"),
+        variants_dir=str(tmp_path / "variants"),
+        manifest_file=str(tmp_path / "photo_manifest.json"),
+    )
+
+
+def test_photos_are_rendered_into_each_variant(tmp_path):
+    _write_photo(tmp_path / "photos", "Arches_photo_0.jpg", (2000, 1000), "red")
+    _write_photo(tmp_path / "photos", "Zion_photo_0.jpg", (200, 400), "blue")
+    (tmp_path / "photos" / "Z" / "notes.jpg").write_bytes(b"not an image")
+    manifest = _build(tmp_path)
+    assert sorted(manifest) == ["Arches_photo_0.jpg", "Zion_photo_0.jpg"]
+
+    for entry in manifest.values():
+        for variant, width in VARIANT_WIDTHS.items():
+            with Image.open(str(tmp_path / "variants" / entry[variant])) as image:
+                assert image.width <= width
+    # Variants keep the aspect ratio, and small photos are never enlarged.
+    entry = manifest["Arches_photo_0.jpg"]
+    with Image.open(str(tmp_path / "variants" / entry["thumb"])) as image:
+        assert image.size == (VARIANT_WIDTHS["thumb"], VARIANT_WIDTHS["thumb"] // 2)
+    entry = manifest["Zion_photo_0.jpg"]
+    with Image.open(str(tmp_path / "variants" / entry["medium"])) as image:
+        assert image.size == (200, 400)
+
+
+def test_unchanged_photos_keep_their_variants(tmp_path, capsys):
+    _write_photo(tmp_path / "photos", "Arches_photo_0.jpg", (800, 600), "red")
+    manifest = _build(tmp_path)
+    assert _build(tmp_path) == manifest
+    assert "Rendered variants for 0 photos, 1 unchanged." in capsys.readouterr().out
+
+    # A changed photo gets new variant names, so cached copies are never stale.
+    _write_photo(tmp_path / "photos", "Arches_photo_0.jpg", (800, 600), "green")
+    changed = _build(tmp_path)["Arches_photo_0.jpg"]
+    for variant in VARIANT_WIDTHS:
+        assert changed[variant] != manifest["Arches_photo_0.jpg"][variant]
+
+
+def test_variants_are_served_with_a_long_cache_lifetime(tmp_path, monkeypatch):
+    _write_photo(tmp_path / "photos", "Arches_photo_0.jpg", (800, 600), "red")
+    name = _build(tmp_path)["Arches_photo_0.jpg"]["thumb"]
+    monkeypatch.setattr(api, "PHOTO_VARIANTS_DIR", str(tmp_path / "variants"))
+    client = api.app.test_client()
+
+    response = client.get(f"/photos/{name}")
+    assert response.status_code == 200
+    assert response.headers["Cache-Control"] == api.PHOTO_CACHE_CONTROL
+    with open(os.path.join(str(tmp_path / "variants"), name), "rb") as f:
+        assert response.data == f.read()
+    response.close()
+
+    assert client.get("/photos/photo_manifest.json").status_code == 404
+    assert client.get(f"/photos/{'0' * 20}.webp").status_code == 404
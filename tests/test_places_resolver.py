@@ -0,0 +1,90 @@
+import threading
+
+from googlemaps import exceptions
+
+from places_resolver import PlacesResolver, RateLimiter
+
+
+class FakePlaces:
+    def __init__(self, failures=None):
+        """
+        A stand-in for GPlaces.
+        :param failures: A dict of query to a list of exceptions to raise, one per call, before answering.
+        """
+        self._failures = failures or {}
+        self._lock = threading.Lock()
+        self.calls = []
+
+    def search_for_places(self, query, location_bias):
+        with self._lock:
+            self.calls.append(query)
+            failures = self._failures.get(query)
+            if failures:
+                raise failures.pop(0)
+        return {"candidates": [{"name": query, "bias": location_bias}]}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _resolver(g_places, sleeps, **kwargs):
+    return PlacesResolver(
+        g_places, queries_per_second=1e9, sleep=sleeps.append, **kwargs
+    )
+
+
+def test_each_distinct_query_is_sent_once_and_answers_keep_order():
+    places = FakePlaces()
+    responses = _resolver(places, []).resolve(["zion", "arches", "zion"])
+    assert sorted(places.calls) == ["arches", "zion"]
+    assert [x["candidates"][0]["name"] for x in responses] == ["zion", "arches", "zion"]
+
+
+def test_transient_errors_are_retried_with_backoff():
+    places = FakePlaces(
+        failures={
+            "zion": [exceptions.Timeout(), exceptions.ApiError("OVER_QUERY_LIMIT")]
+        }
+    )
+    sleeps = []
+    (response,) = _resolver(places, sleeps, backoff=1.0).resolve(["zion"])
+    assert response["candidates"][0]["name"] == "zion"
+    assert places.calls == ["zion"] * 3
+    assert sleeps == [1.0, 2.0]
+
+
+def test_retries_give_up_after_max_retries():
+    places = FakePlaces(failures={"zion": [exceptions.TransportError()] * 5})
+    sleeps = []
+    (response,) = _resolver(places, sleeps, max_retries=2).resolve(["zion"])
+    assert response is None
+    assert places.calls == ["zion"] * 3
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_not_retried():
+    places = FakePlaces(failures={"zion": [exceptions.ApiError("INVALID_REQUEST")]})
+    sleeps = []
+    responses = _resolver(places, sleeps).resolve(["zion", "arches"])
+    assert responses[0] is None
+    assert responses[1]["candidates"][0]["name"] == "arches"
+    assert places.calls.count("zion") == 1
+    assert sleeps == []
+
+
+def test_rate_limiter_spaces_out_requests():
+    clock = FakeClock()
+    limiter = RateLimiter(queries_per_second=4, clock=clock, sleep=clock.sleep)
+    for _ in range(3):
+        limiter.wait()
+    assert clock.sleeps == [0.25, 0.25]
@@ -0,0 +1,54 @@
+import json
+
+from region_shards import ShardRouter
+
+
+class FakeLookup:
+    def __init__(self, version="v1"):
+        self.version = version
+
+    def lookup_city_geocoordinates(self, city_name):
+        return 0.0, 0.0
+
+
+def _router(tmp_path, num_shards):
+    # Shard i only covers trips of up to i + 1 km from the city at (0, 0).
+    manifest = {
+        "version": "v1",
+        "shards": [
+            {"name": f"shard-{i}", "center": [0.0, 0.0], "radius": i + 1, "cities": []}
+            for i in range(num_shards)
+        ],
+    }
+    with open(tmp_path / "shards.json", "w") as fp:
+        json.dump(manifest, fp)
+    return ShardRouter(shards_dir=str(tmp_path))
+
+
+def _route(router, max_distance):
+    return router.route(FakeLookup(), starting_city="a", max_distance=max_distance)
+
+
+def test_routes_to_the_smallest_covering_shard(tmp_path):
+    router = _router(tmp_path, num_shards=3)
+    assert _route(router, 0.5) == "shard-0"
+    assert _route(router, 2.5) == "shard-2"
+    assert _route(router, 3.5) is None
+    assert _route(router, None) is None
+
+
+def test_shards_built_from_another_version_are_not_routed_to(tmp_path):
+    router = _router(tmp_path, num_shards=3)
+    lookup = FakeLookup(version="v2")
+    assert router.route(lookup, starting_city="a", max_distance=0.5) is None
+    # A region worker's own shard has a version of its own, so it is still covered.
+    assert router.covers("shard-1", lookup, starting_city="a", max_distance=1.5)
+
+
+def test_a_shard_covers_the_trips_within_its_radius(tmp_path):
+    router = _router(tmp_path, num_shards=3)
+    lookup = FakeLookup()
+    assert router.covers("shard-2", lookup, starting_city="a", max_distance=0.5)
+    assert not router.covers("shard-0", lookup, starting_city="a", max_distance=1.5)
+    assert not router.covers("shard-2", lookup, starting_city="a", max_distance=None)
+    assert router.stats() == {"version": "v1", "num_shards": 3}
@@ -0,0 +1,61 @@
+from search_cache import SearchCache, _estimate_size
+
+
+def test_get_returns_what_was_put():
+    cache = SearchCache()
+    assert cache.get("a") is None
+    cache.put("a", (1, 2))
+    assert cache.get("a") == (1, 2)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    entry_size = _estimate_size(("k", 0)) + _estimate_size((1.0, 2.0))
+    cache = SearchCache(max_bytes=3 * entry_size)
+    for key in range(3):
+        cache.put(("k", key), (1.0, 2.0))
+    # Reading the oldest entry makes the second one the least recently used.
+    assert cache.get(("k", 0)) is not None
+    cache.put(("k", 3), (1.0, 2.0))
+    assert cache.get(("k", 1)) is None
+    assert cache.get(("k", 0)) is not None
+    assert cache.get(("k", 3)) is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["memory_bytes"] <= stats["max_bytes"]
+
+
+def test_put_replaces_an_entry_without_counting_it_twice():
+    cache = SearchCache()
+    cache.put("a", (1,))
+    size = cache.stats()["memory_bytes"]
+    cache.put("a", (2,))
+    assert cache.get("a") == (2,)
+    assert cache.stats()["memory_bytes"] == size
+
+
+def test_clear_removes_every_entry():
+    cache = SearchCache()
+    cache.put("a", (1,))
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+    assert cache.stats()["memory_bytes"] == 0
+
+
+def test_the_size_of_nested_tuples_counts_every_level():
+    chain = None
+    sizes = []
+    for _ in range(10):
+        chain = (1.5, chain)
+        sizes.append(_estimate_size(chain))
+    step = sizes[1] - sizes[0]
+    assert step > 0
+    assert sizes[-1] == sizes[0] + 9 * step
+
+
+def test_put_uses_the_given_size():
+    cache = SearchCache()
+    cache.put("a", (1,), size=1000)
+    assert cache.stats()["memory_bytes"] == 1000
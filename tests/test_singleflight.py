@@ -0,0 +1,89 @@
+import threading
+
+import pytest
+
+from singleflight import SingleFlight
+
+
+def _run_concurrently(single_flight, key, fn, num_callers):
+    """
+    Start num_callers calls with the same key while the first one is still running.
+    :return: A list of (result or exception, shared) tuples.
+    """
+    results = []
+    lock = threading.Lock()
+
+    def call():
+        try:
+            result = single_flight.do(key, fn)
+        except Exception as e:
+            result = (e, None)
+        with lock:
+            results.append(result)
+
+    threads = [threading.Thread(target=call) for _ in range(num_callers)]
+    for thread in threads:
+        thread.start()
+    return threads, results
+
+
+def test_concurrent_calls_share_one_execution():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    executions = []
+
+    def slow():
+        executions.append(1)
+        started.set()
+        release.wait(5)
+        return "trip"
+
+    first = threading.Thread(target=single_flight.do, args=("key", slow))
+    first.start()
+    assert started.wait(5)
+    threads, results = _run_concurrently(single_flight, "key", slow, num_callers=3)
+    # Wait until the other callers are waiting on the running call.
+    while single_flight.stats()["coalesced"] < 3:
+        pass
+    release.set()
+    for thread in threads + [first]:
+        thread.join(5)
+    assert executions == [1]
+    assert results == [("trip", True)] * 3
+    assert single_flight.stats()["in_flight"] == 0
+
+
+def test_waiting_callers_get_the_same_exception():
+    single_flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+
+    def failing():
+        started.set()
+        release.wait(5)
+        raise ValueError("no trip")
+
+    errors = []
+
+    def first_call():
+        with pytest.raises(ValueError):
+            single_flight.do("key", failing)
+        errors.append("first")
+
+    first = threading.Thread(target=first_call)
+    first.start()
+    assert started.wait(5)
+    threads, results = _run_concurrently(single_flight, "key", failing, num_callers=2)
+    while single_flight.stats()["coalesced"] < 2:
+        pass
+    release.set()
+    for thread in threads + [first]:
+        thread.join(5)
+    assert errors == ["first"]
+    assert [type(x[0]) for x in results] == [ValueError, ValueError]
+
+
+def test_later_calls_run_again():
+    single_flight = SingleFlight()
+    calls = []
+    assert single_flight.do("key", lambda: calls.append(1) or len(calls)) == (1, False)
+    assert single_flight.do("key", lambda: calls.append(1) or len(calls)) == (2, False)